@@ -14,6 +14,9 @@ class ASTVisualizer(NodeVisitor):
     def __init__(self, parser):
         self.parser = parser
         self.ncount = 1
+        # DOT node number of every visited AST node; kept here rather
+        # than on the nodes, which may not take new attributes
+        self.nums = {}
         self.dot_header = [textwrap.dedent("""\
         digraph astgraph {
           node [shape=circle, fontsize=12, fontname="Courier", height=.1];
@@ -26,18 +29,21 @@ class ASTVisualizer(NodeVisitor):
     def visit_Program(self, node):
         s = '  node{} [label="Program"]\n'.format(self.ncount)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         self.visit(node.block)
 
-        s = '  node{} -> node{}\n'.format(node._num, node.block._num)
+        s = '  node{} -> node{}\n'.format(
+            self.nums[node],
+            self.nums[node.block]
+        )
         self.dot_body.append(s)
 
     def visit_Block(self, node):
         s = '  node{} [label="Block"]\n'.format(self.ncount)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         for declaration in node.declarations:
@@ -45,98 +51,119 @@ class ASTVisualizer(NodeVisitor):
         self.visit(node.compound_statement)
 
         for decl_node in node.declarations:
-            s = '  node{} -> node{}\n'.format(node._num, decl_node._num)
+            s = '  node{} -> node{}\n'.format(
+                self.nums[node],
+                self.nums[decl_node]
+            )
             self.dot_body.append(s)
 
         s = '  node{} -> node{}\n'.format(
-            node._num,
-            node.compound_statement._num
+            self.nums[node],
+            self.nums[node.compound_statement]
         )
         self.dot_body.append(s)
 
     def visit_VarDecl(self, node):
         s = '  node{} [label="VarDecl"]\n'.format(self.ncount)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         self.visit(node.var_node)
-        s = '  node{} -> node{}\n'.format(node._num, node.var_node._num)
+        s = '  node{} -> node{}\n'.format(
+            self.nums[node],
+            self.nums[node.var_node]
+        )
         self.dot_body.append(s)
 
         self.visit(node.type_node)
-        s = '  node{} -> node{}\n'.format(node._num, node.type_node._num)
+        s = '  node{} -> node{}\n'.format(
+            self.nums[node],
+            self.nums[node.type_node]
+        )
         self.dot_body.append(s)
 
     def visit_Type(self, node):
         s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
     def visit_Num(self, node):
         s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
     def visit_BinOp(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
+        s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         self.visit(node.left)
         self.visit(node.right)
 
         for child_node in (node.left, node.right):
-            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            s = '  node{} -> node{}\n'.format(
+                self.nums[node],
+                self.nums[child_node]
+            )
             self.dot_body.append(s)
 
     def visit_UnaryOp(self, node):
-        s = '  node{} [label="unary {}"]\n'.format(self.ncount, node.op.value)
+        s = '  node{} [label="unary {}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         self.visit(node.expr)
-        s = '  node{} -> node{}\n'.format(node._num, node.expr._num)
+        s = '  node{} -> node{}\n'.format(
+            self.nums[node],
+            self.nums[node.expr]
+        )
         self.dot_body.append(s)
 
     def visit_Compound(self, node):
         s = '  node{} [label="Compound"]\n'.format(self.ncount)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         for child in node.children:
             self.visit(child)
-            s = '  node{} -> node{}\n'.format(node._num, child._num)
+            s = '  node{} -> node{}\n'.format(
+                self.nums[node],
+                self.nums[child]
+            )
             self.dot_body.append(s)
 
     def visit_Assign(self, node):
-        s = '  node{} [label="{}"]\n'.format(self.ncount, node.op.value)
+        s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
         self.visit(node.left)
         self.visit(node.right)
 
         for child_node in (node.left, node.right):
-            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            s = '  node{} -> node{}\n'.format(
+                self.nums[node],
+                self.nums[child_node]
+            )
             self.dot_body.append(s)
 
     def visit_Var(self, node):
         s = '  node{} [label="{}"]\n'.format(self.ncount, node.value)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
     def visit_NoOp(self, node):
         s = '  node{} [label="NoOp"]\n'.format(self.ncount)
         self.dot_body.append(s)
-        node._num = self.ncount
+        self.nums[node] = self.ncount
         self.ncount += 1
 
     def gendot(self):
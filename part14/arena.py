@@ -0,0 +1,550 @@
+###############################################################################
+#  Flat AST arena.                                                            #
+#                                                                             #
+#  ArenaParser parses into an ASTArena: one row per node in parallel arrays  #
+#  (kind, position, three int operands), a flat array holding every child   #
+#  list as a range, and a pool of distinct names and literal values. No     #
+#  node objects exist until somebody walks the tree: the view classes here  #
+#  carry the spi node class names and fields, so NodeVisitor subclasses     #
+#  (SemanticAnalyzer, Interpreter, SourceToSourceCompiler) walk an arena    #
+#  unchanged, while counting and serialising work on the arrays directly.   #
+#                                                                             #
+###############################################################################
+import marshal
+from array import array
+from collections import Counter
+
+from spi import (
+    ID,
+    ASSIGN,
+    INTEGER_CONST,
+    REAL_CONST,
+    PLUS,
+    MINUS,
+    LPAREN,
+    RPAREN,
+    VAR,
+    PROCEDURE,
+    SEMI,
+    COMMA,
+    COLON,
+    BEGIN,
+    END,
+    DOT,
+    PROGRAM,
+    INTEGER,
+    REAL,
+    FIXED_TOKENS,
+    PUNCTUATION_TOKENS,
+    RESERVED_KEYWORDS,
+    INFIX_POWERS,
+    PREFIX_BINDING_POWER,
+    Token,
+    Parser,
+)
+
+
+# Node kinds. The operands a, b and c of each kind are:
+PROGRAM_NODE   = 0   # name (pool), block
+BLOCK          = 1   # children start, count: declarations then compound
+VAR_DECL       = 2   # var node, type node
+TYPE           = 3   # value (pool)
+PARAM          = 4   # var node, type node
+PROCEDURE_DECL = 5   # children start, count: params then block; name (pool)
+COMPOUND       = 6   # children start, count
+ASSIGN_NODE    = 7   # left, right
+BIN_OP         = 8   # left, right, operator token type
+UNARY_OP       = 9   # expr, operator token type (in c)
+NUM            = 10  # value (pool)
+VAR_NODE       = 11  # name (pool)
+NO_OP          = 12
+
+KIND_NAMES = (
+    'Program', 'Block', 'VarDecl', 'Type', 'Param', 'ProcedureDecl',
+    'Compound', 'Assign', 'BinOp', 'UnaryOp', 'Num', 'Var', 'NoOp',
+)
+
+
+class ASTArena(object):
+    """Parallel arrays holding every node of one tree.
+
+    Node i is (kinds[i], pos[i], a[i], b[i], c[i]); a pos of -1 means
+    unknown. Child lists are ranges of `children`. Names and literals are
+    indexes into `pool`, which holds each distinct value once.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.pos = array('q')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.children = array('i')
+        self.pool = []
+        self._pool_index = {}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, kind, pos, a=0, b=0, c=0):
+        """Append a node and return its index."""
+        self.kinds.append(kind)
+        self.pos.append(-1 if pos is None else pos)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.kinds) - 1
+
+    def intern(self, value):
+        """Return the pool index of `value`, adding it if new."""
+        # 1 == 1.0, so numbers are keyed with their type
+        key = value if type(value) is str else (type(value), value)
+        if self._pool_index is None:
+            self._pool_index = {
+                (v if type(v) is str else (type(v), v)): index
+                for index, v in enumerate(self.pool)
+            }
+        index = self._pool_index.get(key)
+        if index is None:
+            index = self._pool_index[key] = len(self.pool)
+            self.pool.append(value)
+        return index
+
+    def add_children(self, nodes):
+        """Store a child list; return its start in `children`."""
+        start = len(self.children)
+        self.children.extend(nodes)
+        return start
+
+    def kind_counts(self):
+        """Return a Counter of node class names."""
+        return Counter({
+            KIND_NAMES[kind]: count
+            for kind, count in Counter(self.kinds).items()
+        })
+
+    def view(self, index):
+        """Return the NodeVisitor-compatible view of node `index`."""
+        return VIEW_CLASSES[self.kinds[index]](self, index)
+
+    def tree(self):
+        """Return the view of the root node."""
+        return self.view(self.root)
+
+    def to_bytes(self):
+        return marshal.dumps((
+            self.kinds.tobytes(), self.pos.tobytes(), self.a.tobytes(),
+            self.b.tobytes(), self.c.tobytes(), self.children.tobytes(),
+            tuple(self.pool), self.root,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        arena = cls()
+        fields = marshal.loads(data)
+        for column, raw in zip(
+            (arena.kinds, arena.pos, arena.a, arena.b, arena.c,
+             arena.children),
+            fields,
+        ):
+            column.frombytes(raw)
+        arena.pool = list(fields[6])
+        arena._pool_index = None
+        arena.root = fields[7]
+        return arena
+
+
+###############################################################################
+#  Views                                                                      #
+###############################################################################
+class ArenaNode(object):
+    """A node of an ASTArena, seen through the fields of its spi class.
+
+    Views are created on access and hold nothing but the arena and the
+    node's index; two views of the same node compare and hash equal, so
+    they work as keys of side tables.
+    """
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ArenaNode) and
+            self.arena is other.arena and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __repr__(self):
+        return '<%s #%d>' % (type(self).__name__, self.index)
+
+    @property
+    def pos(self):
+        pos = self.arena.pos[self.index]
+        return None if pos < 0 else pos
+
+    def _children(self):
+        arena = self.arena
+        start = arena.a[self.index]
+        return [
+            arena.view(child)
+            for child in arena.children[start:start + arena.b[self.index]]
+        ]
+
+
+# Accessors shared by view classes with fields in the same columns. They
+# are put on each class rather than inherited, so that a view's MRO has
+# no other node class for NodeVisitor to dispatch on.
+def _view_a(self):
+    return self.arena.view(self.arena.a[self.index])
+
+
+def _view_b(self):
+    return self.arena.view(self.arena.b[self.index])
+
+
+def _operator(self):
+    return self.arena.c[self.index]
+
+
+def _operator_token(self):
+    return FIXED_TOKENS[self.op]
+
+
+class Program(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.arena.pool[self.arena.a[self.index]]
+
+    @property
+    def block(self):
+        return self.arena.view(self.arena.b[self.index])
+
+
+class Block(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def declarations(self):
+        return self._children()[:-1]
+
+    @property
+    def compound_statement(self):
+        arena = self.arena
+        end = arena.a[self.index] + arena.b[self.index]
+        return arena.view(arena.children[end - 1])
+
+
+class VarDecl(ArenaNode):
+    __slots__ = ()
+
+    var_node = property(_view_a)
+    type_node = property(_view_b)
+
+
+class Param(ArenaNode):
+    __slots__ = ()
+
+    var_node = property(_view_a)
+    type_node = property(_view_b)
+
+
+class Type(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return self.arena.pool[self.arena.a[self.index]]
+
+    @property
+    def token(self):
+        return RESERVED_KEYWORDS[self.value]
+
+
+class ProcedureDecl(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def proc_name(self):
+        return self.arena.pool[self.arena.c[self.index]]
+
+    @property
+    def params(self):
+        return self._children()[:-1]
+
+    @property
+    def block_node(self):
+        arena = self.arena
+        end = arena.a[self.index] + arena.b[self.index]
+        return arena.view(arena.children[end - 1])
+
+
+class Compound(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def children(self):
+        return self._children()
+
+
+class Assign(ArenaNode):
+    __slots__ = ()
+
+    op = ASSIGN
+    token = PUNCTUATION_TOKENS[':=']
+    left = property(_view_a)
+    right = property(_view_b)
+
+
+class BinOp(ArenaNode):
+    __slots__ = ()
+
+    op = property(_operator)
+    token = property(_operator_token)
+    left = property(_view_a)
+    right = property(_view_b)
+
+
+class UnaryOp(ArenaNode):
+    __slots__ = ()
+
+    op = property(_operator)
+    token = property(_operator_token)
+    expr = property(_view_a)
+
+
+class Num(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return self.arena.pool[self.arena.a[self.index]]
+
+    @property
+    def token(self):
+        if type(self.value) is int:
+            return Token(INTEGER_CONST, self.value)
+        return Token(REAL_CONST, self.value)
+
+
+class Var(ArenaNode):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return self.arena.pool[self.arena.a[self.index]]
+
+    @property
+    def token(self):
+        return Token(ID, self.value)
+
+
+class NoOp(ArenaNode):
+    __slots__ = ()
+
+
+VIEW_CLASSES = (
+    Program, Block, VarDecl, Type, Param, ProcedureDecl, Compound, Assign,
+    BinOp, UnaryOp, Num, Var, NoOp,
+)
+
+
+###############################################################################
+#  Parser                                                                     #
+###############################################################################
+class ArenaParser(Parser):
+    """Parser that appends nodes to an ASTArena instead of creating objects.
+
+    Same grammar, errors and positions as Parser; the grammar methods
+    return node indexes. parse() returns the root view, so the result
+    can go wherever a tree from Parser goes; its `arena` attribute gives
+    the arrays. Expressions are parsed by binding power, as in
+    PrattParser.
+    """
+    def __init__(self, lexer):
+        super(ArenaParser, self).__init__(lexer)
+        self.arena = ASTArena()
+
+    def program(self):
+        """program : PROGRAM variable SEMI block DOT"""
+        pos = self.lexer.token_start
+        self.eat(PROGRAM)
+        prog_name = self.current_token.value
+        self.eat(ID)
+        self.eat(SEMI)
+        block_node = self.block()
+        program_node = self.arena.add(
+            PROGRAM_NODE, pos, self.arena.intern(prog_name), block_node
+        )
+        self.eat(DOT)
+        return program_node
+
+    def block(self):
+        """block : declarations compound_statement"""
+        pos = self.lexer.token_start
+        declaration_nodes = self.declarations()
+        declaration_nodes.append(self.compound_statement())
+        return self.arena.add(
+            BLOCK, pos,
+            self.arena.add_children(declaration_nodes),
+            len(declaration_nodes),
+        )
+
+    def declarations(self):
+        """declarations : (VAR (variable_declaration SEMI)+)*
+                        | (PROCEDURE ID (LPAREN formal_parameter_list RPAREN)? SEMI block SEMI)*
+                        | empty
+        """
+        declarations = []
+
+        while True:
+            if self.current_token.type == VAR:
+                self.eat(VAR)
+                while self.current_token.type == ID:
+                    declarations.extend(self.variable_declaration())
+                    self.eat(SEMI)
+
+            elif self.current_token.type == PROCEDURE:
+                pos = self.lexer.token_start
+                self.eat(PROCEDURE)
+                proc_name = self.current_token.value
+                self.eat(ID)
+                params = self.procedure_parameters()
+                self.eat(SEMI)
+                params.append(self.block())
+                declarations.append(self.arena.add(
+                    PROCEDURE_DECL, pos,
+                    self.arena.add_children(params), len(params),
+                    self.arena.intern(proc_name),
+                ))
+                self.eat(SEMI)
+            else:
+                break
+
+        return declarations
+
+    def formal_parameters(self):
+        """ formal_parameters : ID (COMMA ID)* COLON type_spec """
+        return self._declare(PARAM)
+
+    def variable_declaration(self):
+        """variable_declaration : ID (COMMA ID)* COLON type_spec"""
+        return self._declare(VAR_DECL)
+
+    def _declare(self, kind):
+        var_nodes = [self.variable()]
+        while self.current_token.type == COMMA:
+            self.eat(COMMA)
+            var_nodes.append(self.variable())
+
+        self.eat(COLON)
+        type_node = self.type_spec()
+
+        arena = self.arena
+        return [
+            arena.add(kind, arena.pos[var_node], var_node, type_node)
+            for var_node in var_nodes
+        ]
+
+    def type_spec(self):
+        """type_spec : INTEGER
+                     | REAL
+        """
+        token = self.current_token
+        pos = self.lexer.token_start
+        if self.current_token.type == INTEGER:
+            self.eat(INTEGER)
+        else:
+            self.eat(REAL)
+        return self.arena.add(TYPE, pos, self.arena.intern(token.value))
+
+    def compound_statement(self):
+        """
+        compound_statement: BEGIN statement_list END
+        """
+        pos = self.lexer.token_start
+        self.eat(BEGIN)
+        nodes = self.statement_list()
+        self.eat(END)
+        return self.arena.add(
+            COMPOUND, pos, self.arena.add_children(nodes), len(nodes)
+        )
+
+    def assignment_statement(self):
+        """
+        assignment_statement : variable ASSIGN expr
+        """
+        left = self.variable()
+        self.eat(ASSIGN)
+        right = self.expr()
+        return self.arena.add(ASSIGN_NODE, self.arena.pos[left], left, right)
+
+    def variable(self):
+        """
+        variable : ID
+        """
+        token = self.current_token
+        pos = self.lexer.token_start
+        self.eat(ID)
+        return self.arena.add(VAR_NODE, pos, self.arena.intern(token.value))
+
+    def empty(self):
+        """An empty production"""
+        return self.arena.add(NO_OP, self.lexer.token_start)
+
+    def expr(self, min_power=0):
+        """
+        expr : prefix (infix expr)*
+
+        where the loop only takes operators that bind tighter than
+        `min_power`
+        """
+        arena = self.arena
+        token = self.current_token
+        type = token.type
+        get_next_token = self.lexer.get_next_token
+        if type == ID:
+            pos = self.lexer.token_start
+            self.current_token = get_next_token()
+            node = arena.add(VAR_NODE, pos, arena.intern(token.value))
+        elif type == INTEGER_CONST or type == REAL_CONST:
+            pos = self.lexer.token_start
+            self.current_token = get_next_token()
+            node = arena.add(NUM, pos, arena.intern(token.value))
+        elif type == LPAREN:
+            self.eat(LPAREN)
+            node = self.expr()
+            self.eat(RPAREN)
+        elif type == PLUS or type == MINUS:
+            pos = self.lexer.token_start
+            self.eat(type)
+            expr = self.expr(PREFIX_BINDING_POWER)
+            node = arena.add(UNARY_OP, pos, expr, 0, type)
+        else:
+            self.error()
+
+        powers = INFIX_POWERS
+        token = self.current_token
+        power = powers[token.type]
+        while power > min_power:
+            self.current_token = get_next_token()
+            right = self.expr(power)
+            node = arena.add(
+                BIN_OP, arena.pos[node], node, right, token.type
+            )
+            token = self.current_token
+            power = powers[token.type]
+        return node
+
+    def parse(self):
+        """Parse the program; return the root view of the arena."""
+        self.arena.root = super(ArenaParser, self).parse()
+        # the finished arena does not need the pool's reverse index
+        self.arena._pool_index = None
+        return self.arena.tree()
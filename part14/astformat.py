@@ -0,0 +1,359 @@
+###############################################################################
+#  Binary AST format.                                                         #
+#                                                                             #
+#  dump()/load() write and read trees of the spi node classes in a small,     #
+#  versioned binary format that does not depend on pickle or on the Python    #
+#  version:                                                                   #
+#                                                                             #
+#    header   MAGIC, format version (1 byte), pool size and record size       #
+#             (8 bytes each, little-endian)                                   #
+#    pool     every distinct name and literal once: a tag varint (0 str,      #
+#             1 int, 2 float) then a length varint and UTF-8 bytes, a         #
+#             zigzag varint, or an 8-byte double                              #
+#    records  the nodes in post-order, as varints: node kind, position        #
+#             (zigzag delta from the previous node's), then the kind's        #
+#             operands; children come before their parent, so a reader        #
+#             rebuilds the tree with one stack                                #
+#                                                                             #
+#  load_file() decodes straight from a memory-mapped file.                    #
+#                                                                             #
+###############################################################################
+import gc
+import mmap
+import struct
+
+from spi import (
+    ID,
+    ASSIGN as ASSIGN_TOKEN,
+    INTEGER_CONST,
+    REAL_CONST,
+    FIXED_TOKENS,
+    Token,
+    Program,
+    Block,
+    VarDecl,
+    Type,
+    Param,
+    ProcedureDecl,
+    Compound,
+    Assign,
+    BinOp,
+    UnaryOp,
+    Num,
+    Var,
+    NoOp,
+)
+
+
+MAGIC = b'SPIAST'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<6sBQQ')
+DOUBLE = struct.Struct('<d')
+
+# Pool entry tags
+STR   = 0
+INT   = 1
+FLOAT = 2
+
+# Node kinds, and the operands that follow the position:
+PROGRAM        = 0   # name
+BLOCK          = 1   # number of declarations
+VAR_DECL       = 2
+TYPE           = 3   # type token type
+PARAM          = 4
+PROCEDURE_DECL = 5   # number of params, name
+COMPOUND       = 6   # number of children
+ASSIGN         = 7
+BIN_OP         = 8   # operator token type
+UNARY_OP       = 9   # operator token type
+NUM            = 10  # value
+VAR            = 11  # name
+NO_OP          = 12
+# (names and values are pool indexes)
+
+
+def _encode_varints(values):
+    out = bytearray()
+    append = out.append
+    for value in values:
+        while value > 0x7f:
+            append(value & 0x7f | 0x80)
+            value >>= 7
+        append(value)
+    return out
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def dumps(tree):
+    """Return the binary form of `tree`."""
+    records = []
+    append = records.append
+    pool = []
+    pool_index = {}
+    last_pos = 0
+
+    def intern(value):
+        # 1 == 1.0, so the key includes the type
+        key = (type(value), value)
+        index = pool_index.get(key)
+        if index is None:
+            index = pool_index[key] = len(pool)
+            pool.append(value)
+        return index
+
+    # (node, visited): children are pushed on the first visit and the
+    # node is written on the second
+    stack = [(tree, False)]
+    while stack:
+        node, visited = stack.pop()
+        name = type(node).__name__
+        if not visited:
+            stack.append((node, True))
+            if name == 'BinOp' or name == 'Assign':
+                children = (node.left, node.right)
+            elif name == 'UnaryOp':
+                children = (node.expr,)
+            elif name == 'Compound':
+                children = node.children
+            elif name == 'VarDecl' or name == 'Param':
+                children = (node.var_node, node.type_node)
+            elif name == 'ProcedureDecl':
+                children = list(node.params) + [node.block_node]
+            elif name == 'Block':
+                children = (
+                    list(node.declarations) + [node.compound_statement]
+                )
+            elif name == 'Program':
+                children = (node.block,)
+            else:
+                children = ()
+            stack.extend((child, False) for child in reversed(children))
+            continue
+
+        if name == 'BinOp':
+            fields = (BIN_OP, node.op)
+        elif name == 'Var':
+            fields = (VAR, intern(node.value))
+        elif name == 'Num':
+            fields = (NUM, intern(node.value))
+        elif name == 'Assign':
+            fields = (ASSIGN,)
+        elif name == 'UnaryOp':
+            fields = (UNARY_OP, node.op)
+        elif name == 'NoOp':
+            fields = (NO_OP,)
+        elif name == 'Compound':
+            fields = (COMPOUND, len(node.children))
+        elif name == 'VarDecl':
+            fields = (VAR_DECL,)
+        elif name == 'Type':
+            fields = (TYPE, node.token.type)
+        elif name == 'Param':
+            fields = (PARAM,)
+        elif name == 'ProcedureDecl':
+            fields = (
+                PROCEDURE_DECL, len(node.params), intern(node.proc_name)
+            )
+        elif name == 'Block':
+            fields = (BLOCK, len(node.declarations))
+        elif name == 'Program':
+            fields = (PROGRAM, intern(node.name))
+        else:
+            raise Exception('Cannot serialize %s' % name)
+        # positions are stored plus one, so that None is 0
+        pos = 0 if node.pos is None else node.pos + 1
+        append(fields[0])
+        append(_zigzag(pos - last_pos))
+        last_pos = pos
+        records.extend(fields[1:])
+
+    pool_bytes = bytearray()
+    for value in pool:
+        if type(value) is str:
+            data = value.encode('utf-8')
+            pool_bytes += _encode_varints((STR, len(data)))
+            pool_bytes += data
+        elif type(value) is int:
+            pool_bytes += _encode_varints((INT, _zigzag(value)))
+        else:
+            pool_bytes += _encode_varints((FLOAT,))
+            pool_bytes += DOUBLE.pack(value)
+    record_bytes = _encode_varints(records)
+    return b''.join((
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(pool_bytes), len(record_bytes)),
+        pool_bytes,
+        record_bytes,
+    ))
+
+
+def dump(tree, f):
+    """Write the binary form of `tree` to the binary file `f`."""
+    f.write(dumps(tree))
+
+
+def _read_pool(data, i, end):
+    pool = []
+    while i < end:
+        tag = data[i]
+        i += 1
+        if tag == FLOAT:
+            pool.append(DOUBLE.unpack_from(data, i)[0])
+            i += DOUBLE.size
+            continue
+        value = shift = 0
+        while True:
+            byte = data[i]
+            i += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        if tag == STR:
+            pool.append(str(data[i:i + value], 'utf-8'))
+            i += value
+        elif tag == INT:
+            pool.append(_unzigzag(value))
+        else:
+            raise Exception('Unknown pool entry tag %r' % tag)
+    return pool
+
+
+def _read_varints(data):
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in data:
+        if byte < 0x80:
+            append(value | byte << shift)
+            value = shift = 0
+        else:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+    return values
+
+
+def _pop(stack, count):
+    if not count:
+        return []
+    items = stack[-count:]
+    del stack[-count:]
+    return items
+
+
+def _build(records, pool):
+    stack = []
+    pos = 0
+    i = 0
+    size = len(records)
+    while i < size:
+        kind = records[i]
+        delta = records[i + 1]
+        pos += delta >> 1 if not delta & 1 else -((delta + 1) >> 1)
+        i += 2
+        if kind == BIN_OP:
+            right = stack.pop()
+            node = BinOp(stack.pop(), FIXED_TOKENS[records[i]], right)
+            i += 1
+        elif kind == VAR:
+            node = Var(Token(ID, pool[records[i]]))
+            i += 1
+        elif kind == NUM:
+            value = pool[records[i]]
+            node = Num(Token(
+                INTEGER_CONST if type(value) is int else REAL_CONST, value
+            ))
+            i += 1
+        elif kind == ASSIGN:
+            right = stack.pop()
+            node = Assign(stack.pop(), FIXED_TOKENS[ASSIGN_TOKEN], right)
+        elif kind == UNARY_OP:
+            node = UnaryOp(FIXED_TOKENS[records[i]], stack.pop())
+            i += 1
+        elif kind == NO_OP:
+            node = NoOp()
+        elif kind == COMPOUND:
+            node = Compound()
+            node.children = _pop(stack, records[i])
+            i += 1
+        elif kind == VAR_DECL:
+            type_node = stack.pop()
+            node = VarDecl(stack.pop(), type_node)
+        elif kind == TYPE:
+            node = Type(FIXED_TOKENS[records[i]])
+            i += 1
+        elif kind == PARAM:
+            type_node = stack.pop()
+            node = Param(stack.pop(), type_node)
+        elif kind == PROCEDURE_DECL:
+            block_node = stack.pop()
+            params = _pop(stack, records[i])
+            node = ProcedureDecl(pool[records[i + 1]], params, block_node)
+            i += 2
+        elif kind == BLOCK:
+            compound_statement = stack.pop()
+            node = Block(_pop(stack, records[i]), compound_statement)
+            i += 1
+        elif kind == PROGRAM:
+            node = Program(pool[records[i]], stack.pop())
+            i += 1
+        else:
+            raise Exception('Unknown node kind %r' % kind)
+        node.pos = pos - 1 if pos else None
+        stack.append(node)
+    if len(stack) != 1:
+        raise Exception('Malformed serialized AST')
+    return stack[0]
+
+
+def loads(data):
+    """Rebuild a tree from its binary form.
+
+    `data` may be bytes or any buffer (bytearray, memoryview, mmap); it
+    is read in place, without copying it.
+    """
+    data = memoryview(data)
+    if len(data) < HEADER.size:
+        raise Exception('Not a serialized AST')
+    magic, version, pool_size, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise Exception('Not a serialized AST')
+    if version != FORMAT_VERSION:
+        raise Exception('Unsupported AST format version %d' % version)
+    pool_start = HEADER.size
+    record_start = pool_start + pool_size
+    if record_start + record_size > len(data):
+        raise Exception('Truncated serialized AST')
+    # the tree has no reference cycles; collecting while it is built
+    # would only cost time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        pool = _read_pool(data, pool_start, record_start)
+        records = _read_varints(
+            data[record_start:record_start + record_size]
+        )
+        return _build(records, pool)
+    finally:
+        if gc_enabled:
+            gc.enable()
+        data.release()
+
+
+def load(f):
+    """Read a tree from the binary file `f`."""
+    return loads(f.read())
+
+
+def load_file(fname):
+    """Read a tree from the file `fname`, decoding the mapped file in place."""
+    with open(fname, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            return loads(source)
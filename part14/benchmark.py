@@ -0,0 +1,886 @@
+###############################################################################
+#  Benchmarks for the Part 14 interpreter.                                    #
+#                                                                             #
+#  $ python benchmark.py lexer --sizes 1 10 100                               #
+#                                                                             #
+###############################################################################
+import argparse
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from spi import (
+    AST,
+    LEXERS,
+    PARSERS,
+    EOF_TOKEN,
+    FIXED_TOKENS,
+    GROUP_TYPES,
+    HashConsParser,
+    ID,
+    Interpreter,
+    LazyParser,
+    EOF,
+    ByteLexer,
+    Lexer,
+    MAX_KEYWORD_LENGTH,
+    Parser,
+    PUNCTUATION_TOKENS,
+    RESERVED_KEYWORDS,
+    RegexLexer,
+    SemanticAnalyzer,
+    SourceIndex,
+    SpanToken,
+    StreamLexer,
+    parse_bodies,
+    tokenize_all,
+    unicode_id_kind,
+)
+
+
+ENGINES = sorted(LEXERS) + ['bytes', 'numpy', 'stream']
+
+
+def make_lexer(name, text):
+    if name == 'stream':
+        return StreamLexer(io.StringIO(text))
+    if name == 'bytes':
+        return ByteLexer(text.encode('ascii'))
+    if name == 'numpy':
+        from nplexer import numpy_lexer
+        return numpy_lexer(text)
+    return LEXERS[name](text)
+
+
+PROCEDURE_TEMPLATE = """\
+   procedure Alpha{n}(a : integer; b : real);
+      var x{n}, y{n} : integer;
+      var z{n} : real;
+   begin {{ Alpha{n} }}
+      x{n} := a + 10 * (x{n} - y{n}) DIV 4;
+      z{n} := b / 3.14 + - x{n};
+      begin
+         y{n} := x{n} * 2
+      end
+   end;  {{ Alpha{n} }}
+
+"""
+
+
+def generate_source(size):
+    """Return a syntactically valid Pascal program of about `size` chars."""
+    head = 'program Main;\n   var x, y : integer;\n\n'
+    tail = 'begin { Main }\n   x := 1;\n   y := x + 2\nend.  { Main }\n'
+    parts = [head]
+    total = len(head) + len(tail)
+    n = 0
+    while total < size:
+        chunk = PROCEDURE_TEMPLATE.format(n=n)
+        parts.append(chunk)
+        total += len(chunk)
+        n += 1
+    parts.append(tail)
+    return ''.join(parts)
+
+
+def flat_expression(operands):
+    """Return (text, nodes) of a flat expression with `operands` leaves."""
+    ops = ['+', '*', '-', 'DIV', '/']
+    parts = ['x']
+    for i in range(1, operands):
+        parts.append(ops[i % len(ops)])
+        parts.append(str(i) if i % 2 else 'y')
+    return ' '.join(parts), 2 * operands - 1
+
+
+def nested_expression(depth):
+    """Return (text, nodes) of `depth` right-nested parentheses."""
+    return '(x + ' * depth + '1' + ')' * depth, 2 * depth + 1
+
+
+def expression_program(expression, statements):
+    """Return a program assigning `expression` `statements` times."""
+    body = ';\n'.join(['   x := ' + expression] * statements)
+    return (
+        'program Main;\n   var x, y : integer;\n'
+        'begin\n' + body + '\nend.\n'
+    )
+
+
+def iter_nodes(tree):
+    """Yield every node of `tree` once, without recursion.
+
+    A node reachable twice (the Type of `var x, y : integer`) is yielded
+    once.
+    """
+    seen = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        for cls in type(node).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                value = getattr(node, name)
+                if isinstance(value, (AST, list)):
+                    stack.append(value)
+
+
+def count_tokens(lexer):
+    count = 0
+    get_next_token = lexer.get_next_token
+    while get_next_token().type != EOF:
+        count += 1
+    return count
+
+
+def bench_lexer(args):
+    for size_mb in args.sizes:
+        text = generate_source(int(size_mb * 1024 * 1024))
+        for name in args.engines:
+            start = time.perf_counter()
+            ntokens = count_tokens(make_lexer(name, text))
+            elapsed = time.perf_counter() - start
+            print('%6.1f MB  %-8s %10d tokens  %8.2f s  %12.0f tokens/s' % (
+                size_mb, name, ntokens, elapsed, ntokens / elapsed
+            ))
+
+
+def bench_tokens(args):
+    text = generate_source(int(args.size * 1024 * 1024))
+    for name in args.engines:
+        tracemalloc.start()
+        if name == 'bulk':
+            # the columnar buffer itself is the token stream
+            tokens = tokenize_all(text)
+        else:
+            get_next_token = make_lexer(name, text).get_next_token
+            tokens = []
+            token = get_next_token()
+            while token.type != EOF:
+                tokens.append(token)
+                token = get_next_token()
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('%-8s %10d tokens  %8.1f MB per million tokens' % (
+            name, len(tokens), allocated / len(tokens)
+        ))
+
+
+def bench_parser(args):
+    text = generate_source(int(args.size * 1024 * 1024))
+    for name in args.engines:
+        start = time.perf_counter()
+        Parser(make_lexer(name, text)).parse()
+        elapsed = time.perf_counter() - start
+        print('%6.1f MB  %-8s %8.2f s  %8.2f MB/s' % (
+            args.size, name, elapsed, args.size / elapsed
+        ))
+
+
+def bench_expressions(args):
+    for label, (expression, nodes) in [
+        ('flat', flat_expression(args.operands)),
+        ('nested', nested_expression(args.depth)),
+    ]:
+        text = expression_program(expression, args.statements)
+        # lex once so that only parsing is timed
+        buffer = tokenize_all(text)
+        nodes *= args.statements
+        for name in args.parsers:
+            start = time.perf_counter()
+            PARSERS[name](buffer).parse()
+            elapsed = time.perf_counter() - start
+            print('%-7s %-10s %10d nodes  %8.2f s  %12.0f nodes/s' % (
+                label, name, nodes, elapsed, nodes / elapsed
+            ))
+
+
+def bench_ll1(args):
+    from ll1 import GRAMMAR, LL1Parser, build_tables
+    start = time.perf_counter()
+    build_tables(GRAMMAR)
+    print('tables built in %.3f s' % (time.perf_counter() - start))
+    inputs = [
+        ('program', generate_source(int(args.size * 1024 * 1024))),
+        ('flat', expression_program(
+            flat_expression(args.operands)[0], args.statements
+        )),
+        ('nested', expression_program(
+            nested_expression(args.depth)[0], args.statements
+        )),
+    ]
+    for label, text in inputs:
+        # lex once so that only parsing is timed
+        buffer = tokenize_all(text)
+        for parser_class in (Parser, LL1Parser):
+            start = time.perf_counter()
+            parser_class(buffer).parse()
+            elapsed = time.perf_counter() - start
+            print('%-8s %-10s %10d tokens  %8.2f s  %12.0f tokens/s' % (
+                label, parser_class.__name__, len(buffer), elapsed,
+                len(buffer) / elapsed
+            ))
+
+
+def bench_nodes(args):
+    # scale the generated program to about args.nodes nodes
+    sample = generate_source(100000)
+    per_char = sum(1 for _ in iter_nodes(Parser(tokenize_all(sample)).parse()))
+    text = generate_source(int(args.nodes / per_char * len(sample)))
+    # lex outside the trace so that only the tree is measured
+    buffer = tokenize_all(text)
+
+    tracemalloc.start()
+    tree = Parser(buffer).parse()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    counts = Counter()
+    examples = {}
+    for node in iter_nodes(tree):
+        name = type(node).__name__
+        counts[name] += 1
+        examples.setdefault(name, node)
+    nodes = sum(counts.values())
+    print('%10d nodes  %8.1f MB  %6.1f bytes per node' % (
+        nodes, allocated / 1e6, allocated / nodes
+    ))
+    for name, count in counts.most_common():
+        print('  %-14s %10d  %4d bytes each' % (
+            name, count, sys.getsizeof(examples[name])
+        ))
+
+
+def bench_arena(args):
+    from arena import ArenaParser
+    from astformat import dumps
+    sample = generate_source(100000)
+    per_char = sum(1 for _ in iter_nodes(Parser(tokenize_all(sample)).parse()))
+    text = generate_source(int(args.nodes / per_char * len(sample)))
+    buffer = tokenize_all(text)
+
+    for name, parser_class in [('objects', Parser), ('arena', ArenaParser)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        tree = parser_class(buffer).parse()
+        parse_time = time.perf_counter() - start
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        if name == 'arena':
+            counts = tree.arena.kind_counts()
+        else:
+            counts = Counter(type(node).__name__ for node in iter_nodes(tree))
+        count_time = time.perf_counter() - start
+        nodes = sum(counts.values())
+
+        start = time.perf_counter()
+        if name == 'arena':
+            data = tree.arena.to_bytes()
+        else:
+            data = dumps(tree)
+        dump_time = time.perf_counter() - start
+
+        print('%-8s %9d nodes  %6.1f bytes/node  parse %6.2f s  '
+              'count %6.3f s  serialise %6.3f s (%.1f MB)' % (
+                  name, nodes, allocated / nodes, parse_time, count_time,
+                  dump_time, len(data) / 1e6
+              ))
+
+
+def bench_sharing(args):
+    sources = [(fname, open(fname).read()) for fname in args.fnames]
+    if not sources:
+        sources = [('generated', generate_source(int(args.size * 1024 * 1024)))]
+    for fname, text in sources:
+        buffer = tokenize_all(text)
+        allocated = {}
+        for parser_class in (Parser, HashConsParser):
+            tracemalloc.start()
+            parser = parser_class(buffer)
+            tree = parser.parse()
+            allocated[parser_class], _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del tree
+        print('%s: %d expression nodes, %d unique, sharing ratio %.2f, '
+              'tree %.1f KB -> %.1f KB' % (
+                  fname, parser.expression_nodes, parser.unique_nodes,
+                  parser.expression_nodes / max(1, parser.unique_nodes),
+                  allocated[Parser] / 1024, allocated[HashConsParser] / 1024,
+              ))
+
+
+class UntrackedLexer(Lexer):
+    """Lexer without the token_start stores, to time them against."""
+
+    def get_next_token(self):
+        while self.current_char is not None:
+
+            if self.current_char.isspace():
+                self.skip_whitespace()
+                continue
+
+            if self.current_char == '{':
+                self.advance()
+                self.skip_comment()
+                continue
+
+            if self.current_char.isalpha():
+                return self._id()
+
+            if self.current_char.isdecimal():
+                return self.number()
+
+            if self.current_char == ':' and self.peek() == '=':
+                self.advance()
+                self.advance()
+                return PUNCTUATION_TOKENS[':=']
+
+            token = PUNCTUATION_TOKENS.get(self.current_char)
+            if token is not None:
+                self.advance()
+                return token
+
+            self.error()
+
+        return EOF_TOKEN
+
+
+class UntrackedRegexLexer(RegexLexer):
+    """RegexLexer that does not keep the last match for token_start, to
+    time it against."""
+
+    def _tokenize(self):
+        source = self.text
+        reserved = RESERVED_KEYWORDS
+        group_types = GROUP_TYPES
+        fixed = FIXED_TOKENS
+        for match in self._matches():
+            kind = match.lastgroup
+            if kind == 'SKIP':
+                continue
+            if kind == 'UNICODE_ID':
+                kind = unicode_id_kind(match)
+            if kind == 'ID':
+                start, end = match.span()
+                token = None
+                if end - start <= MAX_KEYWORD_LENGTH:
+                    token = reserved.get(match.group().upper())
+                if token is None:
+                    token = SpanToken(ID, source, start, end)
+                yield token
+            elif kind == 'INTEGER_CONST' or kind == 'REAL_CONST':
+                start, end = match.span()
+                yield SpanToken(group_types[kind], source, start, end)
+            elif kind == 'MISMATCH':
+                self.error()
+            else:
+                yield fixed[group_types[kind]]
+
+
+def bench_positions(args):
+    text = generate_source(int(args.size * 1024 * 1024))
+    for name, tracked, untracked in (
+        ('char', Lexer, UntrackedLexer),
+        ('regex', RegexLexer, UntrackedRegexLexer),
+    ):
+        # best of several runs: the difference is smaller than the noise
+        # between single runs
+        times = {}
+        for lexer_class in (untracked, tracked) * args.repeat:
+            start = time.perf_counter()
+            ntokens = count_tokens(lexer_class(text))
+            elapsed = time.perf_counter() - start
+            times[lexer_class] = min(times.get(lexer_class, elapsed), elapsed)
+        print('%6.1f MB  %-6s %10d tokens  untracked %.3f s  tracked %.3f s'
+              '  overhead %+.1f%%' % (
+                  args.size, name, ntokens, times[untracked], times[tracked],
+                  100 * (times[tracked] / times[untracked] - 1),
+              ))
+
+    start = time.perf_counter()
+    index = SourceIndex(text)
+    elapsed = time.perf_counter() - start
+    print('%6.1f MB  %8d lines  index built in %.3f s' % (
+        args.size, len(index.line_starts), elapsed
+    ))
+
+    offsets = range(0, len(text), max(1, len(text) // 100000))
+    start = time.perf_counter()
+    for offset in offsets:
+        index.line_column(offset)
+    elapsed = time.perf_counter() - start
+    print('%12.0f line/column lookups/s' % (len(offsets) / elapsed))
+
+
+def bench_lazy(args):
+    sources = [(fname, open(fname).read()) for fname in args.fnames]
+    if not sources:
+        sources = [('generated', generate_source(int(args.size * 1024 * 1024)))]
+    for fname, text in sources:
+        start = time.perf_counter()
+        Parser(RegexLexer(text)).parse()
+        eager = time.perf_counter() - start
+        start = time.perf_counter()
+        tree = LazyParser(text).parse()
+        lazy = time.perf_counter() - start
+        start = time.perf_counter()
+        bodies = parse_bodies(tree.block)
+        forced = time.perf_counter() - start
+        print('%s: %d procedures  eager %.3f s  lazy %.3f s  '
+              '(%.1fx)  forcing all bodies %.3f s' % (
+                  fname, bodies, eager, lazy, eager / lazy, forced
+              ))
+
+
+def bench_parallel(args):
+    from parallel import tokenize_parallel
+    text = generate_source(int(args.size * 1024 * 1024))
+    for workers in args.workers:
+        start = time.perf_counter()
+        buffer = tokenize_parallel(
+            text, workers=workers, min_chunk_size=args.min_chunk * 1024
+        )
+        elapsed = time.perf_counter() - start
+        print('%6.1f MB  %2d workers  %10d tokens  %8.2f s  %12.0f tokens/s' % (
+            args.size, workers, len(buffer), elapsed, len(buffer) / elapsed
+        ))
+
+
+def bench_reparse(args):
+    from incremental import apply_edit, reparse
+    text = generate_source(int(args.size * 1024 * 1024))
+    tree = Parser(RegexLexer(text)).parse()
+    procedures = text.count('procedure Alpha')
+    for fraction in (0.1, 0.5, 0.9):
+        # insert an operand into an assignment of a procedure body
+        needle = 'x%d := ' % int(procedures * fraction)
+        offset = text.index(needle) + len(needle)
+        new_text = apply_edit(text, offset, 0, '1 + ')
+        start = time.perf_counter()
+        Parser(RegexLexer(new_text)).parse()
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        tree, replaced = reparse(tree, text, offset, 0, '1 + ')
+        incremental = time.perf_counter() - start
+        text = new_text
+        print('edit at %3d%%  full parse %6.3f s  reparse %6.3f s (%s)' % (
+            fraction * 100, full, incremental,
+            type(replaced[0][0]).__name__,
+        ))
+
+
+def bench_format(args):
+    import os
+    import pickle
+    import tempfile
+    from astformat import dumps, loads, load_file
+    text = generate_source(int(args.size * 1024 * 1024))
+    tree = Parser(tokenize_all(text)).parse()
+    for name, dump, load in [
+        ('pickle', lambda tree: pickle.dumps(tree, pickle.HIGHEST_PROTOCOL),
+         pickle.loads),
+        ('astformat', dumps, loads),
+    ]:
+        start = time.perf_counter()
+        data = dump(tree)
+        dump_time = time.perf_counter() - start
+        start = time.perf_counter()
+        load(data)
+        load_time = time.perf_counter() - start
+        print('%-10s %8.1f MB  dump %6.2f s  load %6.2f s' % (
+            name, len(data) / 1e6, dump_time, load_time
+        ))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.ast')
+        with open(path, 'wb') as f:
+            f.write(data)
+        start = time.perf_counter()
+        load_file(path)
+        print('%-10s %8.1f MB  load %6.2f s' % (
+            'mmap', len(data) / 1e6, time.perf_counter() - start
+        ))
+
+
+VISITOR_PROCEDURE_TEMPLATE = """\
+   procedure Beta{n}(a : integer; b : real);
+      var x{n}, y{n} : integer;
+   begin
+      x{n} := a * (x{n} - y{n}) DIV y{n};
+      b := b / a + x{n}
+   end;
+
+"""
+
+VISITOR_STATEMENTS = """\
+   x := (x * y + y) DIV y - x;
+   z := y / x;
+   begin
+      y := x * y
+   end"""
+
+
+def visitor_program(size, literals=True):
+    """Return a program of about `size` chars for the visitor benchmark.
+
+    SourceToSourceCompiler has no visit_Num or visit_UnaryOp, so there
+    are no literals or unary operators, apart from two assignments
+    giving the variables values when `literals` is set. With those the
+    interpreter can run the program, and its values stay the same.
+    """
+    parts = ['program Main;\n   var x, y : integer;\n   var z : real;\n\n']
+    half = size // 2
+    n = 0
+    while n * len(VISITOR_PROCEDURE_TEMPLATE) < half:
+        parts.append(VISITOR_PROCEDURE_TEMPLATE.format(n=n))
+        n += 1
+    parts.append('begin\n')
+    if literals:
+        parts.append('   x := 1;\n   y := 2;\n')
+    count = max(1, half // len(VISITOR_STATEMENTS))
+    parts.append(';\n'.join([VISITOR_STATEMENTS] * count))
+    parts.append('\nend.\n')
+    return ''.join(parts)
+
+
+def getattr_visit(self, node):
+    # NodeVisitor.visit before the dispatch table
+    method_name = 'visit_' + type(node).__name__
+    visitor = getattr(self, method_name, self.generic_visit)
+    return visitor(node)
+
+
+def bench_visitors(args):
+    from src2srccompiler import SourceToSourceCompiler
+    size = int(args.size * 1024 * 1024)
+    tree = Parser(tokenize_all(visitor_program(size))).parse()
+    plain_tree = Parser(tokenize_all(
+        visitor_program(size, literals=False)
+    )).parse()
+    visitors = [
+        ('SemanticAnalyzer', SemanticAnalyzer, (), tree),
+        ('Interpreter', Interpreter, (tree,), tree),
+        ('SourceToSource', SourceToSourceCompiler, (), plain_tree),
+    ]
+    # the analyzer logs every symbol; the output is dropped
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [
+            bench_visitor(visitor_class, visitor_args, walked)
+            for _, visitor_class, visitor_args, walked in visitors
+        ]
+    for (name, _, _, _), result in zip(visitors, results):
+        visits, timings = result
+        for label, elapsed in timings:
+            print('%-16s %-8s %10d visits  %8.2f s  %12.0f visits/s' % (
+                name, label, visits, elapsed, visits / elapsed
+            ))
+
+
+def bench_visitor(visitor_class, visitor_args, tree):
+    """Return the number of visits of a walk of `tree` and the times of a
+    walk with getattr dispatch and with the dispatch table."""
+    calls = [0]
+
+    def counting_visit(self, node, visit=visitor_class.visit):
+        calls[0] += 1
+        return visit(self, node)
+
+    name = visitor_class.__name__
+    counting_class = type(name, (visitor_class,), {'visit': counting_visit})
+    counting_class(*visitor_args).visit(tree)
+    getattr_class = type(name, (visitor_class,), {'visit': getattr_visit})
+    timings = []
+    for label, cls in [('getattr', getattr_class), ('table', visitor_class)]:
+        visitor = cls(*visitor_args)
+        start = time.perf_counter()
+        visitor.visit(tree)
+        timings.append((label, time.perf_counter() - start))
+    return calls[0], timings
+
+
+def bench_engines(args):
+    from closures import ClosureInterpreter
+    from pybackend import PythonInterpreter
+    tree = Parser(tokenize_all(
+        visitor_program(int(args.size * 1024 * 1024))
+    )).parse()
+    statements = len(tree.block.compound_statement.children)
+    for name, engine in [
+        ('tree', Interpreter), ('closures', ClosureInterpreter),
+        ('python', PythonInterpreter),
+    ]:
+        interpreter = engine(tree)
+        if hasattr(interpreter, 'compile'):
+            start = time.perf_counter()
+            interpreter.compile()
+            print('%-9s compiled in %8.2f s' % (
+                name, time.perf_counter() - start
+            ))
+        for run in range(args.runs):
+            start = time.perf_counter()
+            interpreter.interpret()
+            elapsed = time.perf_counter() - start
+            print('%-9s run %d %10d statements  %8.3f s  %12.0f '
+                  'statements/s' % (
+                      name, run + 1, statements, elapsed,
+                      statements / elapsed
+                  ))
+
+
+def bench_procedures(args):
+    from parallel import parse_parallel
+    text = generate_source(int(args.size * 1024 * 1024))
+    start = time.perf_counter()
+    Parser(RegexLexer(text)).parse()
+    serial = time.perf_counter() - start
+    print('%6.1f MB  serial      %8.2f s' % (args.size, serial))
+    for workers in args.workers:
+        start = time.perf_counter()
+        parse_parallel(text, workers=workers)
+        elapsed = time.perf_counter() - start
+        print('%6.1f MB  %2d workers  %8.2f s  speedup %.2fx' % (
+            args.size, workers, elapsed, serial / elapsed
+        ))
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description='Benchmark the Part 14 interpreter.'
+    )
+    subparsers = argparser.add_subparsers(dest='command', required=True)
+
+    lexer_parser = subparsers.add_parser(
+        'lexer', help='tokens/sec for each lexer engine'
+    )
+    lexer_parser.add_argument(
+        '--sizes', nargs='+', type=float, default=[1, 10, 100],
+        help='source sizes in MB (default: 1 10 100)'
+    )
+    lexer_parser.add_argument(
+        '--engines', nargs='+', choices=ENGINES,
+        default=ENGINES,
+        help='lexer engines to compare (default: all)'
+    )
+    lexer_parser.set_defaults(func=bench_lexer)
+
+    tokens_parser = subparsers.add_parser(
+        'tokens', help='memory held by the materialised token stream'
+    )
+    tokens_parser.add_argument(
+        '--size', type=float, default=10,
+        help='source size in MB (default: 10)'
+    )
+    tokens_parser.add_argument(
+        '--engines', nargs='+', choices=ENGINES,
+        default=['regex'],
+        help='lexer engines to measure (default: regex)'
+    )
+    tokens_parser.set_defaults(func=bench_tokens)
+
+    parser_parser = subparsers.add_parser(
+        'parser', help='time to lex and parse a generated program'
+    )
+    parser_parser.add_argument(
+        '--size', type=float, default=10,
+        help='source size in MB (default: 10)'
+    )
+    parser_parser.add_argument(
+        '--engines', nargs='+', choices=ENGINES,
+        default=['regex'],
+        help='lexer engines feeding the parser (default: regex)'
+    )
+    parser_parser.set_defaults(func=bench_parser)
+
+    expressions_parser = subparsers.add_parser(
+        'expressions', help='expression nodes/sec for each parser engine'
+    )
+    expressions_parser.add_argument(
+        '--operands', type=int, default=1000,
+        help='operands in the flat expression (default: 1000)'
+    )
+    expressions_parser.add_argument(
+        '--depth', type=int, default=200,
+        help='parenthesis depth of the nested expression; the recursive '
+             'parser needs three frames per level (default: 200)'
+    )
+    expressions_parser.add_argument(
+        '--statements', type=int, default=200,
+        help='assignments of each expression (default: 200)'
+    )
+    expressions_parser.add_argument(
+        '--parsers', nargs='+', choices=sorted(PARSERS),
+        default=sorted(PARSERS),
+        help='parser engines to compare (default: all)'
+    )
+    expressions_parser.set_defaults(func=bench_expressions)
+
+    ll1_parser = subparsers.add_parser(
+        'll1', help='table-driven LL(1) parsing versus recursive descent'
+    )
+    ll1_parser.add_argument(
+        '--size', type=float, default=1,
+        help='size of the generated program in MB (default: 1)'
+    )
+    ll1_parser.add_argument(
+        '--operands', type=int, default=1000,
+        help='operands in the flat expression (default: 1000)'
+    )
+    ll1_parser.add_argument(
+        '--depth', type=int, default=200,
+        help='parenthesis depth of the nested expression (default: 200)'
+    )
+    ll1_parser.add_argument(
+        '--statements', type=int, default=200,
+        help='assignments of each expression (default: 200)'
+    )
+    ll1_parser.set_defaults(func=bench_ll1)
+
+    nodes_parser = subparsers.add_parser(
+        'nodes', help='memory held by the AST, in bytes per node'
+    )
+    nodes_parser.add_argument(
+        '--nodes', type=int, default=1000000,
+        help='approximate number of AST nodes (default: 1000000)'
+    )
+    nodes_parser.set_defaults(func=bench_nodes)
+
+    arena_parser = subparsers.add_parser(
+        'arena', help='node objects versus the flat AST arena'
+    )
+    arena_parser.add_argument(
+        '--nodes', type=int, default=1000000,
+        help='approximate number of AST nodes (default: 1000000)'
+    )
+    arena_parser.set_defaults(func=bench_arena)
+
+    sharing_parser = subparsers.add_parser(
+        'sharing', help='expression sharing achieved by HashConsParser'
+    )
+    sharing_parser.add_argument(
+        'fnames', nargs='*',
+        help='Pascal source files (default: a generated program)'
+    )
+    sharing_parser.add_argument(
+        '--size', type=float, default=1,
+        help='size of the generated program in MB (default: 1)'
+    )
+    sharing_parser.set_defaults(func=bench_sharing)
+
+    positions_parser = subparsers.add_parser(
+        'positions',
+        help='cost of position tracking when lexing, line index build '
+             'time and lookup speed'
+    )
+    positions_parser.add_argument(
+        '--size', type=float, default=10,
+        help='source size in MB (default: 10)'
+    )
+    positions_parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='lexing runs to take the best of (default: 5)'
+    )
+    positions_parser.set_defaults(func=bench_positions)
+
+    lazy_parser = subparsers.add_parser(
+        'lazy', help='parse time with procedure bodies left unparsed'
+    )
+    lazy_parser.add_argument(
+        'fnames', nargs='*',
+        help='Pascal source files (default: a generated program)'
+    )
+    lazy_parser.add_argument(
+        '--size', type=float, default=1,
+        help='size of the generated program in MB (default: 1)'
+    )
+    lazy_parser.set_defaults(func=bench_lazy)
+
+    parallel_parser = subparsers.add_parser(
+        'parallel', help='multi-process lexing speed by worker count'
+    )
+    parallel_parser.add_argument(
+        '--size', type=float, default=100,
+        help='source size in MB (default: 100)'
+    )
+    parallel_parser.add_argument(
+        '--workers', nargs='+', type=int, default=[1, 2, 4, 8],
+        help='worker counts to compare (default: 1 2 4 8)'
+    )
+    parallel_parser.add_argument(
+        '--min-chunk', type=int, default=1024,
+        help='smallest chunk worth a worker, in KB (default: 1024)'
+    )
+    parallel_parser.set_defaults(func=bench_parallel)
+
+    reparse_parser = subparsers.add_parser(
+        'reparse', help='incremental reparse versus a full parse'
+    )
+    reparse_parser.add_argument(
+        '--size', type=float, default=2,
+        help='source size in MB (default: 2)'
+    )
+    reparse_parser.set_defaults(func=bench_reparse)
+
+    format_parser = subparsers.add_parser(
+        'format', help='binary AST format versus pickle'
+    )
+    format_parser.add_argument(
+        '--size', type=float, default=5,
+        help='source size in MB (default: 5)'
+    )
+    format_parser.set_defaults(func=bench_format)
+
+    procedures_parser = subparsers.add_parser(
+        'procedures',
+        help='parsing speed with procedure bodies spread over processes'
+    )
+    procedures_parser.add_argument(
+        '--size', type=float, default=10,
+        help='source size in MB (default: 10)'
+    )
+    procedures_parser.add_argument(
+        '--workers', nargs='+', type=int, default=[2, 4, 8],
+        help='worker counts to compare (default: 2 4 8)'
+    )
+    procedures_parser.set_defaults(func=bench_procedures)
+
+    visitors_parser = subparsers.add_parser(
+        'visitors', help='visits/sec of each NodeVisitor subclass, with '
+                         'the dispatch table and with getattr dispatch'
+    )
+    visitors_parser.add_argument(
+        '--size', type=float, default=1,
+        help='size of the generated program in MB (default: 1)'
+    )
+    visitors_parser.set_defaults(func=bench_visitors)
+
+    engines_parser = subparsers.add_parser(
+        'engines', help='run time of the tree walker and the compiled '
+                        'execution engines'
+    )
+    engines_parser.add_argument(
+        '--size', type=float, default=2,
+        help='size of the generated program in MB (default: 2)'
+    )
+    engines_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='runs of each compiled program (default: 3)'
+    )
+    engines_parser.set_defaults(func=bench_engines)
+
+    args = argparser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
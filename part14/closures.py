@@ -0,0 +1,180 @@
+###############################################################################
+#  Closure-compiling interpreter.                                             #
+#                                                                             #
+#  ClosureCompiler turns the tree into nested Python closures once: each     #
+#  BinOp becomes a closure for its one operator, each variable reads or      #
+#  writes a fixed slot of a list, and declarations compile to nothing.       #
+#  ClosureInterpreter runs the program by calling the root closure, with     #
+#  none of the per-node dispatch and operator tests of the tree walker.      #
+#                                                                             #
+###############################################################################
+import gc
+from collections import OrderedDict
+
+from spi import (
+    PLUS,
+    MINUS,
+    MUL,
+    INTEGER_DIV,
+    FLOAT_DIV,
+    NodeVisitor,
+)
+
+
+def _nothing():
+    pass
+
+
+class ClosureCompiler(NodeVisitor):
+    """Compiles a tree into a closure that runs it.
+
+    Every variable name gets an index into `slots`, a list of values
+    shared by all the closures; names read before they are assigned
+    hold None, as in Interpreter. `assigned` maps the names assigned to
+    their slots, in the order of their first assignment in the source.
+    The language has no branches, loops or calls, so that is also the
+    order in which they are first assigned at run time.
+
+    Procedure bodies are never run by Interpreter and are not compiled.
+    """
+
+    def __init__(self):
+        self.slots = []
+        self.slot_index = {}
+        self.assigned = {}
+
+    def slot(self, name):
+        index = self.slot_index.get(name)
+        if index is None:
+            index = self.slot_index[name] = len(self.slots)
+            self.slots.append(None)
+        return index
+
+    def visit_Program(self, node):
+        return self.visit(node.block)
+
+    def visit_Block(self, node):
+        # declarations do nothing at run time
+        return self.visit(node.compound_statement)
+
+    def visit_Compound(self, node):
+        statements = tuple(
+            statement for statement in map(self.visit, node.children)
+            if statement is not _nothing
+        )
+        if not statements:
+            return _nothing
+        if len(statements) == 1:
+            return statements[0]
+
+        def compound():
+            for statement in statements:
+                statement()
+        return compound
+
+    def visit_NoOp(self, node):
+        return _nothing
+
+    def visit_Assign(self, node):
+        name = node.left.value
+        index = self.slot(name)
+        value = self.visit(node.right)
+        self.assigned.setdefault(name, index)
+        slots = self.slots
+
+        def assign():
+            slots[index] = value()
+        return assign
+
+    def visit_Var(self, node):
+        index = self.slot(node.value)
+        slots = self.slots
+
+        def var():
+            return slots[index]
+        return var
+
+    def visit_Num(self, node):
+        value = node.value
+
+        def num():
+            return value
+        return num
+
+    def visit_UnaryOp(self, node):
+        expr = self.visit(node.expr)
+        if node.op == PLUS:
+            def positive():
+                return +expr()
+            return positive
+        elif node.op == MINUS:
+            def negative():
+                return -expr()
+            return negative
+        raise Exception('Unknown unary operator %r' % node.token)
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        op = node.op
+        if op == PLUS:
+            def add():
+                return left() + right()
+            return add
+        elif op == MINUS:
+            def sub():
+                return left() - right()
+            return sub
+        elif op == MUL:
+            def mul():
+                return left() * right()
+            return mul
+        elif op == INTEGER_DIV:
+            def integer_div():
+                return left() // right()
+            return integer_div
+        elif op == FLOAT_DIV:
+            def float_div():
+                return float(left()) / float(right())
+            return float_div
+        raise Exception('Unknown binary operator %r' % node.token)
+
+
+class ClosureInterpreter(object):
+    """Runs a tree like Interpreter, from closures compiled once.
+
+    The tree is compiled on the first interpret(). GLOBAL_MEMORY holds
+    the same names and values, in the same order, as Interpreter's once
+    the program has run.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.GLOBAL_MEMORY = OrderedDict()
+        self.compiler = None
+        self.program = None
+
+    def compile(self):
+        # every closure is a new tracked object; collecting while they
+        # are made would scan the whole tree again and again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.compiler = ClosureCompiler()
+            self.program = self.compiler.visit(self.tree)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def interpret(self):
+        if self.tree is None:
+            return ''
+        if self.program is None:
+            self.compile()
+        slots = self.compiler.slots
+        slots[:] = [None] * len(slots)
+        self.program()
+        self.GLOBAL_MEMORY = OrderedDict(
+            (name, slots[index])
+            for name, index in self.compiler.assigned.items()
+        )
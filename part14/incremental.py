@@ -0,0 +1,281 @@
+###############################################################################
+#  Incremental re-lexing and re-parsing for editors.                          #
+#                                                                             #
+#  After a text edit only the tokens around the edit are lexed again; the    #
+#  rest of the previous TokenBuffer is reused, shifted by the size change.   #
+#  Likewise reparse() parses again only the innermost procedure declaration  #
+#  or compound statement around the edit and keeps the rest of the tree.     #
+#                                                                             #
+###############################################################################
+from array import array
+from bisect import bisect_left
+
+from spi import (
+    ID,
+    EOF,
+    GROUP_TYPES,
+    KEYWORD_TYPES,
+    TOKEN_REGEX,
+    AST,
+    Block,
+    Compound,
+    LazyBlock,
+    Parser,
+    ProcedureDecl,
+    RegexLexer,
+    TokenBuffer,
+    describe_position,
+    skim_block,
+    unicode_id_kind,
+)
+
+
+def apply_edit(text, offset, removed, inserted):
+    """Return `text` with `removed` chars at `offset` replaced by `inserted`."""
+    return text[:offset] + inserted + text[offset + removed:]
+
+
+def relex(buffer, offset, removed, inserted):
+    """Re-lex `buffer` after replacing text[offset:offset + removed].
+
+    Lexing restarts at the last token that begins before the edit (a
+    token ending right at the edit may merge with the inserted text) and
+    stops as soon as a new token starts where a token of the old stream
+    started, shifted by the size change, past the edited text. From a
+    token boundary the lexer has no other state, so everything after that
+    point is unchanged.
+
+    Returns (new_buffer, (first, old_stop, new_stop)): old tokens
+    [first, old_stop) were replaced by new tokens [first, new_stop).
+    """
+    text = apply_edit(buffer.text, offset, removed, inserted)
+    delta = len(inserted) - removed
+    edit_end = offset + len(inserted)
+    old_starts = buffer.starts
+
+    first = bisect_left(old_starts, offset) - 1
+    if first < 0:
+        first = restart = 0
+    else:
+        restart = old_starts[first]
+
+    types = array('i')
+    starts = array('q')
+    lengths = array('i')
+    group_types = GROUP_TYPES
+    keyword_types = KEYWORD_TYPES
+    old_stop = len(old_starts) - 1  # resynchronise on EOF at the latest
+
+    for match in TOKEN_REGEX.finditer(text, restart):
+        kind = match.lastgroup
+        if kind == 'SKIP':
+            continue
+        if kind == 'UNICODE_ID':
+            kind = unicode_id_kind(match)
+        start, end = match.span()
+        if start >= edit_end:
+            old_index = bisect_left(old_starts, start - delta)
+            if (
+                old_index < len(old_starts) and
+                old_starts[old_index] == start - delta
+            ):
+                old_stop = old_index
+                break
+        if kind == 'MISMATCH':
+            raise Exception('Invalid character at %s' % describe_position(
+                TokenBuffer(text), start
+            ))
+        if kind == 'ID':
+            types.append(keyword_types.get(text[start:end].upper(), ID))
+        else:
+            types.append(group_types[kind])
+        starts.append(start)
+        lengths.append(end - start)
+
+    new_buffer = TokenBuffer(text)
+    new_buffer.types = buffer.types[:first] + types + buffer.types[old_stop:]
+    new_buffer.lengths = (
+        buffer.lengths[:first] + lengths + buffer.lengths[old_stop:]
+    )
+    new_buffer.starts = buffer.starts[:first] + starts
+    new_buffer.starts.extend(map(delta.__add__, buffer.starts[old_stop:]))
+    return new_buffer, (first, old_stop, first + len(types))
+
+
+# Reparsing. A unit is a subtree that can be parsed on its own: a
+# ProcedureDecl or a Compound. Units are described by
+# (owner, index, node, start, end): the node is owner.declarations[index]
+# or owner.children[index], or owner.compound_statement if index is None,
+# and spans text[start:end].
+
+def _unit_end(node, text):
+    """Return the offset just past `node` in `text`, or None."""
+    if isinstance(node, ProcedureDecl):
+        block_node = node._block_node
+        if type(block_node) is LazyBlock:
+            return block_node.end
+        start = block_node.pos
+    else:
+        start = node.pos
+    return skim_block(text, start)
+
+
+def _last_before(nodes, offset):
+    """Return the index of the last of `nodes` that starts before
+    `offset`, or -1. Nodes are in source order."""
+    lo, hi = 0, len(nodes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if nodes[mid].pos < offset:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo - 1
+
+
+def _find_units(tree, text, offset, edit_end):
+    """Return the units around text[offset:edit_end], outermost first.
+
+    A unit qualifies only if the edit is strictly inside it, so that its
+    first and last tokens are untouched. Only the last node that starts
+    before the edit can contain it, so each level costs one search and
+    one skim over that node's text.
+    """
+    units = []
+    owner = tree.block
+    if owner.pos is None:
+        # no positions to go by
+        return units
+    while True:
+        if isinstance(owner, Block):
+            # the statement part, or else one of the procedures
+            index = None
+            node = owner.compound_statement
+            if node.pos >= offset:
+                index = _last_before(owner.declarations, offset)
+                if index < 0:
+                    return units
+                node = owner.declarations[index]
+                if not isinstance(node, ProcedureDecl):
+                    return units
+        else:
+            index = _last_before(owner.children, offset)
+            if index < 0:
+                return units
+            node = owner.children[index]
+            if not isinstance(node, Compound):
+                return units
+        if node.pos >= offset:
+            return units
+        end = _unit_end(node, text)
+        if end is None or edit_end >= end:
+            return units
+        units.append((owner, index, node, node.pos, end))
+        if isinstance(node, ProcedureDecl):
+            owner = node.block_node
+        else:
+            owner = node
+
+
+def _parse_unit(node, text, start, end):
+    """Parse text[start:end] as the same kind of unit as `node`."""
+    parser = Parser(RegexLexer(text, start, end))
+    if isinstance(node, ProcedureDecl):
+        new_node = parser.procedure_declaration()
+    else:
+        new_node = parser.compound_statement()
+    if parser.current_token.type != EOF:
+        parser.error()
+    return new_node
+
+
+def _replace(owner, index, new_node):
+    if index is None:
+        owner.compound_statement = new_node
+    elif isinstance(owner, Block):
+        owner.declarations[index] = new_node
+    else:
+        owner.children[index] = new_node
+
+
+def _following(owner, index):
+    """Return the nodes of `owner` that come after the unit at `index`."""
+    if index is None:
+        return []
+    if isinstance(owner, Block):
+        return owner.declarations[index + 1:] + [owner.compound_statement]
+    return owner.children[index + 1:]
+
+
+_slot_names = {}
+
+
+def shift_positions(nodes, delta, text):
+    """Add `delta` to the position of every node under `nodes`.
+
+    Lazy procedure bodies are moved too, and made to refer to `text`.
+    Shared subtrees are shifted once.
+    """
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if node.pos is not None:
+            node.pos += delta
+        cls = type(node)
+        names = _slot_names.get(cls)
+        if names is None:
+            names = _slot_names[cls] = tuple(
+                name for klass in cls.__mro__
+                for name in getattr(klass, '__slots__', ())
+                if name != 'pos'
+            )
+        for name in names:
+            value = getattr(node, name)
+            if isinstance(value, AST):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif type(value) is LazyBlock:
+                setattr(node, name, LazyBlock(
+                    text, value.start + delta, value.end + delta
+                ))
+
+
+def reparse(tree, text, offset, removed, inserted):
+    """Update `tree`, parsed from `text`, for an edit of the text.
+
+    The edit replaces text[offset:offset + removed] with `inserted`.
+    The innermost procedure declaration or compound statement that
+    strictly contains the edit is parsed again from the new text and
+    swapped into the tree; if it no longer parses on its own (say the
+    edit removed its END), the next enclosing one is tried, and in the
+    end the whole program. Every other subtree is kept, with the
+    positions after the edit shifted by the size change.
+
+    The tree is updated in place. Returns (tree, replaced), where
+    replaced lists the (old node, new node) pairs swapped; a whole
+    program reparse returns a new tree and [(tree, new tree)]. Syntax
+    errors are raised like Parser raises them for the new text.
+    """
+    new_text = apply_edit(text, offset, removed, inserted)
+    delta = len(inserted) - removed
+    units = _find_units(tree, text, offset, offset + removed)
+
+    for level in range(len(units) - 1, -1, -1):
+        owner, index, node, start, end = units[level]
+        try:
+            new_node = _parse_unit(node, new_text, start, end + delta)
+        except Exception:
+            continue
+        _replace(owner, index, new_node)
+        if delta:
+            for owner, index, _, _, _ in units[level::-1]:
+                shift_positions(_following(owner, index), delta, new_text)
+        return tree, [(node, new_node)]
+
+    new_tree = Parser(RegexLexer(new_text)).parse()
+    return new_tree, [(tree, new_tree)]
@@ -0,0 +1,498 @@
+###############################################################################
+#  Table-driven LL(1) parser.                                                 #
+#                                                                             #
+#  GRAMMAR below is the grammar of Parser.parse(), left-factored and with    #
+#  tree-building actions (#name) between the symbols. build_tables()        #
+#  computes FIRST and FOLLOW sets and the LL(1) parse table and rejects a   #
+#  grammar with conflicts; the tables are written to a generated module,    #
+#  ll1_tables.py, and only rebuilt when this file or spi's token codes    #
+#  change. LL1Parser drives the tables with an explicit stack of symbols    #
+#  and a stack of values, so a new rule is a table row rather than a new    #
+#  Python method.                                                           #
+#                                                                             #
+#  $ python ll1.py          (re)generate ll1_tables.py                      #
+#                                                                             #
+###############################################################################
+import hashlib
+import importlib.util
+import os
+import tempfile
+from sys import intern
+
+import spi
+from spi import (
+    TOKEN_TYPE_NAMES,
+    TOKEN_TYPES,
+    ID,
+    INTEGER_CONST,
+    REAL_CONST,
+    INTEGER,
+    REAL,
+    PLUS,
+    MINUS,
+    MUL,
+    INTEGER_DIV,
+    FLOAT_DIV,
+    EOF,
+    Parser,
+    Program,
+    Block,
+    VarDecl,
+    Type,
+    Param,
+    ProcedureDecl,
+    Compound,
+    Assign,
+    BinOp,
+    UnaryOp,
+    Num,
+    Var,
+    NoOp,
+)
+
+
+# Rules are 'name : symbols' with further alternatives on '|' lines; an
+# alternative with no symbols is the empty production. Upper-case names
+# are token types, '#name' runs LL1Parser.action_name on the value stack.
+#
+# Matching ID, a literal, a type name or an operator pushes the token on
+# the value stack; other tokens push nothing. #pos pushes the offset of
+# the current token, #list pushes a new list.
+GRAMMAR = """
+program                : #pos PROGRAM ID SEMI block DOT #program
+
+block                  : #pos #list declarations compound_statement #block
+
+declarations           : VAR variable_declarations declarations
+                       | procedure_declaration declarations
+                       |
+
+variable_declarations  : variable_declaration SEMI variable_declarations
+                       |
+
+variable_declaration   : #list variable #append variables COLON type_spec
+                         #variable_declaration
+
+procedure_declaration  : #pos PROCEDURE ID #list formal_parameters SEMI block
+                         SEMI #procedure_declaration
+
+formal_parameters      : LPAREN formal_parameter_list RPAREN
+                       |
+
+formal_parameter_list  : parameter_group parameter_groups
+                       |
+
+parameter_groups       : SEMI parameter_group parameter_groups
+                       |
+
+parameter_group        : #list variable #append variables COLON type_spec
+                         #parameter_group
+
+variables              : COMMA variable #append variables
+                       |
+
+type_spec              : #pos INTEGER #type
+                       | #pos REAL #type
+
+compound_statement     : #pos BEGIN #list statement #append statements END
+                         #compound
+
+statements             : SEMI statement #append statements
+                       |
+
+statement              : compound_statement
+                       | assignment_statement
+                       | #noop
+
+assignment_statement   : variable ASSIGN expr #assign
+
+expr                   : term expr_tail
+
+expr_tail              : PLUS term #binop expr_tail
+                       | MINUS term #binop expr_tail
+                       |
+
+term                   : factor term_tail
+
+term_tail              : MUL factor #binop term_tail
+                       | INTEGER_DIV factor #binop term_tail
+                       | FLOAT_DIV factor #binop term_tail
+                       |
+
+factor                 : #pos PLUS factor #unary
+                       | #pos MINUS factor #unary
+                       | #pos INTEGER_CONST #num
+                       | #pos REAL_CONST #num
+                       | LPAREN expr RPAREN
+                       | variable
+
+variable               : #pos ID #var
+"""
+
+# Tokens whose match pushes the token on the value stack
+VALUE_TOKENS = frozenset((
+    ID, INTEGER_CONST, REAL_CONST, INTEGER, REAL,
+    PLUS, MINUS, MUL, INTEGER_DIV, FLOAT_DIV,
+))
+
+# Symbol codes: token types are below NONTERMINAL_BASE, nonterminals from
+# there up to ACTION_BASE, and actions above.
+NONTERMINAL_BASE = 100
+ACTION_BASE = 1000
+
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'll1_tables.py')
+
+
+def read_grammar(text):
+    """Return [(rule name, [alternative symbol lists])] from `text`."""
+    rules = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('|'):
+            rules[-1][1].append(stripped[1:].split())
+        elif line[0].isspace():
+            # continues the alternative above
+            rules[-1][1][-1].extend(stripped.split())
+        else:
+            name, sep, body = stripped.partition(':')
+            if not sep:
+                raise Exception('Expected "name : symbols", got %r' % line)
+            rules.append((name.strip(), [body.split()]))
+    return rules
+
+
+def build_tables(text):
+    """Compute the LL(1) tables of the grammar in `text`.
+
+    Returns a dict with the nonterminal and action names, the
+    productions (each a tuple of symbol codes in the order they are
+    pushed, i.e. reversed) and the parse table: a flat list indexed by
+    nonterminal * number of token types + token type, holding a
+    production index or -1. Raises an exception if two productions of
+    a rule are predicted by the same token.
+    """
+    rules = read_grammar(text)
+    nonterminals = [name for name, _ in rules]
+    nonterminal_codes = {
+        name: NONTERMINAL_BASE + i for i, name in enumerate(nonterminals)
+    }
+    actions = []
+    action_codes = {}
+
+    def code(symbol):
+        if symbol.startswith('#'):
+            name = symbol[1:]
+            if name not in action_codes:
+                action_codes[name] = ACTION_BASE + len(actions)
+                actions.append(name)
+            return action_codes[name]
+        if symbol in TOKEN_TYPES:
+            return TOKEN_TYPES[symbol]
+        if symbol in nonterminal_codes:
+            return nonterminal_codes[symbol]
+        raise Exception('Unknown grammar symbol %r' % symbol)
+
+    alternatives = {
+        nonterminal_codes[name]: [[code(s) for s in alt] for alt in alts]
+        for name, alts in rules
+    }
+
+    # FIRST set of every nonterminal; None stands for the empty string
+    first = {nt: set() for nt in alternatives}
+
+    def first_of(symbols):
+        result = set()
+        for symbol in symbols:
+            if symbol >= ACTION_BASE:
+                continue
+            if symbol < NONTERMINAL_BASE:
+                result.add(symbol)
+                return result
+            result |= first[symbol] - {None}
+            if None not in first[symbol]:
+                return result
+        result.add(None)
+        return result
+
+    changed = True
+    while changed:
+        changed = False
+        for nt, alts in alternatives.items():
+            for alt in alts:
+                new = first_of(alt) - first[nt]
+                if new:
+                    first[nt] |= new
+                    changed = True
+
+    follow = {nt: set() for nt in alternatives}
+    follow[NONTERMINAL_BASE].add(EOF)
+    changed = True
+    while changed:
+        changed = False
+        for nt, alts in alternatives.items():
+            for alt in alts:
+                for i, symbol in enumerate(alt):
+                    if not NONTERMINAL_BASE <= symbol < ACTION_BASE:
+                        continue
+                    rest = first_of(alt[i + 1:])
+                    new = rest - {None}
+                    if None in rest:
+                        new |= follow[nt]
+                    new -= follow[symbol]
+                    if new:
+                        follow[symbol] |= new
+                        changed = True
+
+    token_count = len(TOKEN_TYPE_NAMES)
+    productions = []
+    table = [-1] * (len(nonterminals) * token_count)
+    for nt, alts in alternatives.items():
+        row = (nt - NONTERMINAL_BASE) * token_count
+        for alt in alts:
+            predict = first_of(alt)
+            if None in predict:
+                predict = (predict - {None}) | follow[nt]
+            index = len(productions)
+            productions.append(tuple(reversed(alt)))
+            for token_type in predict:
+                if table[row + token_type] != -1:
+                    raise Exception('LL(1) conflict in %s on %s' % (
+                        nonterminals[nt - NONTERMINAL_BASE],
+                        TOKEN_TYPE_NAMES[token_type],
+                    ))
+                table[row + token_type] = index
+
+    return {
+        'NONTERMINALS': tuple(nonterminals),
+        'ACTIONS': tuple(actions),
+        'PRODUCTIONS': tuple(productions),
+        'TABLE': tuple(table),
+    }
+
+
+def grammar_version():
+    """Hash of this module, which holds the grammar and the generator,
+    and of spi's token codes, which index the table."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    digest.update(repr([
+        (name, getattr(spi, name)) for name in spi.TOKEN_TYPE_NAMES
+    ]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_tables(tables, path=TABLES_PATH, version=None):
+    """Write `tables` as a Python module at `path`."""
+    lines = [
+        '# Generated by ll1.py from its GRAMMAR; do not edit.',
+        'VERSION = %r' % (version or grammar_version()),
+    ]
+    for name in ('NONTERMINALS', 'ACTIONS', 'PRODUCTIONS', 'TABLE'):
+        lines.append('%s = %r' % (name, tables[name]))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-',
+                                    suffix='.py')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _import_tables(path):
+    spec = importlib.util.spec_from_file_location('ll1_tables', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_tables = {}
+
+
+def load_tables(path=TABLES_PATH):
+    """Return the tables of GRAMMAR from the generated module at `path`.
+
+    The module is regenerated first if it is missing or was generated
+    from another version of this file. If it cannot be written, the
+    tables are built in memory.
+    """
+    if path in _tables:
+        return _tables[path]
+    version = grammar_version()
+    tables = None
+    try:
+        module = _import_tables(path)
+        if module.VERSION == version:
+            tables = vars(module)
+    except (OSError, SyntaxError, AttributeError):
+        pass
+    if tables is None:
+        tables = build_tables(GRAMMAR)
+        try:
+            write_tables(tables, path, version)
+        except OSError:
+            pass
+    _tables[path] = tables
+    return tables
+
+
+class LL1Parser(Parser):
+    """Parser driven by the LL(1) table of GRAMMAR.
+
+    Builds the same trees, and reports the same errors at the same
+    positions, as Parser. The symbol stack replaces the call stack, so
+    nesting depth is only limited by memory.
+    """
+    def __init__(self, lexer, tables=None):
+        super(LL1Parser, self).__init__(lexer)
+        if tables is None:
+            tables = load_tables()
+        token_count = len(TOKEN_TYPE_NAMES)
+        productions = tables['PRODUCTIONS']
+        # table row of every nonterminal, by symbol code
+        self.rows = {}
+        table = tables['TABLE']
+        for i in range(len(tables['NONTERMINALS'])):
+            self.rows[NONTERMINAL_BASE + i] = tuple(
+                None if index == -1 else productions[index]
+                for index in table[i * token_count:(i + 1) * token_count]
+            )
+        self.actions = {
+            ACTION_BASE + i: getattr(self, 'action_' + name)
+            for i, name in enumerate(tables['ACTIONS'])
+        }
+
+    def parse(self):
+        rows = self.rows
+        actions = self.actions
+        get_next_token = self.lexer.get_next_token
+        self.values = values = []
+        push_value = values.append
+        stack = [NONTERMINAL_BASE]
+        pop = stack.pop
+        extend = stack.extend
+        token = self.current_token
+
+        while stack:
+            symbol = pop()
+            if symbol < NONTERMINAL_BASE:
+                if token.type != symbol:
+                    self.error()
+                if symbol in VALUE_TOKENS:
+                    push_value(token)
+                self.current_token = token = get_next_token()
+            elif symbol < ACTION_BASE:
+                production = rows[symbol][token.type]
+                if production is None:
+                    self.error()
+                extend(production)
+            else:
+                actions[symbol]()
+
+        if token.type != EOF:
+            self.error()
+        return values.pop()
+
+    # Actions. Each replaces the values of the symbols before it in its
+    # production with the node they make up.
+
+    def action_pos(self):
+        self.values.append(self.lexer.token_start)
+
+    def action_list(self):
+        self.values.append([])
+
+    def action_append(self):
+        item = self.values.pop()
+        self.values[-1].append(item)
+
+    def action_program(self):
+        values = self.values
+        block = values.pop()
+        name = values.pop()
+        values[-1] = Program(intern(name.value), block, values[-1])
+
+    def action_block(self):
+        values = self.values
+        compound_statement = values.pop()
+        declarations = values.pop()
+        values[-1] = Block(declarations, compound_statement, values[-1])
+
+    def action_variable_declaration(self):
+        values = self.values
+        type_node = values.pop()
+        var_nodes = values.pop()
+        values[-1].extend(
+            VarDecl(var_node, type_node, var_node.pos) for var_node in var_nodes
+        )
+
+    def action_parameter_group(self):
+        values = self.values
+        type_node = values.pop()
+        var_nodes = values.pop()
+        values[-1].extend(
+            Param(var_node, type_node, var_node.pos) for var_node in var_nodes
+        )
+
+    def action_procedure_declaration(self):
+        values = self.values
+        block_node = values.pop()
+        params = values.pop()
+        name = values.pop()
+        pos = values.pop()
+        values[-1].append(ProcedureDecl(name.value, params, block_node, pos))
+
+    def action_type(self):
+        values = self.values
+        token = values.pop()
+        values[-1] = Type(token, values[-1])
+
+    def action_compound(self):
+        values = self.values
+        children = values.pop()
+        node = Compound(values[-1])
+        node.children = children
+        values[-1] = node
+
+    def action_noop(self):
+        self.values.append(NoOp(self.lexer.token_start))
+
+    def action_assign(self):
+        values = self.values
+        right = values.pop()
+        left = values[-1]
+        values[-1] = Assign(left, None, right, left.pos)
+
+    def action_binop(self):
+        values = self.values
+        right = values.pop()
+        op = values.pop()
+        left = values[-1]
+        values[-1] = BinOp(left, op, right, left.pos)
+
+    def action_unary(self):
+        values = self.values
+        expr = values.pop()
+        op = values.pop()
+        values[-1] = UnaryOp(op, expr, values[-1])
+
+    def action_num(self):
+        values = self.values
+        token = values.pop()
+        values[-1] = Num(token, values[-1])
+
+    def action_var(self):
+        values = self.values
+        token = values.pop()
+        values[-1] = Var(token, values[-1])
+
+
+if __name__ == '__main__':
+    write_tables(build_tables(GRAMMAR))
+    print('Wrote %s' % TABLES_PATH)
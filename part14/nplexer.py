@@ -0,0 +1,254 @@
+###############################################################################
+#  NumPy lexer backend.                                                       #
+#                                                                             #
+#  Classifies every character of an ASCII source at once as a uint8 array,   #
+#  finds token boundaries with array operations and only drops into Python   #
+#  for comments, real literals and keyword candidates. Produces the same     #
+#  tokens as spi.Lexer, as a TokenBuffer.                                    #
+#                                                                             #
+#  Without NumPy, or for non-ASCII input, it falls back to spi.tokenize_all. #
+#                                                                             #
+###############################################################################
+from array import array
+from bisect import bisect_left
+
+from spi import (
+    ID,
+    INTEGER_CONST,
+    REAL_CONST,
+    ASSIGN,
+    EOF,
+    MAX_KEYWORD_LENGTH,
+    PUNCTUATION_TOKENS,
+    RESERVED_KEYWORDS_BYTES,
+    TokenBuffer,
+    describe_position,
+    tokenize_all,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Character classes
+SPACE   = 0
+LETTER  = 1
+DIGIT   = 2
+PUNCT   = 3
+INVALID = 4
+
+if np is not None:
+    CLASS_TABLE = np.full(256, INVALID, dtype=np.uint8)
+    for code in range(128):
+        char = chr(code)
+        if char.isspace():
+            CLASS_TABLE[code] = SPACE
+        elif char.isalpha():
+            CLASS_TABLE[code] = LETTER
+        elif char.isdecimal():
+            CLASS_TABLE[code] = DIGIT
+        elif char in PUNCTUATION_TOKENS:
+            CLASS_TABLE[code] = PUNCT
+
+    PUNCT_TYPES = np.full(256, -1, dtype=np.int32)
+    for lexeme, token in PUNCTUATION_TOKENS.items():
+        if len(lexeme) == 1:
+            PUNCT_TYPES[ord(lexeme)] = token.type
+
+    # KEYWORD_SHAPES[length, first letter] is set if some keyword has that
+    # length and (upper case) first letter
+    KEYWORD_SHAPES = np.zeros((MAX_KEYWORD_LENGTH + 1, 256), dtype=bool)
+    for name in RESERVED_KEYWORDS_BYTES:
+        KEYWORD_SHAPES[len(name), name[0]] = True
+
+
+def _to_array(typecode, values):
+    result = array(typecode)
+    result.frombytes(values.astype('i%d' % result.itemsize).tobytes())
+    return result
+
+
+def _comment_spans(codes):
+    """Return (starts, ends, unterminated) of the {...} comments.
+
+    Comments do not nest, so each one runs from a '{' that is not inside
+    an earlier comment to the first '}' after it. `unterminated` is the
+    offset of a '{' that is never closed, or None.
+    """
+    opens = np.flatnonzero(codes == ord('{')).tolist()
+    if not opens:
+        return [], [], None
+    closes = np.flatnonzero(codes == ord('}')).tolist()
+    starts = []
+    ends = []
+    pos = 0
+    while True:
+        i = bisect_left(opens, pos)
+        if i == len(opens):
+            return starts, ends, None
+        start = opens[i]
+        j = bisect_left(closes, start)
+        if j == len(closes):
+            return starts, ends, start
+        starts.append(start)
+        ends.append(closes[j] + 1)
+        pos = closes[j] + 1
+
+
+def tokenize_all_numpy(text):
+    """Lex `text` (str, bytes or mmap) into a TokenBuffer using NumPy."""
+    if np is None:
+        return tokenize_all(_as_str(text))
+    if isinstance(text, str):
+        try:
+            data = text.encode('ascii')
+        except UnicodeEncodeError:
+            return tokenize_all(text)
+    else:
+        data = text
+    codes = np.frombuffer(data, dtype=np.uint8)
+    n = len(codes)
+    if n and codes.max() >= 128:
+        return tokenize_all(_as_str(text))
+
+    buffer = TokenBuffer(text)
+    classes = CLASS_TABLE[codes]
+
+    # comments are whitespace
+    starts, ends, unterminated = _comment_spans(codes)
+    if starts:
+        depth = np.zeros(n + 1, dtype=np.int32)
+        depth[starts] += 1
+        depth[ends] -= 1
+        classes[np.cumsum(depth[:n]) > 0] = SPACE
+
+    # '=' only exists as the second half of ':='
+    equals = np.flatnonzero((codes == ord('=')) & (classes != SPACE))
+    after_colon = (equals > 0) & (codes[equals - 1] == ord(':'))
+    classes[equals[after_colon]] = SPACE
+
+    invalid = np.flatnonzero(classes == INVALID).tolist()
+    if unterminated is not None:
+        invalid.append(unterminated)
+    if invalid:
+        raise Exception('Invalid character at %s' % describe_position(
+            buffer, min(invalid)
+        ))
+
+    # runs of letters and digits
+    alnum = (classes == LETTER) | (classes == DIGIT)
+    edges = np.diff(alnum.view(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    numeric = classes[run_starts] == DIGIT
+
+    # a number stops at the first letter of its run
+    letters = np.flatnonzero(classes == LETTER)
+    letters = np.append(letters, n)
+    first_letter = letters[np.searchsorted(letters, run_starts)]
+    prefix_ends = np.where(numeric, np.minimum(first_letter, run_ends),
+                           run_starts)
+
+    # an all-digit run followed by '.' is a real literal, and the digits of
+    # a run right after the '.' are its fraction
+    padded = np.append(codes, 0)
+    decimal = (
+        numeric & (prefix_ends == run_ends) &
+        (padded[run_ends] == ord('.')) &
+        (np.append(classes, SPACE)[run_ends] == PUNCT)
+    )
+    next_starts = np.append(run_starts[1:], -1)
+    next_numeric = np.append(numeric[1:], False)
+    has_fraction = decimal & (next_starts == run_ends + 1) & next_numeric
+
+    # a fraction run cannot start a real literal of its own: '1.2.3' is
+    # REAL DOT INTEGER. Chains like that are rare; resolve them in order.
+    absorbed = np.zeros(len(run_starts), dtype=bool)
+    for k in np.flatnonzero(decimal).tolist():
+        if absorbed[k]:
+            decimal[k] = False
+            has_fraction[k] = False
+        elif has_fraction[k]:
+            absorbed[k + 1] = True
+    classes[run_ends[decimal]] = SPACE
+
+    next_prefix_ends = np.append(prefix_ends[1:], 0)
+    number_ends = np.where(
+        decimal,
+        np.where(has_fraction, next_prefix_ends, run_ends + 1),
+        prefix_ends,
+    )
+
+    words = ~numeric
+    numbers = numeric & ~absorbed
+    remainders = numeric & (prefix_ends < run_ends)
+
+    punct = np.flatnonzero(classes == PUNCT)
+    punct_types = PUNCT_TYPES[codes[punct]]
+    punct_lengths = np.ones(len(punct), dtype=np.int64)
+    assign = (codes[punct] == ord(':')) & (padded[punct + 1] == ord('='))
+    punct_types[assign] = ASSIGN
+    punct_lengths[assign] = 2
+
+    token_starts = np.concatenate((
+        run_starts[words],
+        run_starts[numbers],
+        prefix_ends[remainders],
+        punct,
+    ))
+    token_lengths = np.concatenate((
+        run_ends[words] - run_starts[words],
+        number_ends[numbers] - run_starts[numbers],
+        run_ends[remainders] - prefix_ends[remainders],
+        punct_lengths,
+    ))
+    token_types = np.concatenate((
+        np.full(np.count_nonzero(words), ID, dtype=np.int32),
+        np.where(decimal[numbers], REAL_CONST, INTEGER_CONST)
+          .astype(np.int32),
+        np.full(np.count_nonzero(remainders), ID, dtype=np.int32),
+        punct_types,
+    ))
+
+    order = np.argsort(token_starts, kind='stable')
+    token_starts = token_starts[order]
+    token_lengths = token_lengths[order]
+    token_types = token_types[order]
+
+    # only identifiers shaped like a keyword need a dictionary lookup;
+    # clearing bit 0x20 upper-cases an ASCII letter
+    short = (token_types == ID) & (token_lengths <= MAX_KEYWORD_LENGTH)
+    first = codes[token_starts[short]] & 0xDF
+    candidates = np.flatnonzero(short)[
+        KEYWORD_SHAPES[token_lengths[short], first]
+    ]
+    reserved = RESERVED_KEYWORDS_BYTES
+    for i, start, length in zip(
+        candidates.tolist(),
+        token_starts[candidates].tolist(),
+        token_lengths[candidates].tolist(),
+    ):
+        token = reserved.get(data[start:start + length].upper())
+        if token is not None:
+            token_types[i] = token.type
+
+    buffer.types = _to_array('i', token_types)
+    buffer.starts = _to_array('q', token_starts)
+    buffer.lengths = _to_array('i', token_lengths)
+    buffer.types.append(EOF)
+    buffer.starts.append(n)
+    buffer.lengths.append(0)
+    return buffer
+
+
+def _as_str(text):
+    if isinstance(text, str):
+        return text
+    return str(text, 'utf-8')
+
+
+def numpy_lexer(text):
+    """get_next_token() interface over tokenize_all_numpy."""
+    return tokenize_all_numpy(text).cursor()
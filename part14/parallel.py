@@ -0,0 +1,213 @@
+###############################################################################
+#  Multi-core lexing and parsing of a single large source.                    #
+#                                                                             #
+#  The source is cut at whitespace outside comments, so that no identifier,   #
+#  number or comment straddles two chunks. Each chunk is lexed into columnar  #
+#  arrays in a worker process and the arrays are stitched back together in    #
+#  source order into one TokenBuffer the Parser can consume as usual.         #
+#                                                                             #
+#  Parsing is split at procedure bodies: LazyParser skims the program for     #
+#  the body of every top-level procedure, workers parse the bodies into the   #
+#  binary form of astformat, and the trees are decoded back into their        #
+#  ProcedureDecl nodes, which stay in source order.                           #
+#                                                                             #
+###############################################################################
+import gc
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from spi import (
+    EOF,
+    TokenBuffer,
+    LazyBlock,
+    LazyParser,
+    Parser,
+    ProcedureDecl,
+    RegexLexer,
+)
+from nplexer import np, tokenize_all_numpy
+from astformat import dumps, loads
+
+
+def split_points(text, parts):
+    """Return offsets that cut `text` into about `parts` lexable chunks.
+
+    Every offset is at a whitespace character outside any comment.
+    Comments do not nest, so an offset is outside a comment if the last
+    brace before it is a '}' (or there is none).
+    """
+    points = []
+    size = len(text)
+    pos = 0
+    for part in range(1, parts):
+        target = max(pos + 1, size * part // parts)
+        while target < size:
+            if text.rfind('{', 0, target) > text.rfind('}', 0, target):
+                # inside a comment: continue after it
+                close = text.find('}', target)
+                if close == -1:
+                    return points
+                target = close + 1
+            elif text[target].isspace():
+                break
+            else:
+                target += 1
+        if target >= size:
+            break
+        points.append(target)
+        pos = target
+    return points
+
+
+def _lex_chunk(chunk, base):
+    """Lex one chunk; return its arrays with starts shifted by `base`.
+
+    Returns None if the chunk does not lex: the error is raised again by
+    lexing the whole text, with its position in the whole text.
+    """
+    try:
+        buffer = tokenize_all_numpy(chunk)
+    except Exception:
+        return None
+    # drop the chunk's own EOF token
+    del buffer.types[-1]
+    del buffer.starts[-1]
+    del buffer.lengths[-1]
+    if np is not None:
+        starts = np.frombuffer(buffer.starts, dtype=np.int64) + base
+        buffer.starts = array('q', starts.tobytes())
+    else:
+        buffer.starts = array('q', [start + base for start in buffer.starts])
+    return buffer.types, buffer.starts, buffer.lengths
+
+
+def tokenize_parallel(text, workers=None, min_chunk_size=1024 * 1024):
+    """Lex `text` on `workers` processes and return one TokenBuffer.
+
+    Sources smaller than two chunks are lexed in this process. If any
+    chunk fails to lex, the whole text is lexed again here so the error
+    is raised with its position in the full source. Failures of the
+    worker processes themselves are raised as they are.
+    """
+    workers = workers or os.cpu_count() or 1
+    parts = min(workers, len(text) // min_chunk_size)
+    if parts < 2:
+        return tokenize_all_numpy(text)
+
+    bounds = [0] + split_points(text, parts) + [len(text)]
+    buffer = TokenBuffer(text)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_lex_chunk, text[start:end], start)
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        for future in futures:
+            arrays = future.result()
+            if arrays is None:
+                executor.shutdown(cancel_futures=True)
+                return tokenize_all_numpy(text)
+            types, starts, lengths = arrays
+            buffer.types.extend(types)
+            buffer.starts.extend(starts)
+            buffer.lengths.extend(lengths)
+
+    buffer.types.append(EOF)
+    buffer.starts.append(len(text))
+    buffer.lengths.append(0)
+    return buffer
+
+
+def parallel_lexer(text):
+    """get_next_token() interface over tokenize_parallel."""
+    return tokenize_parallel(text).cursor()
+
+
+def procedure_spans(tree):
+    """Return the top-level ProcedureDecls of `tree` whose bodies are lazy.
+
+    `tree` comes from LazyParser, so each body is still a LazyBlock
+    holding its span of the source.
+    """
+    return [
+        decl for decl in tree.block.declarations
+        if isinstance(decl, ProcedureDecl)
+        and type(decl._block_node) is LazyBlock
+    ]
+
+
+# the source text of the program being parsed, set once per worker
+_worker_text = None
+
+
+def _init_worker(text):
+    global _worker_text
+    _worker_text = text
+
+
+def _parse_bodies(spans):
+    """Parse the bodies at `spans` of the worker's text; return them serialized.
+
+    Serializing reads every node, so procedures nested in a body are parsed
+    here as well. The trees are dropped once serialized, so there is no
+    point in collecting garbage meanwhile.
+    """
+    gc.disable()
+    try:
+        return [
+            dumps(LazyBlock(_worker_text, start, end).parse())
+            for start, end in spans
+        ]
+    finally:
+        gc.enable()
+
+
+def _batches(decls, count):
+    """Split `decls` into about `count` runs of similar source size."""
+    total = sum(d._block_node.end - d._block_node.start for d in decls)
+    target = max(1, total // count)
+    batches = [[]]
+    size = 0
+    for decl in decls:
+        if size >= target:
+            batches.append([])
+            size = 0
+        batches[-1].append(decl)
+        size += decl._block_node.end - decl._block_node.start
+    return batches
+
+
+def parse_parallel(text, workers=None, min_procedures=64):
+    """Parse `text` with procedure bodies spread over `workers` processes.
+
+    Returns the same tree as Parser. The source is sent to each worker
+    once; tasks are batches of body spans, a few per worker so that
+    uneven batches even out. Programs with fewer than `min_procedures`
+    top-level procedures are parsed in this process. A syntax error in
+    a body is raised from its worker with its position in `text`.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers < 2:
+        return Parser(RegexLexer(text)).parse()
+    tree = LazyParser(text).parse()
+    decls = procedure_spans(tree)
+    if len(decls) < min_procedures:
+        for decl in decls:
+            decl.block_node
+        return tree
+
+    batches = _batches(decls, workers * 4)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(text,)
+    ) as executor:
+        futures = [
+            executor.submit(_parse_bodies, [
+                (decl._block_node.start, decl._block_node.end)
+                for decl in batch
+            ])
+            for batch in batches
+        ]
+        for batch, future in zip(batches, futures):
+            for decl, data in zip(batch, future.result()):
+                decl.block_node = loads(data)
+    return tree
@@ -0,0 +1,176 @@
+###############################################################################
+#  On-disk cache of parsed programs.                                          #
+#                                                                             #
+#  Like __pycache__ for .pas files: the AST of a program is stored under a    #
+#  hash of its source text and of the interpreter itself, so running the      #
+#  same program again skips lexing and parsing. Entries are in the binary     #
+#  format of astformat and are decoded straight from the mapped file.         #
+#                                                                             #
+###############################################################################
+import hashlib
+import os
+import sys
+import tempfile
+
+import astformat
+import spi
+from astformat import dumps, load_file
+
+
+DEFAULT_CACHE_DIR = '__spicache__'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+_interpreter_versions = {}
+
+
+def interpreter_version(modules=()):
+    """Hash of the modules that build and serialize trees.
+
+    `modules` are the files of the modules outside spi.py that took part
+    in building the tree, such as ll1.py for the LL(1) parser. Any edit
+    to the parser or to this module gives every program a new cache
+    key, the way a new Python version gets new .pyc files.
+    """
+    modules = tuple(modules)
+    version = _interpreter_versions.get(modules)
+    if version is None:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(sys.version.encode('utf-8'))
+        for module_file in (spi.__file__, astformat.__file__, __file__) + (
+            modules
+        ):
+            with open(module_file, 'rb') as f:
+                digest.update(f.read())
+        version = _interpreter_versions[modules] = digest.digest()
+    return version
+
+
+class ParseCache(object):
+    """Directory of serialized ASTs keyed by source and interpreter version.
+
+    Entries are written to a temporary file and renamed into place, so a
+    reader never sees a partial entry. A hit refreshes the entry's mtime;
+    when the directory grows past `max_size` bytes the least recently
+    used entries are removed.
+    """
+    SUFFIX = '.ast'
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _digest(self, variant, modules):
+        digest = hashlib.blake2b(
+            interpreter_version(modules), digest_size=16
+        )
+        digest.update(variant.encode('utf-8') + b'\0')
+        return digest
+
+    def key(self, source, variant='', modules=()):
+        """Return the cache key of `source` (str, bytes or mmap).
+
+        `variant` names how the tree was built (the parser), so that
+        trees of the same source from different parsers do not mix.
+        `modules` are the files of the other modules that built it (see
+        interpreter_version).
+        """
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        digest = self._digest(variant, modules)
+        digest.update(source)
+        return digest.hexdigest()
+
+    def file_key(self, fname, variant='', chunk_size=1024 * 1024,
+                 modules=()):
+        """Return the cache key of the file `fname`, read in chunks."""
+        digest = self._digest(variant, modules)
+        with open(fname, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        """Return the cached tree for `key`, or None."""
+        path = self.path(key)
+        try:
+            tree = load_file(path)
+        except OSError:
+            return None
+        except Exception:
+            # truncated or from an incompatible writer: drop it
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return tree
+
+    def put(self, key, tree):
+        """Store `tree` under `key`, then evict down to max_size."""
+        data = dumps(tree)
+        if len(data) > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, prefix='.tmp-', suffix=self.SUFFIX
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under max_size."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.tmp-') or (
+                    not entry.name.endswith(self.SUFFIX)
+                ):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_parse(cache, key, parse):
+    """Return the tree stored under `key`, or parse() and store it.
+
+    parse() must build a plain tree of spi nodes, fully parsed: storing
+    a tree with LazyBlocks would parse them all.
+    """
+    tree = cache.get(key)
+    if tree is None:
+        tree = parse()
+        try:
+            cache.put(key, tree)
+        except OSError:
+            # a read-only or full disk only costs the next run a parse
+            pass
+    return tree
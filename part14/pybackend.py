@@ -0,0 +1,313 @@
+###############################################################################
+#  Python bytecode backend.                                                   #
+#                                                                             #
+#  PythonCompiler translates the tree into a Python ast.Module holding one   #
+#  function for the program. Its statements run as the function's body,     #
+#  with every Pascal variable a local of the function, and procedures are    #
+#  nested functions that reach the variables of enclosing scopes through     #
+#  closures and `nonlocal`. PythonInterpreter compiles the module with       #
+#  compile() and runs the function, so the program runs as CPython           #
+#  bytecode.                                                                 #
+#                                                                             #
+#  Names are prefixed (v_ for variables, p_ for procedures) so that no       #
+#  Pascal identifier can clash with a Python keyword, a builtin or another   #
+#  kind of name.                                                             #
+#                                                                             #
+###############################################################################
+import ast
+import gc
+from collections import OrderedDict
+
+from spi import (
+    PLUS,
+    MINUS,
+    MUL,
+    INTEGER_DIV,
+    FLOAT_DIV,
+    NodeVisitor,
+)
+
+
+# operator and context nodes carry no state and are shared, as in the
+# trees CPython's own parser builds
+BIN_OPS = {
+    PLUS: ast.Add(),
+    MINUS: ast.Sub(),
+    MUL: ast.Mult(),
+    INTEGER_DIV: ast.FloorDiv(),
+    FLOAT_DIV: ast.Div(),
+}
+
+UNARY_OPS = {
+    PLUS: ast.UAdd(),
+    MINUS: ast.USub(),
+}
+
+LOAD = ast.Load()
+STORE = ast.Store()
+
+# compile() needs a position on every statement and expression. Every
+# node is put on line 1 as it is made: ast.fix_missing_locations()
+# takes longer than building the tree.
+POSITION = {'lineno': 1, 'col_offset': 0, 'end_lineno': 1, 'end_col_offset': 0}
+
+# CPython compiles a function in time quadratic in the number of
+# functions nested directly in it, so a block's procedures are defined
+# in groups of this many, each inside a function of its own
+PROCEDURE_GROUP_SIZE = 128
+
+
+def variable_name(name):
+    return 'v_' + name
+
+
+def procedure_name(name):
+    return 'p_' + name
+
+
+class Scope(object):
+    """The names of one Python function being generated."""
+
+    def __init__(self, enclosing_scope=None):
+        self.enclosing_scope = enclosing_scope
+        self.local_names = set()     # parameters and declared variables
+        self.free_names = set()      # other names read or assigned
+        self.assigned_names = set()  # names assigned, local or not
+
+    def use(self, name, assigned=False):
+        if name not in self.local_names:
+            self.free_names.add(name)
+        if assigned:
+            self.assigned_names.add(name)
+
+    def binds(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.local_names:
+                return True
+            scope = scope.enclosing_scope
+        return False
+
+
+def _function(name, params, body):
+    return ast.FunctionDef(
+        name=name,
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(arg=param, **POSITION) for param in params],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        ),
+        body=body or [ast.Pass(**POSITION)],
+        decorator_list=[],
+        **POSITION
+    )
+
+
+class PythonCompiler(NodeVisitor):
+    """Translates a Program tree into an ast.Module.
+
+    The module defines one function, `program_<name>`, that runs the
+    program and returns the values of the variables it assigns, in the
+    order of `assigned`: the order of their first assignment in the
+    statement part. The language has no branches, loops or calls, so
+    that is also the order in which Interpreter first stores them.
+
+    Every name the statement part uses is set to None first, so that
+    reading a variable before it is assigned gives None, as in
+    Interpreter. A name used in a procedure and bound nowhere (an
+    undeclared variable) is bound in the program's function, which
+    keeps `nonlocal` valid. Procedure bodies are compiled but, as in
+    Interpreter, never run: the language has no procedure calls.
+
+    Pascal `/` divides the operands converted to float, exactly like
+    Interpreter, and `DIV` is `//`.
+    """
+
+    def __init__(self):
+        self.scope = None
+        self.program_scope = None
+        self.assigned = {}
+
+    def compile_function(self, name, params, block, scope):
+        """Return the FunctionDef for `block` in `scope`."""
+        self.scope = scope
+        body = self.visit(block)
+        prologue = []
+        if scope is self.program_scope:
+            # with the names bound here for procedures (see
+            # visit_ProcedureDecl) and the undeclared ones used here
+            names = sorted(scope.local_names | scope.free_names)
+        else:
+            names = sorted(scope.local_names - set(params))
+            nonlocal_names = sorted(
+                scope.assigned_names & scope.free_names
+            )
+            if nonlocal_names:
+                prologue.append(ast.Nonlocal(
+                    names=[variable_name(n) for n in nonlocal_names],
+                    **POSITION
+                ))
+        if names:
+            # declared variables start as None, like unset ones
+            prologue.append(ast.Assign(
+                targets=[
+                    ast.Name(id=variable_name(n), ctx=STORE, **POSITION)
+                    for n in names
+                ],
+                value=ast.Constant(value=None, **POSITION),
+                **POSITION
+            ))
+        return _function(
+            name, [variable_name(p) for p in params], prologue + body
+        )
+
+    def visit_Program(self, node):
+        self.program_scope = Scope()
+        function = self.compile_function(
+            'program_' + node.name, [], node.block, self.program_scope
+        )
+        function.body.append(ast.Return(
+            value=ast.List(
+                elts=[
+                    ast.Name(id=variable_name(n), ctx=LOAD, **POSITION)
+                    for n in self.assigned
+                ],
+                ctx=LOAD,
+                **POSITION
+            ),
+            **POSITION
+        ))
+        return ast.Module(body=[function], type_ignores=[])
+
+    def visit_Block(self, node):
+        procedures = []
+        for declaration in node.declarations:
+            procedures.extend(self.visit(declaration))
+        size = PROCEDURE_GROUP_SIZE
+        if len(procedures) > size:
+            procedures = [
+                _function(
+                    'procedures_%d' % (start // size), [],
+                    procedures[start:start + size]
+                )
+                for start in range(0, len(procedures), size)
+            ]
+        return procedures + self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        self.scope.local_names.add(node.var_node.value)
+        return []
+
+    def visit_ProcedureDecl(self, node):
+        outer = self.scope
+        params = [param.var_node.value for param in node.params]
+        scope = Scope(outer)
+        scope.local_names.update(params)
+        function = self.compile_function(
+            procedure_name(node.proc_name), params, node.block_node, scope
+        )
+        self.scope = outer
+        for name in scope.free_names:
+            if not outer.binds(name):
+                self.program_scope.local_names.add(name)
+            elif name not in outer.local_names:
+                # used through this scope by the nested function
+                outer.free_names.add(name)
+        return [function]
+
+    def visit_Compound(self, node):
+        body = []
+        for child in node.children:
+            body.extend(self.visit(child))
+        return body
+
+    def visit_NoOp(self, node):
+        return []
+
+    def visit_Assign(self, node):
+        name = node.left.value
+        value = self.visit(node.right)
+        self.scope.use(name, assigned=True)
+        if self.scope is self.program_scope:
+            # only the statement part of the program runs
+            self.assigned.setdefault(name)
+        return [ast.Assign(
+            targets=[ast.Name(id=variable_name(name), ctx=STORE, **POSITION)],
+            value=value,
+            **POSITION
+        )]
+
+    def visit_Var(self, node):
+        self.scope.use(node.value)
+        return ast.Name(id=variable_name(node.value), ctx=LOAD, **POSITION)
+
+    def visit_Num(self, node):
+        return ast.Constant(value=node.value, **POSITION)
+
+    def visit_UnaryOp(self, node):
+        return ast.UnaryOp(
+            op=UNARY_OPS[node.op], operand=self.visit(node.expr), **POSITION
+        )
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if node.op == FLOAT_DIV:
+            left = ast.Call(
+                func=ast.Name(id='float', ctx=LOAD, **POSITION),
+                args=[left], keywords=[], **POSITION
+            )
+            right = ast.Call(
+                func=ast.Name(id='float', ctx=LOAD, **POSITION),
+                args=[right], keywords=[], **POSITION
+            )
+        return ast.BinOp(
+            left=left, op=BIN_OPS[node.op], right=right, **POSITION
+        )
+
+
+def to_python(tree):
+    """Return (module, names): the ast.Module for `tree` and the names
+    of the values its function returns."""
+    compiler = PythonCompiler()
+    module = compiler.visit(tree)
+    return module, list(compiler.assigned)
+
+
+class PythonInterpreter(object):
+    """Runs a tree like Interpreter, as compiled Python bytecode.
+
+    The tree is compiled on the first interpret(). GLOBAL_MEMORY holds
+    the same names and values, in the same order, as Interpreter's once
+    the program has run.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.GLOBAL_MEMORY = OrderedDict()
+        self.function = None
+        self.names = None
+
+    def compile(self):
+        # the generated ast is one tracked object per node and more;
+        # collecting while it is built would only cost time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            module, self.names = to_python(self.tree)
+            code = compile(module, '<%s>' % self.tree.name, 'exec')
+        finally:
+            if gc_enabled:
+                gc.enable()
+        namespace = {}
+        exec(code, namespace)
+        self.function = namespace[module.body[0].name]
+
+    def interpret(self):
+        if self.tree is None:
+            return ''
+        if self.function is None:
+            self.compile()
+        self.GLOBAL_MEMORY = OrderedDict(zip(self.names, self.function()))
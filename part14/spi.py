@@ -1,6 +1,12 @@
 """ SPI - Simple Pascal Interpreter. Part 14."""
 
+import codecs
+import re
+from array import array
+from bisect import bisect_right
 from collections import OrderedDict
+from itertools import islice
+from sys import intern
 
 ###############################################################################
 #                                                                             #
@@ -10,38 +16,59 @@ from collections import OrderedDict
 
 # Token types
 #
+# Token types are small integer codes; TOKEN_TYPE_NAMES maps a code back
+# to its name for printing and TOKEN_TYPES maps a name to its code.
+#
 # EOF (end-of-file) token is used to indicate that
 # there is no more input left for lexical analysis
-INTEGER       = 'INTEGER'
-REAL          = 'REAL'
-INTEGER_CONST = 'INTEGER_CONST'
-REAL_CONST    = 'REAL_CONST'
-PLUS          = 'PLUS'
-MINUS         = 'MINUS'
-MUL           = 'MUL'
-INTEGER_DIV   = 'INTEGER_DIV'
-FLOAT_DIV     = 'FLOAT_DIV'
-LPAREN        = 'LPAREN'
-RPAREN        = 'RPAREN'
-ID            = 'ID'
-ASSIGN        = 'ASSIGN'
-BEGIN         = 'BEGIN'
-END           = 'END'
-SEMI          = 'SEMI'
-DOT           = 'DOT'
-PROGRAM       = 'PROGRAM'
-VAR           = 'VAR'
-COLON         = 'COLON'
-COMMA         = 'COMMA'
-PROCEDURE     = 'PROCEDURE'
-EOF           = 'EOF'
+INTEGER       = 0
+REAL          = 1
+INTEGER_CONST = 2
+REAL_CONST    = 3
+PLUS          = 4
+MINUS         = 5
+MUL           = 6
+INTEGER_DIV   = 7
+FLOAT_DIV     = 8
+LPAREN        = 9
+RPAREN        = 10
+ID            = 11
+ASSIGN        = 12
+BEGIN         = 13
+END           = 14
+SEMI          = 15
+DOT           = 16
+PROGRAM       = 17
+VAR           = 18
+COLON         = 19
+COMMA         = 20
+PROCEDURE     = 21
+EOF           = 22
+
+TOKEN_TYPE_NAMES = (
+    'INTEGER', 'REAL', 'INTEGER_CONST', 'REAL_CONST', 'PLUS', 'MINUS',
+    'MUL', 'INTEGER_DIV', 'FLOAT_DIV', 'LPAREN', 'RPAREN', 'ID', 'ASSIGN',
+    'BEGIN', 'END', 'SEMI', 'DOT', 'PROGRAM', 'VAR', 'COLON', 'COMMA',
+    'PROCEDURE', 'EOF',
+)
+
+TOKEN_TYPES = {name: code for code, name in enumerate(TOKEN_TYPE_NAMES)}
 
 
 class Token(object):
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
+        # the old string type names are still accepted: Token('PLUS', '+')
+        if type.__class__ is str:
+            type = TOKEN_TYPES[type]
         self.type = type
         self.value = value
 
+    @property
+    def type_name(self):
+        return TOKEN_TYPE_NAMES[self.type]
+
     def __str__(self):
         """String representation of the class instance.
 
@@ -51,7 +78,7 @@ class Token(object):
             Token(MUL, '*')
         """
         return 'Token({type}, {value})'.format(
-            type=self.type,
+            type=TOKEN_TYPE_NAMES[self.type],
             value=repr(self.value)
         )
 
@@ -59,18 +86,125 @@ class Token(object):
         return self.__str__()
 
 
+class SpanToken(Token):
+    """A Token that refers to its text as source[start:end].
+
+    The value is only decoded (and int()/float() converted) the first
+    time it is read, so lex-only passes never build it. `source` is the
+    lexer's input string, or bytes (usually a memoryview) for bytes input.
+    """
+    __slots__ = ('source', 'start', 'end')
+
+    # a second name for Token's 'value' slot, used as the cache
+    _value = Token.value
+
+    def __init__(self, type, source, start, end):
+        self.type = type
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def value(self):
+        try:
+            return self._value
+        except AttributeError:
+            pass
+        text = self.source[self.start:self.end]
+        if text.__class__ is not str:
+            text = str(text, 'utf-8')
+        if self.type == INTEGER_CONST:
+            value = int(text)
+        elif self.type == REAL_CONST:
+            value = float(text)
+        else:
+            value = text
+        self._value = value
+        return value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+
 RESERVED_KEYWORDS = {
-    'PROGRAM': Token('PROGRAM', 'PROGRAM'),
-    'VAR': Token('VAR', 'VAR'),
-    'DIV': Token('INTEGER_DIV', 'DIV'),
-    'INTEGER': Token('INTEGER', 'INTEGER'),
-    'REAL': Token('REAL', 'REAL'),
-    'BEGIN': Token('BEGIN', 'BEGIN'),
-    'END': Token('END', 'END'),
-    'PROCEDURE': Token('PROCEDURE', 'PROCEDURE'),
+    'PROGRAM': Token(PROGRAM, 'PROGRAM'),
+    'VAR': Token(VAR, 'VAR'),
+    'DIV': Token(INTEGER_DIV, 'DIV'),
+    'INTEGER': Token(INTEGER, 'INTEGER'),
+    'REAL': Token(REAL, 'REAL'),
+    'BEGIN': Token(BEGIN, 'BEGIN'),
+    'END': Token(END, 'END'),
+    'PROCEDURE': Token(PROCEDURE, 'PROCEDURE'),
+}
+
+# Punctuation and operator tokens never change their value, so every lexer
+# hands out these shared instances instead of allocating new ones.
+PUNCTUATION_TOKENS = {
+    ':=': Token(ASSIGN, ':='),
+    ';': Token(SEMI, ';'),
+    ':': Token(COLON, ':'),
+    ',': Token(COMMA, ','),
+    '+': Token(PLUS, '+'),
+    '-': Token(MINUS, '-'),
+    '*': Token(MUL, '*'),
+    '/': Token(FLOAT_DIV, '/'),
+    '(': Token(LPAREN, '('),
+    ')': Token(RPAREN, ')'),
+    '.': Token(DOT, '.'),
+}
+
+EOF_TOKEN = Token(EOF, None)
+
+# Keywords and punctuation have exactly one token per type code
+FIXED_TOKENS = {
+    token.type: token
+    for token in list(RESERVED_KEYWORDS.values()) +
+                 list(PUNCTUATION_TOKENS.values()) + [EOF_TOKEN]
+}
+
+# No identifier longer than this can be a reserved keyword
+MAX_KEYWORD_LENGTH = max(len(name) for name in RESERVED_KEYWORDS)
+
+RESERVED_KEYWORDS_BYTES = {
+    name.encode('ascii'): token for name, token in RESERVED_KEYWORDS.items()
 }
 
 
+class SourceIndex(object):
+    """Start offsets of every line of a source text.
+
+    Built once per source (or fed chunk by chunk); line_column() turns an
+    offset into a 1-based (line, column) pair with a binary search, so
+    nothing has to track lines while lexing.
+    """
+    def __init__(self, text=''):
+        self.line_starts = array('q', [0])
+        self._length = 0
+        self.feed(text)
+
+    def feed(self, text):
+        """Index the next piece of the source text."""
+        newline = '\n' if isinstance(text, str) else b'\n'
+        find = text.find
+        add_line = self.line_starts.append
+        base = self._length
+        pos = find(newline)
+        while pos != -1:
+            add_line(base + pos + 1)
+            pos = find(newline, pos + 1)
+        self._length += len(text)
+
+    def line_column(self, offset):
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+
+def describe_position(lexer, offset):
+    """Return 'line L, column C' for an offset into the lexer's source."""
+    return 'line %d, column %d' % lexer.source_index().line_column(offset)
+
+
 class Lexer(object):
     def __init__(self, text):
         # client string input, e.g. "4 + 2 * 3 - 6 / 2"
@@ -78,9 +212,19 @@ class Lexer(object):
         # self.pos is an index into self.text
         self.pos = 0
         self.current_char = self.text[self.pos]
+        # offset of the token returned last by get_next_token
+        self.token_start = 0
+        self._source_index = None
+
+    def source_index(self):
+        if self._source_index is None:
+            self._source_index = SourceIndex(self.text)
+        return self._source_index
 
     def error(self):
-        raise Exception('Invalid character')
+        raise Exception('Invalid character at %s' % describe_position(
+            self, self.token_start
+        ))
 
     def advance(self):
         """Advance the `pos` pointer and set the `current_char` variable."""
@@ -108,36 +252,37 @@ class Lexer(object):
 
     def number(self):
         """Return a (multidigit) integer or float consumed from the input."""
-        result = ''
-        while self.current_char is not None and self.current_char.isdigit():
-            result += self.current_char
+        start = self.pos
+        while (
+            self.current_char is not None and
+            self.current_char.isdecimal()
+        ):
             self.advance()
 
+        type = INTEGER_CONST
         if self.current_char == '.':
-            result += self.current_char
+            type = REAL_CONST
             self.advance()
 
             while (
                 self.current_char is not None and
-                self.current_char.isdigit()
+                self.current_char.isdecimal()
             ):
-                result += self.current_char
                 self.advance()
 
-            token = Token('REAL_CONST', float(result))
-        else:
-            token = Token('INTEGER_CONST', int(result))
-
-        return token
+        return SpanToken(type, self.text, start, self.pos)
 
     def _id(self):
         """Handle identifiers and reserved keywords"""
-        result = ''
+        start = self.pos
         while self.current_char is not None and self.current_char.isalnum():
-            result += self.current_char
             self.advance()
 
-        token = RESERVED_KEYWORDS.get(result.upper(), Token(ID, result))
+        token = None
+        if self.pos - start <= MAX_KEYWORD_LENGTH:
+            token = RESERVED_KEYWORDS.get(self.text[start:self.pos].upper())
+        if token is None:
+            token = SpanToken(ID, self.text, start, self.pos)
         return token
 
     def get_next_token(self):
@@ -157,60 +302,705 @@ class Lexer(object):
                 self.skip_comment()
                 continue
 
+            self.token_start = self.pos
+
             if self.current_char.isalpha():
                 return self._id()
 
-            if self.current_char.isdigit():
+            # decimal digits only: int() rejects others, such as '²'
+            if self.current_char.isdecimal():
                 return self.number()
 
             if self.current_char == ':' and self.peek() == '=':
                 self.advance()
                 self.advance()
-                return Token(ASSIGN, ':=')
+                return PUNCTUATION_TOKENS[':=']
 
-            if self.current_char == ';':
+            token = PUNCTUATION_TOKENS.get(self.current_char)
+            if token is not None:
                 self.advance()
-                return Token(SEMI, ';')
+                return token
 
-            if self.current_char == ':':
-                self.advance()
-                return Token(COLON, ':')
+            self.error()
 
-            if self.current_char == ',':
-                self.advance()
-                return Token(COMMA, ',')
+        self.token_start = self.pos
+        return EOF_TOKEN
 
-            if self.current_char == '+':
-                self.advance()
-                return Token(PLUS, '+')
 
-            if self.current_char == '-':
-                self.advance()
-                return Token(MINUS, '-')
+# Master pattern for RegexLexer: one named group per token kind, tried in
+# order, so ':=' must come before ':'. SKIP swallows whitespace and comments
+# in one match, MISMATCH catches anything else.
+#
+# \s, \w and \d are str.isspace(), str.isalnum() and str.isdecimal(),
+# as in Lexer, but an identifier must start with a letter (isalpha()),
+# and the regex has no class for that: [^\W\d_] also takes numerals such
+# as '²' or '½'. Identifiers starting with a non-ASCII character are
+# matched as UNICODE_ID, and the lexers take them for an ID only if the
+# first character is a letter.
+TOKEN_REGEX = re.compile(r"""
+      (?P<SKIP>(?:\s+|\{[^}]*\})+)
+    | (?P<ID>[a-zA-Z][^\W_]*)
+    | (?P<UNICODE_ID>[^\x00-\x7f\W\d_][^\W_]*)
+    | (?P<REAL_CONST>\d+\.\d*)
+    | (?P<INTEGER_CONST>\d+)
+    | (?P<ASSIGN>:=)
+    | (?P<SEMI>;)
+    | (?P<COLON>:)
+    | (?P<COMMA>,)
+    | (?P<PLUS>\+)
+    | (?P<MINUS>-)
+    | (?P<MUL>\*)
+    | (?P<FLOAT_DIV>/)
+    | (?P<LPAREN>\()
+    | (?P<RPAREN>\))
+    | (?P<DOT>\.)
+    | (?P<MISMATCH>.)
+""", re.VERBOSE)
+
+# The same pattern for bytes input; \s, \w and \d match ASCII only
+TOKEN_REGEX_BYTES = re.compile(TOKEN_REGEX.pattern.encode('ascii'), re.VERBOSE)
+
+# Token type codes for the TOKEN_REGEX groups that produce tokens
+GROUP_TYPES = {
+    name: TOKEN_TYPES[name]
+    for name in TOKEN_REGEX.groupindex
+    if name in TOKEN_TYPES
+}
 
-            if self.current_char == '*':
-                self.advance()
-                return Token(MUL, '*')
 
-            if self.current_char == '/':
-                self.advance()
-                return Token(FLOAT_DIV, '/')
+def unicode_id_kind(match):
+    """Return the group a UNICODE_ID match stands for: ID if it starts
+    with a letter, like an identifier in Lexer, else MISMATCH."""
+    return 'ID' if match.group()[0].isalpha() else 'MISMATCH'
 
-            if self.current_char == '(':
-                self.advance()
-                return Token(LPAREN, '(')
 
-            if self.current_char == ')':
-                self.advance()
-                return Token(RPAREN, ')')
+class RegexLexer(object):
+    """Drop-in replacement for Lexer driven by TOKEN_REGEX.
 
-            if self.current_char == '.':
-                self.advance()
-                return Token(DOT, '.')
+    Produces the same Token stream as Lexer.get_next_token, but lets the
+    regex engine consume whole identifiers, numbers, comments and runs of
+    whitespace instead of advancing one character at a time. `text` may
+    also be bytes, in which case tokens refer to it through a memoryview.
+    """
+    # identifiers and numbers become SpanTokens over the input
+    lazy_values = True
+    # offset of the text matched against from the start of the input
+    _base = 0
+    # a lexing error get_tokens() has yet to raise
+    _error = None
 
+    def __init__(self, text, pos=0, endpos=None):
+        self.text = text
+        # only text[pos:endpos] is lexed; offsets stay those of `text`
+        self.pos = pos
+        self.endpos = len(text) if endpos is None else endpos
+        # the match of the token returned last by get_next_token
+        self._match = None
+        self._source_index = None
+        self._tokens = self._tokenize()
+
+    @property
+    def token_start(self):
+        """Offset of the token returned last by get_next_token."""
+        if self._match is None:
+            return self.endpos
+        return self._match.start()
+
+    def source_index(self):
+        if self._source_index is None:
+            self._source_index = SourceIndex(self.text)
+        return self._source_index
+
+    def error(self):
+        raise Exception('Invalid character at %s' % describe_position(
+            self, self.token_start
+        ))
+
+    def _matches(self):
+        if isinstance(self.text, str):
+            return TOKEN_REGEX.finditer(self.text, self.pos, self.endpos)
+        return TOKEN_REGEX_BYTES.finditer(self.text, self.pos, self.endpos)
+
+    def _tokenize(self):
+        lazy = self.lazy_values
+        source = self.text
+        reserved = RESERVED_KEYWORDS
+        if lazy and not isinstance(source, str):
+            source = memoryview(source)
+            reserved = RESERVED_KEYWORDS_BYTES
+        group_types = GROUP_TYPES
+        fixed = FIXED_TOKENS
+        for match in self._matches():
+            kind = match.lastgroup
+            if kind == 'SKIP':
+                continue
+            self._match = match
+            if kind == 'UNICODE_ID':
+                kind = unicode_id_kind(match)
+            if kind == 'ID':
+                start, end = match.span()
+                token = None
+                if end - start <= MAX_KEYWORD_LENGTH:
+                    token = reserved.get(match.group().upper())
+                if token is None:
+                    if lazy:
+                        token = SpanToken(ID, source, start, end)
+                    else:
+                        token = self._eager_token(ID, match)
+                yield token
+            elif kind == 'INTEGER_CONST' or kind == 'REAL_CONST':
+                type = group_types[kind]
+                if lazy:
+                    start, end = match.span()
+                    yield SpanToken(type, source, start, end)
+                else:
+                    yield self._eager_token(type, match)
+            elif kind == 'MISMATCH':
+                self.error()
+            else:
+                yield fixed[group_types[kind]]
+
+        self._match = None
+
+    def get_next_token(self):
+        """Return the next token, or an EOF token once input is exhausted."""
+        return next(self._tokens, EOF_TOKEN)
+
+    def get_tokens(self, count):
+        """Return up to `count` (token, offset) pairs; the last pair is
+        EOF if the input runs out.
+
+        A lexing error is raised by the call that would return its pair:
+        the pairs before it are returned first.
+        """
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+        pairs = []
+        append = pairs.append
+        try:
+            for token in islice(self._tokens, count):
+                append((token, self._base + self._match.start()))
+        except Exception as e:
+            if not pairs:
+                raise
+            self._error = e
+            return pairs
+        if len(pairs) < count:
+            append((EOF_TOKEN, self.token_start))
+        return pairs
+
+
+class StreamLexer(RegexLexer):
+    """RegexLexer over a file object or mmap, read in bounded chunks.
+
+    Only the current chunk plus the unfinished token at its end are kept
+    in memory, so the source buffer costs O(chunk_size) regardless of the
+    file size. Bytes input (binary files, mmap) is decoded incrementally
+    as UTF-8; comments are skipped without buffering their contents.
+    Offsets count characters of the decoded text, and the line index is
+    fed as chunks are read.
+    """
+    # chunks are discarded once scanned, so values are built eagerly
+    lazy_values = False
+
+    def __init__(self, source, chunk_size=64 * 1024):
+        self.text = None  # the input is read from self.source instead
+        self.source = source
+        self.chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._source_index = SourceIndex()
+        # chars read so far, and the offset of the current chunk's start
+        self._read_total = 0
+        self._base = 0
+        self._match = None
+        self._tokens = self._tokenize()
+
+    @property
+    def token_start(self):
+        """Offset of the token returned last by get_next_token."""
+        if self._match is None:
+            return self._read_total
+        return self._base + self._match.start()
+
+    def _read(self):
+        """Return the next chunk of text and whether the input is exhausted."""
+        data = self.source.read(self.chunk_size)
+        if isinstance(data, str):
+            text = data
+        else:
+            text = self._decoder.decode(data, final=not data)
+        self._source_index.feed(text)
+        self._read_total += len(text)
+        return text, not data
+
+    def _matches(self):
+        match_at = TOKEN_REGEX.match
+        buf, eof = self._read()
+        pos = 0
+        while True:
+            match = match_at(buf, pos)
+            if match is None:
+                # pos == len(buf): the chunk is used up
+                if eof:
+                    return
+                buf, eof = self._read()
+                pos = 0
+                continue
+
+            kind = match.lastgroup
+            if kind == 'SKIP':
+                pos = match.end()
+                continue
+
+            if not eof:
+                if kind == 'MISMATCH' and buf[pos] == '{':
+                    # a comment that runs past the end of the chunk
+                    buf, eof = self._skip_comment()
+                    pos = 0
+                    continue
+                if match.end() == len(buf):
+                    # the token may continue in the next chunk
+                    text, eof = self._read()
+                    buf = buf[pos:] + text
+                    pos = 0
+                    continue
+
+            pos = match.end()
+            self._base = self._read_total - len(buf)
+            yield match
+
+    def _eager_token(self, type, match):
+        """Build a token whose value is decoded before its chunk is gone."""
+        text = match.group()
+        start = self._base + match.start()
+        token = SpanToken(type, None, start, start + len(text))
+        if type == INTEGER_CONST:
+            token.value = int(text)
+        elif type == REAL_CONST:
+            token.value = float(text)
+        else:
+            token.value = text
+        return token
+
+    def _skip_comment(self):
+        """Discard chunks up to and including the closing curly brace."""
+        while True:
+            buf, eof = self._read()
+            end = buf.find('}')
+            if end != -1:
+                return buf[end + 1:], eof
+            if eof:
+                self.error()
+
+
+KEYWORD_TYPES = {
+    name: token.type for name, token in RESERVED_KEYWORDS.items()
+}
+
+
+class TokenBuffer(object):
+    """The whole token stream of a source text in columnar form.
+
+    Token i has type code types[i] and spans
+    text[starts[i]:starts[i] + lengths[i]]. Values are decoded from the
+    text (a str, or bytes for ASCII input) only when value() or token()
+    asks for them. The last entry is always an EOF token.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.types = array('i')
+        self.starts = array('q')
+        self.lengths = array('i')
+        self._source_index = None
+
+    def source_index(self):
+        if self._source_index is None:
+            self._source_index = SourceIndex(self.text)
+        return self._source_index
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self.token(index)
+
+    def lexeme(self, index):
+        start = self.starts[index]
+        lexeme = self.text[start:start + self.lengths[index]]
+        if lexeme.__class__ is not str:
+            lexeme = str(lexeme, 'utf-8')
+        return lexeme
+
+    def value(self, index):
+        type = self.types[index]
+        if type == ID:
+            return self.lexeme(index)
+        if type == INTEGER_CONST:
+            return int(self.lexeme(index))
+        if type == REAL_CONST:
+            return float(self.lexeme(index))
+        return FIXED_TOKENS[type].value
+
+    def token(self, index):
+        """Return token `index` as a Token, sharing fixed instances."""
+        type = self.types[index]
+        token = FIXED_TOKENS.get(type)
+        if token is None:
+            start = self.starts[index]
+            token = SpanToken(
+                type, self.text, start, start + self.lengths[index]
+            )
+        return token
+
+    def cursor(self):
+        return TokenCursor(self)
+
+
+class TokenCursor(object):
+    """Feeds a TokenBuffer to the Parser one index at a time.
+
+    Has the same get_next_token() interface as the lexers, so
+    Parser(tokenize_all(text).cursor()) parses without calling back into
+    a lexer for every token.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.index = 0
+        self._current = 0
+        self._types = buffer.types
+        self._last = len(buffer) - 1
+
+    @property
+    def token_start(self):
+        return self.buffer.starts[self._current]
+
+    def source_index(self):
+        return self.buffer.source_index()
+
+    def get_next_token(self):
+        index = self._current = self.index
+        if index < self._last:
+            self.index = index + 1
+        token = FIXED_TOKENS.get(self._types[index])
+        if token is None:
+            token = self.buffer.token(index)
+        return token
+
+    def peek_token(self, k=1):
+        """Return the k-th token after the one returned last."""
+        index = min(self._current + k, self._last)
+        token = FIXED_TOKENS.get(self._types[index])
+        if token is None:
+            token = self.buffer.token(index)
+        return token
+
+
+class TokenLookahead(object):
+    """Ring buffer of tokens fetched ahead from a lexer.
+
+    Has the get_next_token() and token_start interface of a lexer and
+    adds peek_token(k), which looks up to `size` tokens past the one
+    returned last. Tokens are fetched in batches of up to `batch`, with
+    the lexer's get_tokens() where it has one, and kept as (token,
+    offset) pairs, since the lexer itself is ahead of the parser. Past
+    EOF, EOF is repeated.
+
+    A lexing error met while fetching ahead is raised only when the
+    token it stands for is reached, so that a syntax error before it is
+    still the one reported.
+    """
+    def __init__(self, lexer, size=64, batch=32):
+        # a power of two, so that an index is wrapped with a mask
+        capacity = 1
+        while capacity < size:
+            capacity <<= 1
+        self.lexer = lexer
+        self.size = capacity
+        self.batch = min(batch, capacity)
+        self._mask = capacity - 1
+        self._ring = [None] * capacity
+        # absolute indexes: the next pair to return, and the next free
+        # slot; the pairs in between have been fetched but not returned
+        self._head = 0
+        self._tail = 0
+        self._eof = None
+        # a lexing error to raise once the pairs before it are returned
+        self._error = None
+        self.token_start = 0
+
+    def source_index(self):
+        return self.lexer.source_index()
+
+    def _fetch(self, count):
+        """Return up to `count` more pairs from the lexer, ending at EOF."""
+        lexer = self.lexer
+        get_tokens = getattr(lexer, 'get_tokens', None)
+        if get_tokens is not None:
+            return get_tokens(count)
+        pairs = []
+        get_next_token = lexer.get_next_token
+        try:
+            for _ in range(count):
+                token = get_next_token()
+                pairs.append((token, lexer.token_start))
+                if token.type == EOF:
+                    break
+        except Exception as e:
+            if not pairs:
+                raise
+            self._error = e
+        return pairs
+
+    def _fill(self, count):
+        """Fetch `count` more tokens, as long as there is room."""
+        ring = self._ring
+        mask = self._mask
+        tail = self._tail
+        count = min(count, self.size - (tail - self._head))
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+        if self._eof is not None:
+            # the lexer is done: repeat its EOF
+            pairs = [self._eof] * count
+        else:
+            pairs = self._fetch(count)
+            if pairs and pairs[-1][0].type == EOF:
+                self._eof = pairs[-1]
+        for pair in pairs:
+            ring[tail & mask] = pair
+            tail += 1
+        self._tail = tail
+
+    def get_next_token(self):
+        head = self._head
+        if head == self._tail:
+            self._fill(self.batch)
+        self._head = head + 1
+        token, self.token_start = self._ring[head & self._mask]
+        return token
+
+    def peek_token(self, k=1):
+        """Return the k-th token after the one returned last."""
+        if not 0 < k <= self.size:
+            raise Exception('Can only peek 1 to %d tokens ahead' % self.size)
+        while self._tail - self._head < k:
+            self._fill(max(self.batch, k - (self._tail - self._head)))
+        return self._ring[(self._head + k - 1) & self._mask][0]
+
+
+def tokenize_all(text):
+    """Lex the whole `text` in one pass and return a TokenBuffer."""
+    buffer = TokenBuffer(text)
+    add_type = buffer.types.append
+    add_start = buffer.starts.append
+    add_length = buffer.lengths.append
+    group_types = GROUP_TYPES
+    keyword_types = KEYWORD_TYPES
+
+    for match in TOKEN_REGEX.finditer(text):
+        kind = match.lastgroup
+        if kind == 'SKIP':
+            continue
+        if kind == 'UNICODE_ID':
+            kind = unicode_id_kind(match)
+        if kind == 'MISMATCH':
+            raise Exception('Invalid character at %s' % describe_position(
+                buffer, match.start()
+            ))
+        start, end = match.span()
+        if kind == 'ID':
+            add_type(keyword_types.get(text[start:end].upper(), ID))
+        else:
+            add_type(group_types[kind])
+        add_start(start)
+        add_length(end - start)
+
+    add_type(EOF)
+    add_start(len(text))
+    add_length(0)
+    return buffer
+
+
+def bulk_lexer(text):
+    return tokenize_all(text).cursor()
+
+
+# Byte classes for ByteLexer
+BYTE_INVALID = 0
+BYTE_SPACE   = 1
+BYTE_LETTER  = 2
+BYTE_DIGIT   = 3
+BYTE_PUNCT   = 4
+BYTE_BRACE   = 5
+BYTE_COLON   = 6
+
+
+def _byte_tables(encoding):
+    """Build the 256-entry class table and run patterns for `encoding`.
+
+    Bytes are classified the way the str lexers classify the decoded
+    character, so ByteLexer(text.encode(encoding)) and Lexer(text) agree.
+    """
+    classes = bytearray(256)
+    alnum = bytearray()
+    digits = bytearray()
+    spaces = bytearray()
+    for code in range(256):
+        if code >= 128 and encoding == 'ascii':
+            continue
+        char = bytes([code]).decode(encoding)
+        if char.isspace():
+            classes[code] = BYTE_SPACE
+            spaces.append(code)
+        elif char.isalpha():
+            classes[code] = BYTE_LETTER
+        elif char.isdecimal():
+            classes[code] = BYTE_DIGIT
+            digits.append(code)
+        elif char == '{':
+            classes[code] = BYTE_BRACE
+        elif char == ':':
+            classes[code] = BYTE_COLON
+        elif char in PUNCTUATION_TOKENS:
+            classes[code] = BYTE_PUNCT
+        if char.isalnum():
+            alnum.append(code)
+
+    def run(codes):
+        return re.compile(
+            b'[' + b''.join(re.escape(bytes([c])) for c in codes) + b']*'
+        ).match
+
+    return bytes(classes), run(alnum), run(digits), run(spaces)
+
+
+BYTE_TABLES = {
+    'ascii': _byte_tables('ascii'),
+    'latin-1': _byte_tables('latin-1'),
+}
+
+# punctuation tokens by byte value
+BYTE_PUNCTUATION = {
+    ord(lexeme): token
+    for lexeme, token in PUNCTUATION_TOKENS.items()
+    if len(lexeme) == 1
+}
+
+
+class ByteLexer(object):
+    """Lexer over bytes, bytearray or mmap input; nothing is decoded up front.
+
+    The first byte of each token is classified through a 256-entry table,
+    runs of identifier characters, digits and whitespace are consumed by
+    patterns built from the same tables, and keywords are looked up as
+    bytes. Identifiers and numbers are SpanTokens over a memoryview, so
+    only the values somebody reads are ever decoded. `encoding` is
+    'ascii' (bytes >= 128 are invalid) or 'latin-1'.
+    """
+    def __init__(self, data, encoding='ascii'):
+        self.data = data
+        self.source = memoryview(data)
+        self.encoding = encoding
+        (self._classes, self._alnum_run,
+         self._digit_run, self._space_run) = BYTE_TABLES[encoding]
+        self.pos = 0
+        # offset of the token returned last by get_next_token
+        self.token_start = 0
+        self._source_index = None
+
+    def source_index(self):
+        if self._source_index is None:
+            self._source_index = SourceIndex(self.data)
+        return self._source_index
+
+    def error(self):
+        raise Exception('Invalid character at %s' % describe_position(
+            self, self.token_start
+        ))
+
+    def _id(self, start):
+        end = self._alnum_run(self.data, start + 1).end()
+        self.pos = end
+        if end - start <= MAX_KEYWORD_LENGTH:
+            token = RESERVED_KEYWORDS_BYTES.get(self.data[start:end].upper())
+            if token is not None:
+                return token
+        if self.encoding != 'ascii':
+            name = self.data[start:end]
+            if not name.isascii():
+                # SpanToken decodes UTF-8; decode this one now
+                token = SpanToken(ID, None, start, end)
+                token.value = name.decode(self.encoding)
+                return token
+        return SpanToken(ID, self.source, start, end)
+
+    def number(self, start):
+        data = self.data
+        end = self._digit_run(data, start + 1).end()
+        type = INTEGER_CONST
+        if data[end:end + 1] == b'.':
+            type = REAL_CONST
+            end = self._digit_run(data, end + 1).end()
+        self.pos = end
+        return SpanToken(type, self.source, start, end)
+
+    def get_next_token(self):
+        data = self.data
+        classes = self._classes
+        pos = self.pos
+        size = len(data)
+        while pos < size:
+            byte_class = classes[data[pos]]
+
+            if byte_class == BYTE_SPACE:
+                pos = self._space_run(data, pos + 1).end()
+                continue
+
+            if byte_class == BYTE_BRACE:
+                end = data.find(b'}', pos + 1)
+                if end == -1:
+                    self.token_start = pos
+                    self.error()
+                pos = end + 1
+                continue
+
+            self.token_start = pos
+
+            if byte_class == BYTE_LETTER:
+                return self._id(pos)
+
+            if byte_class == BYTE_DIGIT:
+                return self.number(pos)
+
+            if byte_class == BYTE_PUNCT:
+                self.pos = pos + 1
+                return BYTE_PUNCTUATION[data[pos]]
+
+            if byte_class == BYTE_COLON:
+                if data[pos + 1:pos + 2] == b'=':
+                    self.pos = pos + 2
+                    return PUNCTUATION_TOKENS[':=']
+                self.pos = pos + 1
+                return PUNCTUATION_TOKENS[':']
+
+            self.pos = pos
             self.error()
 
-        return Token(EOF, None)
+        self.pos = self.token_start = size
+        return EOF_TOKEN
+
+
+# Lexer engines over an in-memory string, selectable from the command line
+LEXERS = {
+    'char': Lexer,
+    'regex': RegexLexer,
+    'bulk': bulk_lexer,
+}
 
 
 ###############################################################################
@@ -219,97 +1009,210 @@ class Lexer(object):
 #                                                                             #
 ###############################################################################
 class AST(object):
-    pass
+    # Nodes have no __dict__: every field is a slot. `pos` is the offset
+    # into the source of the node's first token, or None.
+    __slots__ = ('pos',)
 
 
 class BinOp(AST):
-    def __init__(self, left, op, right):
+    __slots__ = ('left', 'op', 'right')
+
+    def __init__(self, left, op, right, pos=None):
         self.left = left
-        self.token = self.op = op
+        # the operator's token type; its token is shared, see `token`
+        self.op = op.type
         self.right = right
+        self.pos = pos
+
+    @property
+    def token(self):
+        return FIXED_TOKENS[self.op]
 
 
 class Num(AST):
-    def __init__(self, token):
-        self.token = token
+    __slots__ = ('value',)
+
+    def __init__(self, token, pos=None):
         self.value = token.value
+        self.pos = pos
+
+    @property
+    def token(self):
+        if type(self.value) is int:
+            return Token(INTEGER_CONST, self.value)
+        return Token(REAL_CONST, self.value)
 
 
 class UnaryOp(AST):
-    def __init__(self, op, expr):
-        self.token = self.op = op
+    __slots__ = ('op', 'expr')
+
+    def __init__(self, op, expr, pos=None):
+        self.op = op.type
         self.expr = expr
+        self.pos = pos
+
+    @property
+    def token(self):
+        return FIXED_TOKENS[self.op]
 
 
 class Compound(AST):
     """Represents a 'BEGIN ... END' block"""
-    def __init__(self):
+    __slots__ = ('children',)
+
+    def __init__(self, pos=None):
         self.children = []
+        self.pos = pos
 
 
 class Assign(AST):
-    def __init__(self, left, op, right):
+    __slots__ = ('left', 'right')
+
+    # the operator is always ':='
+    op = ASSIGN
+    token = PUNCTUATION_TOKENS[':=']
+
+    def __init__(self, left, op, right, pos=None):
         self.left = left
-        self.token = self.op = op
         self.right = right
+        self.pos = pos
 
 
 class Var(AST):
     """The Var node is constructed out of ID token."""
-    def __init__(self, token):
-        self.token = token
-        self.value = token.value
+    __slots__ = ('value',)
+
+    def __init__(self, token, pos=None):
+        # one string per distinct name, however often it occurs
+        self.value = intern(token.value)
+        self.pos = pos
+
+    @property
+    def token(self):
+        return Token(ID, self.value)
 
 
 class NoOp(AST):
-    pass
+    __slots__ = ()
+
+    def __init__(self, pos=None):
+        self.pos = pos
 
 
 class Program(AST):
-    def __init__(self, name, block):
+    __slots__ = ('name', 'block')
+
+    def __init__(self, name, block, pos=None):
         self.name = name
         self.block = block
+        self.pos = pos
 
 
 class Block(AST):
-    def __init__(self, declarations, compound_statement):
+    __slots__ = ('declarations', 'compound_statement')
+
+    def __init__(self, declarations, compound_statement, pos=None):
         self.declarations = declarations
         self.compound_statement = compound_statement
+        self.pos = pos
 
 
 class VarDecl(AST):
-    def __init__(self, var_node, type_node):
+    __slots__ = ('var_node', 'type_node')
+
+    def __init__(self, var_node, type_node, pos=None):
         self.var_node = var_node
         self.type_node = type_node
+        self.pos = pos
 
 
 class Type(AST):
-    def __init__(self, token):
-        self.token = token
+    __slots__ = ('value',)
+
+    def __init__(self, token, pos=None):
         self.value = token.value
+        self.pos = pos
+
+    @property
+    def token(self):
+        return RESERVED_KEYWORDS[self.value]
 
 
 class Param(AST):
-    def __init__(self, var_node, type_node):
+    __slots__ = ('var_node', 'type_node')
+
+    def __init__(self, var_node, type_node, pos=None):
         self.var_node = var_node
         self.type_node = type_node
+        self.pos = pos
 
 
 class ProcedureDecl(AST):
-    def __init__(self, proc_name, params, block_node):
+    __slots__ = ('proc_name', 'params', '_block_node')
+
+    def __init__(self, proc_name, params, block_node, pos=None):
         self.proc_name = proc_name
         self.params = params  # a list of Param nodes
-        self.block_node = block_node
+        self._block_node = block_node
+        self.pos = pos
+
+    @property
+    def block_node(self):
+        # a LazyBlock is parsed the first time the body is needed
+        block_node = self._block_node
+        if type(block_node) is LazyBlock:
+            block_node = self._block_node = block_node.parse()
+        return block_node
+
+    @block_node.setter
+    def block_node(self, block_node):
+        self._block_node = block_node
+
+
+class LazyBlock(object):
+    """The unparsed body of a procedure: source text[start:end]."""
+    __slots__ = ('text', 'start', 'end')
+
+    def __init__(self, text, start, end):
+        self.text = text
+        self.start = start
+        self.end = end
+
+    def parse(self):
+        parser = LazyParser(self.text, self.start, self.end)
+        node = parser.block()
+        if parser.current_token.type != EOF:
+            parser.error()
+        return node
 
 
 class Parser(object):
+    # tokens fetched from the lexer at a time
+    lookahead_batch = 32
+
     def __init__(self, lexer):
+        # anything with get_next_token() will do; a TokenBuffer is
+        # walked with an index cursor, other lexers get a lookahead
+        # buffer for peek()
+        if isinstance(lexer, TokenBuffer):
+            lexer = lexer.cursor()
+        elif not hasattr(lexer, 'peek_token'):
+            lexer = TokenLookahead(lexer, batch=self.lookahead_batch)
         self.lexer = lexer
         # set current token to the first token taken from the input
         self.current_token = self.lexer.get_next_token()
 
+    def peek(self, k=1):
+        """Return the k-th token after the current token."""
+        return self.lexer.peek_token(k)
+
     def error(self):
-        raise Exception('Invalid syntax')
+        # the last token taken from the lookahead buffer is the current
+        # one
+        raise Exception('Invalid syntax at %s: unexpected %s' % (
+            describe_position(self.lexer, self.lexer.token_start),
+            self.current_token,
+        ))
 
     def eat(self, token_type):
         # compare the current token type with the passed token
@@ -323,21 +1226,22 @@ class Parser(object):
 
     def program(self):
         """program : PROGRAM variable SEMI block DOT"""
+        pos = self.lexer.token_start
         self.eat(PROGRAM)
         var_node = self.variable()
         prog_name = var_node.value
         self.eat(SEMI)
         block_node = self.block()
-        program_node = Program(prog_name, block_node)
+        program_node = Program(prog_name, block_node, pos)
         self.eat(DOT)
         return program_node
 
     def block(self):
         """block : declarations compound_statement"""
+        pos = self.lexer.token_start
         declaration_nodes = self.declarations()
         compound_statement_node = self.compound_statement()
-        node = Block(declaration_nodes, compound_statement_node)
-        return node
+        return Block(declaration_nodes, compound_statement_node, pos)
 
     def declarations(self):
         """declarations : (VAR (variable_declaration SEMI)+)*
@@ -355,57 +1259,68 @@ class Parser(object):
                     self.eat(SEMI)
 
             elif self.current_token.type == PROCEDURE:
-                self.eat(PROCEDURE)
-                proc_name = self.current_token.value
-                self.eat(ID)
-                params = []
-
-                if self.current_token.type == LPAREN:
-                    self.eat(LPAREN)
-
-                    params = self.formal_parameter_list()
-
-                    self.eat(RPAREN)
-
-                self.eat(SEMI)
-                block_node = self.block()
-                proc_decl = ProcedureDecl(proc_name, params, block_node)
-                declarations.append(proc_decl)
+                declarations.append(self.procedure_declaration())
                 self.eat(SEMI)
             else:
                 break
 
         return declarations
 
+    def procedure_declaration(self):
+        """procedure_declaration :
+               PROCEDURE ID (LPAREN formal_parameter_list RPAREN)? SEMI block
+        """
+        pos = self.lexer.token_start
+        self.eat(PROCEDURE)
+        proc_name = self.current_token.value
+        self.eat(ID)
+        params = self.procedure_parameters()
+        self.eat(SEMI)
+        block_node = self.procedure_block()
+        return ProcedureDecl(proc_name, params, block_node, pos)
+
+    def procedure_block(self):
+        """The block of a procedure declaration."""
+        return self.block()
+
     def formal_parameters(self):
         """ formal_parameters : ID (COMMA ID)* COLON type_spec """
         param_nodes = []
 
-        param_tokens = [self.current_token]
-        self.eat(ID)
+        var_nodes = [self.variable()]
         while self.current_token.type == COMMA:
             self.eat(COMMA)
-            param_tokens.append(self.current_token)
-            self.eat(ID)
+            var_nodes.append(self.variable())
 
         self.eat(COLON)
         type_node = self.type_spec()
 
-        for param_token in param_tokens:
-            param_node = Param(Var(param_token), type_node)
+        for var_node in var_nodes:
+            param_node = Param(var_node, type_node, var_node.pos)
             param_nodes.append(param_node)
 
         return param_nodes
 
 
+    def procedure_parameters(self):
+        """(LPAREN formal_parameter_list? RPAREN)?"""
+        if self.current_token.type != LPAREN:
+            return []
+        # procedure Foo();
+        if self.peek().type == RPAREN:
+            self.eat(LPAREN)
+            self.eat(RPAREN)
+            return []
+
+        self.eat(LPAREN)
+        params = self.formal_parameter_list()
+        self.eat(RPAREN)
+        return params
+
     def formal_parameter_list(self):
         """ formal_parameter_list : formal_parameters
                                   | formal_parameters SEMI formal_parameter_list
         """
-        # procedure Foo();
-        if not self.current_token.type == ID:
-            return []
-
         param_nodes = self.formal_parameters()
 
         while self.current_token.type == SEMI:
@@ -417,21 +1332,19 @@ class Parser(object):
 
     def variable_declaration(self):
         """variable_declaration : ID (COMMA ID)* COLON type_spec"""
-        var_nodes = [Var(self.current_token)]  # first ID
-        self.eat(ID)
+        var_nodes = [self.variable()]  # first ID
 
         while self.current_token.type == COMMA:
             self.eat(COMMA)
-            var_nodes.append(Var(self.current_token))
-            self.eat(ID)
+            var_nodes.append(self.variable())
 
         self.eat(COLON)
 
         type_node = self.type_spec()
-        var_declarations = [
-            VarDecl(var_node, type_node)
-            for var_node in var_nodes
-        ]
+        var_declarations = []
+        for var_node in var_nodes:
+            var_decl = VarDecl(var_node, type_node, var_node.pos)
+            var_declarations.append(var_decl)
         return var_declarations
 
     def type_spec(self):
@@ -439,22 +1352,23 @@ class Parser(object):
                      | REAL
         """
         token = self.current_token
+        pos = self.lexer.token_start
         if self.current_token.type == INTEGER:
             self.eat(INTEGER)
         else:
             self.eat(REAL)
-        node = Type(token)
-        return node
+        return Type(token, pos)
 
     def compound_statement(self):
         """
         compound_statement: BEGIN statement_list END
         """
+        pos = self.lexer.token_start
         self.eat(BEGIN)
         nodes = self.statement_list()
         self.eat(END)
 
-        root = Compound()
+        root = Compound(pos)
         for node in nodes:
             root.children.append(node)
 
@@ -497,20 +1411,20 @@ class Parser(object):
         token = self.current_token
         self.eat(ASSIGN)
         right = self.expr()
-        node = Assign(left, token, right)
-        return node
+        return Assign(left, token, right, left.pos)
 
     def variable(self):
         """
         variable : ID
         """
-        node = Var(self.current_token)
+        token = self.current_token
+        pos = self.lexer.token_start
         self.eat(ID)
-        return node
+        return Var(token, pos)
 
     def empty(self):
         """An empty production"""
-        return NoOp()
+        return NoOp(self.lexer.token_start)
 
     def expr(self):
         """
@@ -525,7 +1439,7 @@ class Parser(object):
             elif token.type == MINUS:
                 self.eat(MINUS)
 
-            node = BinOp(left=node, op=token, right=self.term())
+            node = BinOp(left=node, op=token, right=self.term(), pos=node.pos)
 
         return node
 
@@ -542,7 +1456,9 @@ class Parser(object):
             elif token.type == FLOAT_DIV:
                 self.eat(FLOAT_DIV)
 
-            node = BinOp(left=node, op=token, right=self.factor())
+            node = BinOp(
+                left=node, op=token, right=self.factor(), pos=node.pos
+            )
 
         return node
 
@@ -556,19 +1472,21 @@ class Parser(object):
         """
         token = self.current_token
         if token.type == PLUS:
+            pos = self.lexer.token_start
             self.eat(PLUS)
-            node = UnaryOp(token, self.factor())
-            return node
+            return UnaryOp(token, self.factor(), pos)
         elif token.type == MINUS:
+            pos = self.lexer.token_start
             self.eat(MINUS)
-            node = UnaryOp(token, self.factor())
-            return node
+            return UnaryOp(token, self.factor(), pos)
         elif token.type == INTEGER_CONST:
+            pos = self.lexer.token_start
             self.eat(INTEGER_CONST)
-            return Num(token)
+            return Num(token, pos)
         elif token.type == REAL_CONST:
+            pos = self.lexer.token_start
             self.eat(REAL_CONST)
-            return Num(token)
+            return Num(token, pos)
         elif token.type == LPAREN:
             self.eat(LPAREN)
             node = self.expr()
@@ -630,6 +1548,422 @@ class Parser(object):
         return node
 
 
+# Binding powers of the binary operators: an operator takes the operand on
+# its right away from an operator with a lower binding power. All binary
+# operators are left-associative.
+BINDING_POWERS = {
+    PLUS: 10,
+    MINUS: 10,
+    MUL: 20,
+    INTEGER_DIV: 20,
+    FLOAT_DIV: 20,
+}
+
+# BINDING_POWERS indexed by token type, 0 for tokens that are not binary
+# operators
+INFIX_POWERS = tuple(
+    BINDING_POWERS.get(type, 0) for type in range(len(TOKEN_TYPE_NAMES))
+)
+
+# unary plus and minus bind tighter than any binary operator: -a * b is
+# (-a) * b
+PREFIX_BINDING_POWER = 30
+
+
+class PrattParser(Parser):
+    """Parser whose expressions are parsed by binding power (Pratt).
+
+    expr, term and factor cost three Python calls per operand; here an
+    operand costs one, and a new operator only needs an entry in
+    BINDING_POWERS instead of another grammar level. Builds the same
+    trees as Parser.
+    """
+    def expr(self, min_power=0):
+        """
+        expr : prefix (infix expr)*
+
+        where the loop only takes operators that bind tighter than
+        `min_power`
+        """
+        token = self.current_token
+        type = token.type
+        get_next_token = self.lexer.get_next_token
+        # leaves are the bulk of the work: build them without going
+        # through eat() and variable()
+        if type == ID:
+            node = Var(token, self.lexer.token_start)
+            self.current_token = get_next_token()
+        elif type == INTEGER_CONST or type == REAL_CONST:
+            node = Num(token, self.lexer.token_start)
+            self.current_token = get_next_token()
+        elif type == LPAREN:
+            self.eat(LPAREN)
+            node = self.expr()
+            self.eat(RPAREN)
+        elif type == PLUS or type == MINUS:
+            pos = self.lexer.token_start
+            self.eat(type)
+            node = UnaryOp(token, self.expr(PREFIX_BINDING_POWER), pos)
+        else:
+            self.error()
+
+        powers = INFIX_POWERS
+        token = self.current_token
+        power = powers[token.type]
+        while power > min_power:
+            self.current_token = get_next_token()
+            node = BinOp(
+                left=node, op=token, right=self.expr(power), pos=node.pos
+            )
+            token = self.current_token
+            power = powers[token.type]
+        return node
+
+
+class StackParser(Parser):
+    """Parser that keeps nesting on explicit stacks instead of the call stack.
+
+    Parser recurses once per parenthesis, BEGIN and PROCEDURE level (three
+    times per parenthesis), so deep nesting hits the recursion limit.
+    block(), compound_statement() and expr() are rewritten here as loops
+    over lists of open constructs; everything they call is flat, so any
+    nesting depth parses in constant Python stack. Builds the same trees
+    as Parser.
+    """
+    def block(self):
+        """block : declarations compound_statement
+
+        A nested procedure pushes the enclosing block's state and starts
+        its own block; when the nested block ends, the ProcedureDecl is
+        added to the enclosing declarations and parsing resumes there.
+        """
+        # (block pos, declarations, procedure pos, name, params) of the
+        # blocks enclosing the current one
+        enclosing = []
+        block_pos = self.lexer.token_start
+        declarations = []
+
+        while True:
+            if self.current_token.type == VAR:
+                self.eat(VAR)
+                while self.current_token.type == ID:
+                    declarations.extend(self.variable_declaration())
+                    self.eat(SEMI)
+                continue
+
+            if self.current_token.type == PROCEDURE:
+                proc_pos = self.lexer.token_start
+                self.eat(PROCEDURE)
+                proc_name = self.current_token.value
+                self.eat(ID)
+                params = self.procedure_parameters()
+                self.eat(SEMI)
+                enclosing.append(
+                    (block_pos, declarations, proc_pos, proc_name, params)
+                )
+                block_pos = self.lexer.token_start
+                declarations = []
+                continue
+
+            node = Block(declarations, self.compound_statement(), block_pos)
+            if not enclosing:
+                return node
+
+            block_pos, declarations, proc_pos, proc_name, params = (
+                enclosing.pop()
+            )
+            proc_decl = ProcedureDecl(proc_name, params, node, proc_pos)
+            declarations.append(proc_decl)
+            self.eat(SEMI)
+
+    def compound_statement(self):
+        """compound_statement : BEGIN statement_list END
+
+        Open Compound nodes are kept on a list; a nested BEGIN appends a
+        new one and the matching END pops it.
+        """
+        pos = self.lexer.token_start
+        self.eat(BEGIN)
+        root = Compound(pos)
+        compounds = [root]
+
+        while True:
+            # statement
+            if self.current_token.type == BEGIN:
+                node = Compound(self.lexer.token_start)
+                self.eat(BEGIN)
+                compounds[-1].children.append(node)
+                compounds.append(node)
+                continue
+            elif self.current_token.type == ID:
+                compounds[-1].children.append(self.assignment_statement())
+            else:
+                compounds[-1].children.append(self.empty())
+
+            # SEMI statement, or END of one or more compound statements
+            while self.current_token.type != SEMI:
+                self.eat(END)
+                compounds.pop()
+                if not compounds:
+                    return root
+            self.eat(SEMI)
+
+    def expr(self):
+        """expr : term ((PLUS | MINUS) term)*
+
+        Operator precedence parsing: operands and pending operators are
+        kept on two lists. An open parenthesis is a pending operator with
+        binding power 0, so nothing is reduced past it before its RPAREN.
+        """
+        operands = []
+        # (binding power, token, pos of a unary operator or None)
+        operators = []
+        get_next_token = self.lexer.get_next_token
+
+        while True:
+            # prefix operators and open parentheses, then an operand
+            token = self.current_token
+            type = token.type
+            while type == PLUS or type == MINUS or type == LPAREN:
+                if type == LPAREN:
+                    operators.append((0, token, None))
+                else:
+                    operators.append(
+                        (PREFIX_BINDING_POWER, token, self.lexer.token_start)
+                    )
+                self.current_token = token = get_next_token()
+                type = token.type
+
+            if type == ID:
+                node = Var(token, self.lexer.token_start)
+            elif type == INTEGER_CONST or type == REAL_CONST:
+                node = Num(token, self.lexer.token_start)
+            else:
+                self.error()
+            self.current_token = get_next_token()
+            operands.append(node)
+
+            # closing parentheses, then a binary operator or the end
+            while True:
+                token = self.current_token
+                power = INFIX_POWERS[token.type]
+                # reduce what binds at least as tightly as this operator;
+                # anything else reduces up to the innermost parenthesis
+                min_power = power or 1
+                while operators and operators[-1][0] >= min_power:
+                    self._reduce(operands, operators.pop())
+
+                if power:
+                    operators.append((power, token, None))
+                    self.current_token = get_next_token()
+                    break
+                if not operators:
+                    return operands[0]
+                # only the innermost open parenthesis is left on top
+                self.eat(RPAREN)
+                operators.pop()
+
+    @staticmethod
+    def _reduce(operands, operator):
+        power, token, pos = operator
+        if pos is not None:
+            node = UnaryOp(token, operands.pop(), pos)
+        else:
+            right = operands.pop()
+            left = operands.pop()
+            node = BinOp(left=left, op=token, right=right, pos=left.pos)
+        operands.append(node)
+
+
+class HashConsParser(PrattParser):
+    """Parser that shares structurally identical expression subtrees.
+
+    Num, Var, BinOp and UnaryOp nodes have no side effects, so an
+    expression that was already built is reused instead of built again:
+    `a + b` written ten times in one block is one BinOp node, and the
+    tree becomes a DAG. Vars are shared only within the block that uses
+    them, so a name never stands for two different variables. A shared
+    node keeps the position of its first occurrence. The target of an
+    assignment is never shared.
+
+    After parse(), `expression_nodes` is the number of expression nodes
+    the source describes and `unique_nodes` the number actually built.
+    """
+    def __init__(self, lexer):
+        super(HashConsParser, self).__init__(lexer)
+        # structural key -> node; keys of inner nodes use the ids of
+        # their (already shared) children
+        self.shared = {}
+        self.scopes = [0]
+        self.scope_count = 0
+        self.expression_nodes = 0
+        self.unique_nodes = 0
+
+    def block(self):
+        self.scope_count += 1
+        self.scopes.append(self.scope_count)
+        node = super(HashConsParser, self).block()
+        self.scopes.pop()
+        return node
+
+    def _share(self, key, make):
+        self.expression_nodes += 1
+        node = self.shared.get(key)
+        if node is None:
+            node = self.shared[key] = make()
+        return node
+
+    def expr(self, min_power=0):
+        """
+        expr : prefix (infix expr)*
+
+        as in PrattParser, building each node through the shared table
+        """
+        token = self.current_token
+        type = token.type
+        pos = self.lexer.token_start
+        if type == ID:
+            self.eat(ID)
+            node = self._share(
+                ('Var', self.scopes[-1], token.value),
+                lambda: Var(token, pos),
+            )
+        elif type == INTEGER_CONST or type == REAL_CONST:
+            self.eat(type)
+            value = token.value
+            # 1 == 1.0, so the key includes the value's type
+            node = self._share(
+                ('Num', value.__class__, value), lambda: Num(token, pos)
+            )
+        elif type == LPAREN:
+            self.eat(LPAREN)
+            node = self.expr()
+            self.eat(RPAREN)
+        elif type == PLUS or type == MINUS:
+            self.eat(type)
+            expr = self.expr(PREFIX_BINDING_POWER)
+            node = self._share(
+                ('UnaryOp', type, id(expr)),
+                lambda: UnaryOp(token, expr, pos),
+            )
+        else:
+            self.error()
+
+        while True:
+            token = self.current_token
+            power = INFIX_POWERS[token.type]
+            if power <= min_power:
+                return node
+            self.eat(token.type)
+            left = node
+            right = self.expr(power)
+            node = self._share(
+                ('BinOp', token.type, id(left), id(right)),
+                lambda: BinOp(left, token, right, left.pos),
+            )
+
+    def parse(self):
+        node = super(HashConsParser, self).parse()
+        self.unique_nodes = len(self.shared)
+        # the table is only needed while parsing
+        self.shared = {}
+        return node
+
+
+# The words that open and close blocks, and comments that may hide them.
+# An identifier character next to a word makes it part of a longer name.
+SKIM_REGEX = re.compile(
+    r'\{[^}]*\}?|(?<![^\W_])(BEGIN|END|PROCEDURE)(?![^\W_])', re.IGNORECASE
+)
+
+
+def skim_block(text, pos):
+    """Return the offset just past the block that starts at `pos`.
+
+    Only BEGIN, END and PROCEDURE are looked at: every PROCEDURE opens a
+    block, and a block ends with the END that closes its compound
+    statement, i.e. the END that brings BEGIN nesting back to zero. The
+    block at `pos` is an open procedure block too. Returns None if the
+    text ends first.
+    """
+    blocks = 1
+    depth = 0
+    for match in SKIM_REGEX.finditer(text, pos):
+        word = match.group(1)
+        if word is None:
+            continue
+        word = word.upper()
+        if word == 'BEGIN':
+            depth += 1
+        elif word == 'PROCEDURE':
+            blocks += 1
+        else:
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                blocks -= 1
+                if blocks == 0:
+                    return match.end()
+    return None
+
+
+class LazyParser(Parser):
+    """Parser that leaves procedure bodies unparsed until they are needed.
+
+    A procedure's block is only skimmed for its end (see skim_block) and
+    stored as a LazyBlock; ProcedureDecl.block_node parses it, with a
+    LazyParser again, the first time it is read. Syntax errors inside a
+    body are therefore raised when the body is first used. Works on the
+    source text itself, lexed with RegexLexer, because lexing has to
+    resume after each skimmed body.
+    """
+    # the lexer is replaced after each body; fetch no tokens past it
+    lookahead_batch = 1
+
+    def __init__(self, text, pos=0, endpos=None):
+        lexer = RegexLexer(text, pos, endpos)
+        super(LazyParser, self).__init__(lexer)
+        self.text = text
+        self.endpos = lexer.endpos
+
+    def procedure_block(self):
+        start = self.lexer.token_start
+        end = skim_block(self.text, start)
+        if end is None or end > self.endpos:
+            # unbalanced: parse it now to report the error where it is
+            return self.block()
+        # continue after the body with a lexer of its own
+        self.lexer = TokenLookahead(
+            RegexLexer(self.text, end, self.endpos),
+            batch=self.lookahead_batch,
+        )
+        self.current_token = self.lexer.get_next_token()
+        return LazyBlock(self.text, start, end)
+
+
+def parse_bodies(block):
+    """Parse every procedure body under `block`; return how many."""
+    count = 0
+    blocks = [block]
+    while blocks:
+        block = blocks.pop()
+        for decl in block.declarations:
+            if isinstance(decl, ProcedureDecl):
+                blocks.append(decl.block_node)
+                count += 1
+    return count
+
+
+# Parser engines, selectable from the command line
+PARSERS = {
+    'recursive': Parser,
+    'pratt': PrattParser,
+    'stack': StackParser,
+    'hashcons': HashConsParser,
+}
+
+
 ###############################################################################
 #                                                                             #
 #  AST visitors (walkers)                                                     #
@@ -637,10 +1971,39 @@ class Parser(object):
 ###############################################################################
 
 class NodeVisitor(object):
+    """Calls visit_<node class name>(node) for visit(node).
+
+    Each visitor class keeps a table from node class to method, filled
+    the first time the class meets each kind of node, so visiting costs
+    one dictionary lookup. A node class with no method of its own uses
+    the method for the nearest base class that has one (so node
+    subclasses dispatch like their bases), and generic_visit() if there
+    is none. ArenaParser's views are named after the node classes and
+    dispatch like them. Methods are looked up on the
+    class: assigning a visit_ method to an instance has no effect.
+    """
+    _visit_table = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._visit_table = {}
+
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        method = self._visit_table.get(type(node))
+        if method is None:
+            method = self._dispatch(type(node))
+        return method(self, node)
+
+    @classmethod
+    def _dispatch(cls, node_class):
+        for klass in node_class.__mro__:
+            method = getattr(cls, 'visit_' + klass.__name__, None)
+            if method is not None:
+                break
+        else:
+            method = cls.generic_visit
+        cls._visit_table[node_class] = method
+        return method
 
     def generic_visit(self, node):
         raise Exception('No visit_{} method'.format(type(node).__name__))
@@ -899,22 +2262,22 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_BinOp(self, node):
-        if node.op.type == PLUS:
+        if node.op == PLUS:
             return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == MINUS:
+        elif node.op == MINUS:
             return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == MUL:
+        elif node.op == MUL:
             return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == INTEGER_DIV:
+        elif node.op == INTEGER_DIV:
             return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == FLOAT_DIV:
+        elif node.op == FLOAT_DIV:
             return float(self.visit(node.left)) / float(self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value
 
     def visit_UnaryOp(self, node):
-        op = node.op.type
+        op = node.op
         if op == PLUS:
             return +self.visit(node.expr)
         elif op == MINUS:
@@ -948,12 +2311,66 @@ class Interpreter(NodeVisitor):
 
 
 def main():
-    import sys
-    text = open(sys.argv[1], 'r').read()
-
-    lexer = Lexer(text)
-    parser = Parser(lexer)
-    tree = parser.parse()
+    import argparse
+    argparser = argparse.ArgumentParser(
+        description='Simple Pascal Interpreter.'
+    )
+    argparser.add_argument(
+        'fname',
+        help='Pascal source file'
+    )
+    argparser.add_argument(
+        '--lexer',
+        choices=sorted(LEXERS) + ['bytes', 'numpy', 'parallel', 'stream'],
+        default='stream',
+        help='lexer engine; "stream" lexes a memory-mapped file in chunks, '
+             '"bytes" lexes a memory-mapped ASCII file without decoding it, '
+             '"numpy" classifies characters in bulk, "parallel" lexes '
+             'chunks on all cores (default: stream)'
+    )
+    argparser.add_argument(
+        '--parser',
+        choices=sorted(PARSERS) + ['arena', 'lazy', 'll1', 'parallel'],
+        default='recursive',
+        help='parser engine; "pratt" parses expressions by operator '
+             'binding power, "stack" handles any nesting depth, "arena" '
+             'stores the tree in flat arrays, "hashcons" shares repeated '
+             'subexpressions, "lazy" parses procedure bodies on first use, '
+             '"ll1" is driven by a generated LL(1) table, "parallel" parses '
+             'procedure bodies on all cores (default: recursive)'
+    )
+    argparser.add_argument(
+        '--engine',
+        choices=['closures', 'python', 'tree'],
+        default='tree',
+        help='execution engine; "tree" walks the AST, "closures" compiles '
+             'it into nested Python closures first, "python" compiles it '
+             'into Python bytecode (default: tree)'
+    )
+    argparser.add_argument(
+        '--cache-dir',
+        help='where parsed programs are cached (default: __spicache__ '
+             'next to the source file)'
+    )
+    argparser.add_argument(
+        '--cache-size',
+        type=int,
+        default=64,
+        help='cache size limit in MB; least recently used entries are '
+             'evicted (default: 64)'
+    )
+    argparser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='always lex and parse, bypassing the cache; the arena, '
+             'hashcons and lazy parsers always do'
+    )
+    args = argparser.parse_args()
+    tree = load_tree(args)
+    if args.parser == 'lazy':
+        # syntax errors in the bodies are errors in the program, not
+        # semantic errors to report and run past
+        parse_bodies(tree.block)
 
     semantic_analyzer = SemanticAnalyzer()
     try:
@@ -961,7 +2378,14 @@ def main():
     except Exception as e:
         print(e)
 
-    interpreter = Interpreter(tree)
+    if args.engine == 'closures':
+        from closures import ClosureInterpreter
+        interpreter = ClosureInterpreter(tree)
+    elif args.engine == 'python':
+        from pybackend import PythonInterpreter
+        interpreter = PythonInterpreter(tree)
+    else:
+        interpreter = Interpreter(tree)
     result = interpreter.interpret()
     print('')
     print('Run-time GLOBAL_MEMORY contents:')
@@ -969,6 +2393,88 @@ def main():
         print('%s = %s' % (k, v))
 
 
+# parsers whose trees the cache would not give back: it stores plain
+# node trees, and serializing a lazy tree would parse every body
+UNCACHED_PARSERS = ('arena', 'hashcons', 'lazy')
+
+# lexer and parser engines that live outside this file, by module; the
+# source of the ones used is part of the cache key
+ENGINE_MODULES = {
+    'numpy': 'nplexer',
+    'll1': 'll1',
+    'parallel': 'parallel',
+}
+
+
+def load_tree(args):
+    """Return the tree of args.fname, from the parse cache if enabled."""
+    if args.no_cache or args.parser in UNCACHED_PARSERS:
+        return parse_file(args)
+    import importlib
+    import os
+    from parsecache import DEFAULT_CACHE_DIR, ParseCache, cached_parse
+    cache_dir = args.cache_dir or os.path.join(
+        os.path.dirname(os.path.abspath(args.fname)), DEFAULT_CACHE_DIR
+    )
+    cache = ParseCache(cache_dir, args.cache_size * 1024 * 1024)
+    modules = sorted(set(
+        importlib.import_module(ENGINE_MODULES[engine]).__file__
+        for engine in (args.lexer, args.parser) if engine in ENGINE_MODULES
+    ))
+    return cached_parse(
+        cache, cache.file_key(args.fname, args.parser, modules=modules),
+        lambda: parse_file(args)
+    )
+
+
+def parse_file(args):
+    """Lex and parse args.fname with the engines chosen in `args`."""
+    if args.parser == 'lazy':
+        # lexes the text itself, resuming after each skipped body
+        text = open(args.fname, 'r').read()
+        return LazyParser(text).parse()
+    if args.parser == 'parallel':
+        from parallel import parse_parallel
+        text = open(args.fname, 'r').read()
+        return parse_parallel(text)
+    if args.lexer == 'numpy':
+        from nplexer import numpy_lexer
+        text = open(args.fname, 'r').read()
+        lexer = numpy_lexer(text)
+    elif args.lexer == 'parallel':
+        from parallel import parallel_lexer
+        text = open(args.fname, 'r').read()
+        lexer = parallel_lexer(text)
+    elif args.lexer in ('bytes', 'stream'):
+        import io
+        import mmap
+        import os
+        with open(args.fname, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap cannot map an empty file
+                source = b''
+            else:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if args.lexer == 'bytes':
+            lexer = ByteLexer(source)
+        elif isinstance(source, bytes):
+            lexer = StreamLexer(io.BytesIO(source))
+        else:
+            lexer = StreamLexer(source)
+    else:
+        text = open(args.fname, 'r').read()
+        lexer = LEXERS[args.lexer](text)
+    if args.parser == 'arena':
+        from arena import ArenaParser
+        parser = ArenaParser(lexer)
+    elif args.parser == 'll1':
+        from ll1 import LL1Parser
+        parser = LL1Parser(lexer)
+    else:
+        parser = PARSERS[args.parser](lexer)
+    return parser.parse()
+
+
 if __name__ == '__main__':
     main()
 
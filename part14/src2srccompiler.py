@@ -120,7 +120,7 @@ class SourceToSourceCompiler(NodeVisitor):
     def visit_BinOp(self, node):
         t1 = self.visit(node.left)
         t2 = self.visit(node.right)
-        return '%s %s %s' % (t1, node.op.value, t2)
+        return '%s %s %s' % (t1, node.token.value, t2)
 
     def visit_ProcedureDecl(self, node):
         proc_name = node.proc_name
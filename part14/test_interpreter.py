@@ -0,0 +1,1735 @@
+import glob
+import os
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_sources():
+    for fname in sorted(glob.glob(os.path.join(HERE, '*.pas'))):
+        with open(fname) as f:
+            yield fname, f.read()
+
+
+def token_stream(lexer):
+    from spi import EOF
+    tokens = []
+    while True:
+        token = lexer.get_next_token()
+        tokens.append((token.type, token.value))
+        if token.type == EOF:
+            return tokens
+
+
+def dump_tree(node):
+    """Return a nested tuple of the node's class and fields, for comparing
+    trees built by different parsers (node objects or arena views)."""
+    import spi
+    from arena import ArenaNode
+    if isinstance(node, list):
+        return [dump_tree(child) for child in node]
+    if not isinstance(node, (spi.AST, ArenaNode)):
+        return node
+    # a leading underscore marks a slot behind a property of that name
+    fields = sorted(
+        name.lstrip('_') for cls in getattr(spi, type(node).__name__).__mro__
+        for name in getattr(cls, '__slots__', ())
+    )
+    return (type(node).__name__,) + tuple(
+        (name, dump_tree(getattr(node, name))) for name in fields
+    )
+
+
+class TokenTestCase(unittest.TestCase):
+    def test_str_uses_type_name(self):
+        from spi import Token, PLUS, INTEGER_CONST
+        self.assertEqual(str(Token(PLUS, '+')), "Token(PLUS, '+')")
+        self.assertEqual(repr(Token(INTEGER_CONST, 3)), 'Token(INTEGER_CONST, 3)')
+
+    def test_string_type_names_are_accepted(self):
+        from spi import Token, PLUS
+        token = Token('PLUS', '+')
+        self.assertEqual(token.type, PLUS)
+        self.assertEqual(token.type_name, 'PLUS')
+
+    def test_punctuation_tokens_are_shared(self):
+        from spi import Lexer
+        lexer = Lexer('; ;')
+        self.assertIs(lexer.get_next_token(), lexer.get_next_token())
+
+
+class SpanTokenTestCase(unittest.TestCase):
+    def test_value_is_decoded_lazily(self):
+        from spi import SpanToken, INTEGER_CONST
+        token = SpanToken(INTEGER_CONST, 'x := 42;', 5, 7)
+        with self.assertRaises(AttributeError):
+            token._value
+        self.assertEqual(token.value, 42)
+        self.assertEqual(token._value, 42)
+
+    def test_lexers_produce_spans(self):
+        from spi import Lexer, RegexLexer, SpanToken
+        text = 'alpha := 3.5'
+        for lexer in (Lexer(text), RegexLexer(text)):
+            token = lexer.get_next_token()
+            self.assertIsInstance(token, SpanToken)
+            self.assertEqual((token.start, token.end), (0, 5))
+            lexer.get_next_token()
+            token = lexer.get_next_token()
+            self.assertEqual((token.start, token.end), (9, 12))
+            self.assertEqual(token.value, 3.5)
+
+    def test_bytes_input_uses_memoryview(self):
+        from spi import Lexer, RegexLexer
+        fname, text = next(sample_sources())
+        lexer = RegexLexer(text.encode('ascii'))
+        self.assertEqual(token_stream(lexer), token_stream(Lexer(text)))
+        token = RegexLexer(b'alpha').get_next_token()
+        self.assertIsInstance(token.source, memoryview)
+        self.assertEqual(token.value, 'alpha')
+
+
+class RegexLexerTestCase(unittest.TestCase):
+    def assertSameTokens(self, text):
+        from spi import Lexer, RegexLexer
+        self.assertEqual(
+            token_stream(RegexLexer(text)),
+            token_stream(Lexer(text)),
+        )
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTokens(text)
+
+    def test_generated_program(self):
+        from benchmark import generate_source
+        self.assertSameTokens(generate_source(20000))
+
+    def test_numbers(self):
+        self.assertSameTokens('3 3.14 3. 10.5.x')
+
+    def test_keywords_are_case_insensitive(self):
+        self.assertSameTokens('Begin bEGIN end DIV div x1 X1')
+
+    def test_assign_and_colon(self):
+        self.assertSameTokens('a:=b:c :=: {c}')
+
+    def test_unicode_letters_and_digits(self):
+        import io
+        from spi import Lexer, RegexLexer, StreamLexer, tokenize_all
+
+        def tokens_or_error(make_lexer, text):
+            tokens = []
+            try:
+                tokens.extend(token_stream(make_lexer(text)))
+            except Exception as e:
+                tokens.append(str(e))
+            return tokens
+
+        lexers = [
+            RegexLexer,
+            lambda text: StreamLexer(io.StringIO(text), chunk_size=2),
+            lambda text: tokenize_all(text).cursor(),
+        ]
+        # letters start identifiers, any alphanumeric continues them, and
+        # only decimal digits make numbers: '²', '½' and 'ⅷ' start nothing
+        for text in ('x := a² + a½ + é1 + ٣ + x٣', '²', '½', 'ⅷ', '1²',
+                     'x := ²'):
+            expected = tokens_or_error(Lexer, text)
+            for make_lexer in lexers:
+                with self.subTest(text=text, lexer=make_lexer):
+                    actual = tokens_or_error(make_lexer, text)
+                    if make_lexer is lexers[-1] and len(actual) == 1:
+                        # tokenize_all lexes everything before returning
+                        # any token, so only the error is left
+                        actual = expected[:-1] + actual
+                    self.assertEqual(actual, expected)
+
+    def test_invalid_character(self):
+        from spi import RegexLexer
+        lexer = RegexLexer('x := 1 ? 2')
+        with self.assertRaises(Exception):
+            token_stream(lexer)
+
+    def test_eof_is_repeated(self):
+        from spi import RegexLexer, EOF
+        lexer = RegexLexer('x')
+        lexer.get_next_token()
+        self.assertEqual(lexer.get_next_token().type, EOF)
+        self.assertEqual(lexer.get_next_token().type, EOF)
+
+
+class StreamLexerTestCase(unittest.TestCase):
+    def assertSameTokens(self, text, chunk_sizes=(1, 2, 3, 7, 64)):
+        import io
+        from spi import Lexer, StreamLexer
+        expected = token_stream(Lexer(text))
+        for chunk_size in chunk_sizes:
+            with self.subTest(chunk_size=chunk_size):
+                lexer = StreamLexer(io.StringIO(text), chunk_size=chunk_size)
+                self.assertEqual(token_stream(lexer), expected)
+                data = io.BytesIO(text.encode('utf-8'))
+                lexer = StreamLexer(data, chunk_size=chunk_size)
+                self.assertEqual(token_stream(lexer), expected)
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTokens(text)
+
+    def test_tokens_straddling_chunks(self):
+        self.assertSameTokens('alpha:=12345.678;beta:gamma', (2, 3, 5))
+
+    def test_comment_straddling_chunks(self):
+        self.assertSameTokens('a {' + 'x' * 100 + '} := b', (4, 16, 64))
+
+    def test_multibyte_characters(self):
+        self.assertSameTokens('{ \u00e9t\u00e9 } x := 1')
+
+    def test_mmap(self):
+        import mmap
+        import tempfile
+        from spi import Lexer, StreamLexer
+        fname, text = next(sample_sources())
+        with tempfile.TemporaryFile() as f:
+            f.write(text.encode('utf-8'))
+            f.flush()
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            lexer = StreamLexer(source, chunk_size=16)
+            self.assertEqual(token_stream(lexer), token_stream(Lexer(text)))
+            source.close()
+
+    def test_unterminated_comment(self):
+        import io
+        from spi import StreamLexer
+        lexer = StreamLexer(io.StringIO('x { never closed'), chunk_size=4)
+        with self.assertRaises(Exception):
+            token_stream(lexer)
+
+    def test_main_reads_empty_file(self):
+        import argparse
+        import os
+        import tempfile
+        from spi import parse_file
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'empty.pas')
+            open(fname, 'w').close()
+            for lexer in ('stream', 'bytes', 'regex'):
+                args = argparse.Namespace(
+                    fname=fname, lexer=lexer, parser='recursive'
+                )
+                with self.subTest(lexer=lexer):
+                    with self.assertRaisesRegex(
+                        Exception, 'line 1, column 1: unexpected '
+                                   'Token\\(EOF'
+                    ):
+                        parse_file(args)
+
+
+class ByteLexerTestCase(unittest.TestCase):
+    def assertSameTokens(self, text, encoding='ascii'):
+        from spi import ByteLexer, Lexer
+        self.assertEqual(
+            token_stream(ByteLexer(text.encode(encoding), encoding)),
+            token_stream(Lexer(text)),
+        )
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTokens(text)
+
+    def test_numbers_and_assign(self):
+        self.assertSameTokens('x:=3.14 + 10. - y1 : z := 2DIV 1.2.3')
+
+    def test_identifiers_are_not_decoded_until_read(self):
+        from spi import ByteLexer, SpanToken
+        lexer = ByteLexer(b'alpha := beta')
+        token = lexer.get_next_token()
+        self.assertIsInstance(token, SpanToken)
+        self.assertIsInstance(token.source, memoryview)
+        self.assertEqual(token.value, 'alpha')
+
+    def test_latin_1(self):
+        self.assertSameTokens('{ \u00e9t\u00e9 } \u00e9l\u00e8ve := 1', 'latin-1')
+
+    def test_non_ascii_is_invalid_in_ascii_mode(self):
+        from spi import ByteLexer
+        lexer = ByteLexer('x := \u00e9'.encode('latin-1'))
+        with self.assertRaisesRegex(Exception, 'line 1, column 6'):
+            token_stream(lexer)
+
+    def test_unterminated_comment(self):
+        from spi import ByteLexer
+        with self.assertRaises(Exception):
+            token_stream(ByteLexer(b'x { never closed'))
+
+
+class TokenBufferTestCase(unittest.TestCase):
+    def test_sample_programs(self):
+        from spi import Lexer, tokenize_all
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                buffer = tokenize_all(text)
+                self.assertEqual(
+                    token_stream(buffer.cursor()),
+                    token_stream(Lexer(text)),
+                )
+
+    def test_columns(self):
+        from spi import tokenize_all, ID, ASSIGN, REAL_CONST, INTEGER_DIV, EOF
+        buffer = tokenize_all('x := 3.5 div 2')
+        self.assertEqual(buffer.types.typecode, 'i')
+        self.assertEqual(buffer.starts.typecode, 'q')
+        self.assertEqual(
+            list(buffer.types)[:4], [ID, ASSIGN, REAL_CONST, INTEGER_DIV]
+        )
+        self.assertEqual(list(buffer.starts), [0, 2, 5, 9, 13, 14])
+        self.assertEqual(list(buffer.lengths), [1, 2, 3, 3, 1, 0])
+        self.assertEqual(buffer.value(2), 3.5)
+        self.assertEqual(buffer.value(3), 'DIV')
+        self.assertEqual(buffer.types[-1], EOF)
+
+    def test_parser_accepts_buffer(self):
+        from spi import Parser, Interpreter, tokenize_all
+        fname, text = next(sample_sources())
+        tree = Parser(tokenize_all(text)).parse()
+        Interpreter(tree).interpret()
+
+
+class TokenLookaheadTestCase(unittest.TestCase):
+    TEXT = 'procedure P(a : integer); begin a := (a + 1) * 2 end'
+
+    def positioned_stream(self, lexer):
+        from spi import EOF
+        tokens = []
+        while True:
+            token = lexer.get_next_token()
+            tokens.append((token.type, token.value, lexer.token_start))
+            if token.type == EOF:
+                return tokens
+
+    def test_same_tokens_and_offsets(self):
+        import io
+        from spi import (
+            Lexer, RegexLexer, ByteLexer, StreamLexer, TokenLookahead,
+        )
+        expected = self.positioned_stream(Lexer(self.TEXT))
+        lexers = {
+            'char': lambda: Lexer(self.TEXT),
+            'regex': lambda: RegexLexer(self.TEXT),
+            'bytes': lambda: ByteLexer(self.TEXT.encode('ascii')),
+            'stream': lambda: StreamLexer(
+                io.StringIO(self.TEXT), chunk_size=5
+            ),
+        }
+        for name, make_lexer in lexers.items():
+            for batch in (1, 3, 32):
+                with self.subTest(lexer=name, batch=batch):
+                    lookahead = TokenLookahead(
+                        make_lexer(), size=4, batch=batch
+                    )
+                    self.assertEqual(
+                        self.positioned_stream(lookahead), expected
+                    )
+
+    def test_peek(self):
+        from spi import RegexLexer, TokenLookahead, EOF
+        lookahead = TokenLookahead(RegexLexer(self.TEXT), size=4, batch=2)
+        self.assertEqual(lookahead.get_next_token().value, 'PROCEDURE')
+        self.assertEqual(lookahead.peek_token(1).value, 'P')
+        self.assertEqual(lookahead.peek_token(4).value, ':')
+        # peeking does not move the stream
+        self.assertEqual(lookahead.get_next_token().value, 'P')
+        self.assertEqual(lookahead.token_start, 10)
+        with self.assertRaises(Exception):
+            lookahead.peek_token(5)
+        for _ in range(20):
+            lookahead.get_next_token()
+        self.assertEqual(lookahead.peek_token(4).type, EOF)
+        self.assertEqual(lookahead.get_next_token().type, EOF)
+
+    def test_tokens_are_fetched_in_batches(self):
+        from spi import RegexLexer, TokenLookahead
+        lexer = RegexLexer(self.TEXT)
+        calls = []
+        get_tokens = lexer.get_tokens
+        lexer.get_tokens = lambda count: calls.append(count) or get_tokens(
+            count
+        )
+        lookahead = TokenLookahead(lexer, size=8, batch=8)
+        for _ in range(20):
+            lookahead.get_next_token()
+        self.assertEqual(calls, [8, 8, 8])
+
+    def test_errors_are_raised_in_source_order(self):
+        import io
+        from spi import (
+            Lexer, Parser, RegexLexer, StreamLexer, TokenLookahead,
+        )
+        lexers = {
+            'char': Lexer,
+            'regex': RegexLexer,
+            'stream': lambda text: StreamLexer(io.StringIO(text)),
+        }
+        # the syntax error comes first, the bad character later
+        text = 'program P;\nBEGIN x := := 1; y := 2 ? END.'
+        for name, make_lexer in lexers.items():
+            with self.subTest(lexer=name):
+                with self.assertRaisesRegex(
+                    Exception, 'Invalid syntax at line 2, column 12'
+                ):
+                    Parser(make_lexer(text)).parse()
+                # the tokens before a bad character are all returned
+                lookahead = TokenLookahead(make_lexer('x y ?'), batch=32)
+                self.assertEqual(lookahead.get_next_token().value, 'x')
+                self.assertEqual(lookahead.peek_token(1).value, 'y')
+                self.assertEqual(lookahead.get_next_token().value, 'y')
+                with self.assertRaisesRegex(
+                    Exception, 'Invalid character at line 1, column 5'
+                ):
+                    lookahead.get_next_token()
+
+    def test_parser_peek(self):
+        from spi import Parser, RegexLexer, tokenize_all, ID, COLON
+        for lexer in (RegexLexer(self.TEXT), tokenize_all(self.TEXT)):
+            parser = Parser(lexer)
+            parser.eat(parser.current_token.type)
+            self.assertEqual(parser.current_token.type, ID)
+            self.assertEqual(parser.peek(2).type, ID)
+            self.assertEqual(parser.peek(3).type, COLON)
+
+    def test_empty_parameter_list(self):
+        from spi import Lexer, Parser
+        tree = Parser(Lexer(
+            'program P; procedure Q(); begin end; begin end.'
+        )).parse()
+        self.assertEqual(tree.block.declarations[0].params, [])
+        with self.assertRaisesRegex(Exception, 'column 24: unexpected '
+                                               'Token\\(SEMI'):
+            Parser(Lexer(
+                'program P; procedure Q(; begin end; begin end.'
+            )).parse()
+
+
+@unittest.skipUnless(numpy, 'NumPy is not installed')
+class NumpyLexerTestCase(unittest.TestCase):
+    def assertSameTokens(self, text):
+        from spi import Lexer
+        from nplexer import numpy_lexer
+        self.assertEqual(
+            token_stream(numpy_lexer(text)),
+            token_stream(Lexer(text)),
+        )
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTokens(text)
+
+    def test_generated_program(self):
+        from benchmark import generate_source
+        self.assertSameTokens(generate_source(20000))
+
+    def test_numbers(self):
+        self.assertSameTokens('3 3.14 3. 1.2.3.4 12ab 1.5e x1.5 .5')
+
+    def test_keywords_and_assign(self):
+        self.assertSameTokens('Begin bEGIN x:=y::=z {a:=b} end DIV divx')
+
+    def test_bytes_input(self):
+        from spi import Lexer
+        from nplexer import numpy_lexer
+        fname, text = next(sample_sources())
+        self.assertEqual(
+            token_stream(numpy_lexer(text.encode('ascii'))),
+            token_stream(Lexer(text)),
+        )
+
+    def test_non_ascii_falls_back(self):
+        self.assertSameTokens('{ \u00e9t\u00e9 } x := 1')
+
+    def test_invalid_characters(self):
+        from nplexer import tokenize_all_numpy
+        for text in ('x = 1', 'x } y', 'x { y', 'a\n ?'):
+            with self.subTest(text=text):
+                with self.assertRaises(Exception):
+                    tokenize_all_numpy(text)
+
+
+class ParallelLexerTestCase(unittest.TestCase):
+    def test_split_points_are_safe(self):
+        from parallel import split_points
+        text = 'alpha {a comment with spaces} beta12 3.14 {x}y'
+        for parts in range(2, 12):
+            for point in split_points(text, parts):
+                with self.subTest(parts=parts, point=point):
+                    self.assertTrue(text[point].isspace())
+                    before = text[:point]
+                    self.assertGreaterEqual(before.rfind('}'), before.rfind('{'))
+
+    def test_same_buffer_as_tokenize_all(self):
+        from benchmark import generate_source
+        from parallel import tokenize_parallel
+        from spi import tokenize_all
+        text = generate_source(50000)
+        expected = tokenize_all(text)
+        buffer = tokenize_parallel(text, workers=3, min_chunk_size=10000)
+        self.assertEqual(buffer.types, expected.types)
+        self.assertEqual(buffer.starts, expected.starts)
+        self.assertEqual(buffer.lengths, expected.lengths)
+
+    def test_error_position_is_absolute(self):
+        from benchmark import generate_source
+        from parallel import tokenize_parallel
+        text = generate_source(30000) + '\n ?'
+        with self.assertRaisesRegex(Exception, 'column 2'):
+            tokenize_parallel(text, workers=2, min_chunk_size=10000)
+
+    def test_worker_failure_is_raised(self):
+        from unittest import mock
+        from concurrent.futures.process import BrokenProcessPool
+        from benchmark import generate_source
+        import parallel
+        text = generate_source(30000)
+
+        def broken(*args):
+            raise BrokenProcessPool('worker died')
+        with mock.patch.object(
+            parallel.ProcessPoolExecutor, 'submit', broken
+        ):
+            with self.assertRaises(BrokenProcessPool):
+                parallel.tokenize_parallel(
+                    text, workers=2, min_chunk_size=10000
+                )
+
+
+class ParallelParserTestCase(unittest.TestCase):
+    def test_same_tree_as_parser(self):
+        from benchmark import generate_source
+        from parallel import parse_parallel
+        from spi import Lexer, Parser
+        text = generate_source(20000).replace(
+            'begin { Main }',
+            'procedure Outer; procedure Inner; begin end; begin end;\n'
+            'begin { Main }'
+        )
+        tree = parse_parallel(text, workers=2, min_procedures=1)
+        self.assertEqual(
+            dump_tree(tree), dump_tree(Parser(Lexer(text)).parse())
+        )
+
+    def test_few_procedures_are_parsed_here(self):
+        from parallel import parse_parallel
+        from spi import Lexer, Parser
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertEqual(
+                    dump_tree(parse_parallel(text, workers=2)),
+                    dump_tree(Parser(Lexer(text)).parse()),
+                )
+
+    def test_error_position_is_absolute(self):
+        from benchmark import generate_source
+        from parallel import parse_parallel
+        text = generate_source(20000).replace(
+            'begin { Main }', 'procedure Bad; begin x := := 1 end;\n'
+                              'begin { Main }'
+        )
+        line = text[:text.index(':= :=')].count('\n') + 1
+        with self.assertRaisesRegex(Exception, 'line %d, column 27' % line):
+            parse_parallel(text, workers=2, min_procedures=1)
+
+
+class RelexTestCase(unittest.TestCase):
+    def assertRelexed(self, text, offset, removed, inserted):
+        from spi import tokenize_all
+        from incremental import apply_edit, relex
+        buffer, changed = relex(tokenize_all(text), offset, removed, inserted)
+        expected = tokenize_all(apply_edit(text, offset, removed, inserted))
+        self.assertEqual(buffer.types, expected.types)
+        self.assertEqual(buffer.starts, expected.starts)
+        self.assertEqual(buffer.lengths, expected.lengths)
+        return changed
+
+    def test_edits(self):
+        text = 'x := alpha + 3; { note } y:=x.'
+        for offset, removed, inserted in [
+            (0, 0, 'z'), (1, 0, '1'), (4, 1, ''), (2, 2, ''),
+            (13, 0, '.5'), (16, 0, '{'), (23, 1, '} q'),
+            (len(text), 0, ' '), (5, 5, 'beta'), (0, len(text), 'x'),
+        ]:
+            with self.subTest(offset=offset, removed=removed, inserted=inserted):
+                self.assertRelexed(text, offset, removed, inserted)
+
+    def test_changed_range_is_local(self):
+        from benchmark import generate_source
+        text = generate_source(50000)
+        offset = text.index('x10 := a')
+        first, old_stop, new_stop = self.assertRelexed(text, offset, 3, 'y10z')
+        self.assertEqual((old_stop - first, new_stop - first), (2, 2))
+
+    def test_opening_a_comment_swallows_tokens(self):
+        first, old_stop, new_stop = self.assertRelexed(
+            'a b c d {x} e', 2, 0, '{'
+        )
+        self.assertEqual(new_stop - first, 1)
+
+
+class ReparseTestCase(unittest.TestCase):
+    TEXT = (
+        'program P; var x, y : integer;\n'
+        '  procedure Q(a : integer);\n'
+        '    procedure R; begin x := 1; begin y := 2 end end;\n'
+        '  begin x := a end;\n'
+        '  procedure S; begin y := 3 end;\n'
+        'begin x := 4; begin y := x end end.'
+    )
+
+    def assertReparsed(self, text, offset, removed, inserted, replaced_kind):
+        from spi import Lexer, Parser
+        from incremental import apply_edit, reparse
+        tree = Parser(Lexer(text)).parse()
+        new_tree, replaced = reparse(tree, text, offset, removed, inserted)
+        expected = Parser(Lexer(apply_edit(text, offset, removed, inserted)))
+        self.assertEqual(dump_tree(new_tree), dump_tree(expected.parse()))
+        self.assertEqual(len(replaced), 1)
+        self.assertEqual(type(replaced[0][0]).__name__, replaced_kind)
+        return tree, new_tree, replaced
+
+    def test_innermost_unit_is_replaced(self):
+        text = self.TEXT
+        for needle, inserted, kind in [
+            ('y := 2', ' + 1', 'Compound'),
+            ('x := 1;', ' y := 0;', 'Compound'),
+            ('procedure R', '2', 'ProcedureDecl'),
+            ('Q(a', 'b', 'ProcedureDecl'),
+            ('y := 3', ' * 2', 'Compound'),
+            ('y := x', ' { note }', 'Compound'),
+            ('x := 4;', ' y := 5;', 'Compound'),
+            ('x, y', ', z', 'Program'),
+        ]:
+            with self.subTest(needle=needle):
+                offset = text.index(needle) + len(needle)
+                self.assertReparsed(text, offset, 0, inserted, kind)
+
+    def test_unaffected_subtrees_are_reused(self):
+        from spi import Lexer, Parser
+        from incremental import reparse
+        text = self.TEXT
+        tree = Parser(Lexer(text)).parse()
+        q, s = tree.block.declarations[2:]
+        r = q.block_node.declarations[0]
+        old_pos = s.pos
+        new_tree, replaced = reparse(
+            tree, text, text.index('x := a'), 6, 'x := a + 1'
+        )
+        self.assertIs(new_tree, tree)
+        self.assertEqual(tree.block.declarations[2:], [q, s])
+        self.assertIs(q.block_node.declarations[0], r)
+        self.assertIs(replaced[0][1], q.block_node.compound_statement)
+        self.assertEqual(s.pos, old_pos + 4)
+
+    def test_broken_unit_falls_back_to_enclosing_one(self):
+        from spi import Lexer, Parser
+        from incremental import apply_edit, reparse
+        text = self.TEXT
+        tree = Parser(Lexer(text)).parse()
+        r = tree.block.declarations[2].block_node.declarations[0]
+        old_compound = r.block_node.compound_statement
+        # the inner compound statement now ends early and is followed by
+        # another one, so only R's statement part parses on its own
+        offset = text.index('y := 2') + len('y := 2')
+        tree, replaced = reparse(tree, text, offset, 0, ' end; begin')
+        new_text = apply_edit(text, offset, 0, ' end; begin')
+        self.assertEqual(
+            dump_tree(tree), dump_tree(Parser(Lexer(new_text)).parse())
+        )
+        self.assertIs(replaced[0][0], old_compound)
+
+    def test_lazy_bodies_are_moved(self):
+        from spi import Lexer, Parser, LazyParser
+        from incremental import apply_edit, reparse
+        text = self.TEXT
+        offset = text.index('x := a')
+        tree = LazyParser(text).parse()
+        tree, replaced = reparse(tree, text, offset, 0, 'y := 1; ')
+        new_text = apply_edit(text, offset, 0, 'y := 1; ')
+        self.assertEqual(
+            dump_tree(tree), dump_tree(Parser(Lexer(new_text)).parse())
+        )
+
+    def test_random_edits(self):
+        import random
+        from spi import Lexer, Parser
+        from benchmark import generate_source
+        from incremental import apply_edit, reparse
+        rng = random.Random(0)
+        text = generate_source(3000)
+        tree = Parser(Lexer(text)).parse()
+        for _ in range(50):
+            offset = rng.randrange(len(text))
+            removed = rng.choice([0, 1])
+            inserted = rng.choice(['', ' ', 'x', '1', '{c}', ';', 'end'])
+            new_text = apply_edit(text, offset, removed, inserted)
+            try:
+                expected = Parser(Lexer(new_text)).parse()
+            except Exception as e:
+                with self.assertRaises(Exception) as cm:
+                    reparse(tree, text, offset, removed, inserted)
+                self.assertEqual(str(cm.exception), str(e))
+                continue
+            tree, _ = reparse(tree, text, offset, removed, inserted)
+            self.assertEqual(dump_tree(tree), dump_tree(expected))
+            text = new_text
+
+
+class ASTTestCase(unittest.TestCase):
+    def test_nodes_have_no_dict(self):
+        from spi import Lexer, Parser
+        from benchmark import iter_nodes
+        fname, text = next(sample_sources())
+        for node in iter_nodes(Parser(Lexer(text)).parse()):
+            self.assertFalse(hasattr(node, '__dict__'), type(node).__name__)
+
+    def test_operators_are_codes(self):
+        from spi import Lexer, Parser, MINUS, MUL, ASSIGN, REAL_CONST
+        tree = Parser(Lexer('program P; begin x := -2.5 * y end.')).parse()
+        assign = tree.block.compound_statement.children[0]
+        self.assertEqual(assign.op, ASSIGN)
+        self.assertEqual(assign.right.op, MUL)
+        self.assertEqual(assign.right.left.op, MINUS)
+        self.assertEqual(str(assign.right.token), "Token(MUL, '*')")
+        self.assertEqual(assign.right.left.expr.token.type, REAL_CONST)
+        self.assertEqual(assign.right.right.token.value, 'y')
+
+
+class NodeVisitorTestCase(unittest.TestCase):
+    def test_dispatch_by_class(self):
+        from spi import NodeVisitor, Num, Var, Token, INTEGER_CONST, ID
+
+        class Visitor(NodeVisitor):
+            def visit_Num(self, node):
+                return 'num'
+
+        class SubVisitor(Visitor):
+            def visit_Num(self, node):
+                return 'sub num'
+
+            def visit_Var(self, node):
+                return 'var'
+
+        num = Num(Token(INTEGER_CONST, 1))
+        var = Var(Token(ID, 'x'))
+        self.assertEqual(Visitor().visit(num), 'num')
+        self.assertEqual(SubVisitor().visit(num), 'sub num')
+        self.assertEqual(SubVisitor().visit(var), 'var')
+        with self.assertRaisesRegex(Exception, 'No visit_Var method'):
+            Visitor().visit(var)
+        self.assertIsNot(Visitor._visit_table, SubVisitor._visit_table)
+
+    def test_node_subclass_falls_back_to_base(self):
+        from spi import NodeVisitor, Num, Token, INTEGER_CONST
+
+        class Hex(Num):
+            __slots__ = ()
+
+        class Visitor(NodeVisitor):
+            def visit_Num(self, node):
+                return 'num'
+
+        class HexVisitor(Visitor):
+            def visit_Hex(self, node):
+                return 'hex'
+
+        hex_node = Hex(Token(INTEGER_CONST, 255))
+        self.assertEqual(Visitor().visit(hex_node), 'num')
+        self.assertEqual(HexVisitor().visit(hex_node), 'hex')
+        self.assertEqual(
+            HexVisitor().visit(Num(Token(INTEGER_CONST, 1))), 'num'
+        )
+
+    def test_visitors_walk_objects_and_arena_alike(self):
+        from spi import Interpreter, Parser, tokenize_all
+        from arena import ArenaParser
+        from benchmark import visitor_program
+        buffer = tokenize_all(visitor_program(20000))
+        memories = []
+        for parser_class in (Parser, ArenaParser):
+            interpreter = Interpreter(parser_class(buffer).parse())
+            interpreter.interpret()
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        self.assertEqual(memories[0], memories[1])
+        self.assertEqual(memories[0], {'x': 1, 'y': 2, 'z': 2.0})
+
+    def test_arena_views_dispatch_like_nodes(self):
+        from spi import Lexer, NodeVisitor, Parser
+        from arena import ArenaParser
+
+        class Visitor(NodeVisitor):
+            def visit_Assign(self, node):
+                return 'assign'
+
+            def visit_VarDecl(self, node):
+                return 'var_decl'
+
+            def generic_visit(self, node):
+                return 'generic'
+
+        text = (
+            'program P; procedure Q(a : integer); begin end; '
+            'var x : integer; begin x := 1 + x end.'
+        )
+        for parser_class in (Parser, ArenaParser):
+            with self.subTest(parser=parser_class.__name__):
+                tree = parser_class(Lexer(text)).parse()
+                param = tree.block.declarations[0].params[0]
+                var_decl = tree.block.declarations[1]
+                assign = tree.block.compound_statement.children[0]
+                self.assertEqual(
+                    [Visitor().visit(node) for node in
+                     (param, var_decl, assign, assign.right)],
+                    ['generic', 'var_decl', 'assign', 'generic'],
+                )
+
+
+class ClosureInterpreterTestCase(unittest.TestCase):
+    def assertSameMemory(self, tree):
+        from spi import Interpreter
+        from closures import ClosureInterpreter
+        walker = Interpreter(tree)
+        walker.interpret()
+        compiled = ClosureInterpreter(tree)
+        compiled.interpret()
+        # same names, values and order
+        self.assertEqual(
+            list(compiled.GLOBAL_MEMORY.items()),
+            list(walker.GLOBAL_MEMORY.items())
+        )
+        return compiled
+
+    def test_sample_programs(self):
+        from spi import Lexer, Parser
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameMemory(Parser(Lexer(text)).parse())
+
+    def test_other_trees(self):
+        from spi import HashConsParser, LazyParser, tokenize_all
+        from arena import ArenaParser
+        from benchmark import visitor_program
+        text = visitor_program(20000)
+        for tree in (
+            ArenaParser(tokenize_all(text)).parse(),
+            HashConsParser(tokenize_all(text)).parse(),
+            LazyParser(text).parse(),
+        ):
+            with self.subTest(tree=type(tree).__module__):
+                self.assertSameMemory(tree)
+
+    def test_operators(self):
+        from spi import Lexer, Parser
+        compiled = self.assertSameMemory(Parser(Lexer(
+            'program P; var a, b, c, d : integer; r : real;'
+            'begin'
+            '  a := 7; b := -a DIV 2; c := +a * (b - 1);'
+            '  r := a / 2; d := a - -b + 3.5; a := a + 1;;'
+            '  begin end '
+            'end.'
+        )).parse())
+        self.assertEqual(dict(compiled.GLOBAL_MEMORY), {
+            'a': 8, 'b': -4, 'c': -35, 'r': 3.5, 'd': 6.5,
+        })
+
+    def test_runs_again_from_scratch(self):
+        from spi import Lexer, Parser
+        from closures import ClosureInterpreter
+        interpreter = ClosureInterpreter(Parser(Lexer(
+            'program P; var x : integer; begin x := x + 1 end.'
+        )).parse())
+        with self.assertRaises(TypeError):
+            # x is unset, so None + 1, as in Interpreter
+            interpreter.interpret()
+        interpreter = ClosureInterpreter(Parser(Lexer(
+            'program P; var x : integer; begin x := 1; x := x + 1 end.'
+        )).parse())
+        interpreter.interpret()
+        interpreter.interpret()
+        self.assertEqual(dict(interpreter.GLOBAL_MEMORY), {'x': 2})
+
+    def test_main_engine_flag(self):
+        import contextlib
+        import io
+        import sys
+        import spi
+        fname = next(sample_sources())[0]
+        outputs = []
+        for engine in ('tree', 'closures'):
+            argv = ['spi.py', '--no-cache', '--engine', engine, fname]
+            output = io.StringIO()
+            old_argv, sys.argv = sys.argv, argv
+            try:
+                with contextlib.redirect_stdout(output):
+                    spi.main()
+            finally:
+                sys.argv = old_argv
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertIn('Run-time GLOBAL_MEMORY contents:', outputs[1])
+
+
+class PythonInterpreterTestCase(unittest.TestCase):
+    def assertSameMemory(self, tree):
+        from spi import Interpreter
+        from pybackend import PythonInterpreter
+        walker = Interpreter(tree)
+        walker.interpret()
+        compiled = PythonInterpreter(tree)
+        compiled.interpret()
+        self.assertEqual(
+            list(compiled.GLOBAL_MEMORY.items()),
+            list(walker.GLOBAL_MEMORY.items())
+        )
+        return compiled
+
+    def test_sample_programs(self):
+        from spi import Lexer, Parser
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameMemory(Parser(Lexer(text)).parse())
+
+    def test_other_trees(self):
+        from spi import HashConsParser, LazyParser, tokenize_all
+        from arena import ArenaParser
+        from benchmark import visitor_program
+        # more procedures than fit in one group
+        text = visitor_program(80000)
+        for tree in (
+            ArenaParser(tokenize_all(text)).parse(),
+            HashConsParser(tokenize_all(text)).parse(),
+            LazyParser(text).parse(),
+        ):
+            with self.subTest(tree=type(tree).__module__):
+                self.assertSameMemory(tree)
+
+    def test_operators_and_names(self):
+        from spi import Lexer, Parser
+        compiled = self.assertSameMemory(Parser(Lexer(
+            'program P; var a, b, c, d : integer; float, def : real;'
+            'begin'
+            '  a := 7; b := -a DIV 2; c := +a * (b - 1);'
+            '  float := a / 2; def := float - -b + 3; a := a + 1;;'
+            '  begin end '
+            'end.'
+        )).parse())
+        self.assertEqual(dict(compiled.GLOBAL_MEMORY), {
+            'a': 8, 'b': -4, 'c': -35, 'float': 3.5, 'def': 2.5,
+        })
+
+    def test_nested_procedures(self):
+        import ast
+        from spi import Lexer, Parser
+        from pybackend import to_python
+        module, names = to_python(Parser(Lexer(
+            'program P; var x, y : integer;'
+            'procedure A(a : integer);'
+            '   var y : integer;'
+            '   procedure B(b : integer);'
+            '   begin x := a + b; y := b DIV 2; q := 1 end;'
+            'begin y := a end;'
+            'begin x := 1; y := x end.'
+        )).parse())
+        source = ast.unparse(module)
+        self.assertIn('def p_A(v_a):', source)
+        self.assertIn('def p_B(v_b):', source)
+        self.assertIn('nonlocal v_q, v_x, v_y', source)
+        self.assertIn('v_y = v_b // 2', source)
+        self.assertEqual(names, ['x', 'y'])
+        # compiles: every nonlocal name is bound in an enclosing function
+        compile(module, '<P>', 'exec')
+
+    def test_main_engine_flag(self):
+        import contextlib
+        import io
+        import sys
+        import spi
+        fname = next(sample_sources())[0]
+        outputs = []
+        for engine in ('tree', 'python'):
+            argv = ['spi.py', '--no-cache', '--engine', engine, fname]
+            output = io.StringIO()
+            old_argv, sys.argv = sys.argv, argv
+            try:
+                with contextlib.redirect_stdout(output):
+                    spi.main()
+            finally:
+                sys.argv = old_argv
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class ArenaTestCase(unittest.TestCase):
+    def sources(self):
+        from benchmark import generate_source
+        return list(sample_sources()) + [('generated', generate_source(5000))]
+
+    def test_same_tree_as_parser(self):
+        from spi import Lexer, Parser
+        from arena import ArenaParser
+        for fname, text in self.sources():
+            with self.subTest(fname=fname):
+                self.assertEqual(
+                    dump_tree(ArenaParser(Lexer(text)).parse()),
+                    dump_tree(Parser(Lexer(text)).parse()),
+                )
+
+    def test_visitors_walk_views(self):
+        import contextlib
+        import io
+        from spi import Lexer, Parser, Interpreter, SemanticAnalyzer
+        from arena import ArenaParser
+        from src2srccompiler import SourceToSourceCompiler
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                results = []
+                for parser_class in (Parser, ArenaParser):
+                    tree = parser_class(Lexer(text)).parse()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        SemanticAnalyzer().visit(tree)
+                        try:
+                            compiled = SourceToSourceCompiler().visit(tree)
+                        except Exception as e:
+                            # it has no visit_Num, visit_UnaryOp, ...
+                            compiled = str(e)
+                    interpreter = Interpreter(tree)
+                    interpreter.interpret()
+                    results.append((compiled, interpreter.GLOBAL_MEMORY))
+                self.assertEqual(results[0], results[1])
+
+    def test_kind_counts(self):
+        from collections import Counter
+        from spi import Lexer, Parser
+        from arena import ArenaParser
+        from benchmark import iter_nodes
+        for fname, text in self.sources():
+            with self.subTest(fname=fname):
+                tree = ArenaParser(Lexer(text)).parse()
+                expected = Counter(
+                    type(node).__name__
+                    for node in iter_nodes(Parser(Lexer(text)).parse())
+                )
+                self.assertEqual(tree.arena.kind_counts(), expected)
+                self.assertEqual(len(tree.arena), sum(expected.values()))
+
+    def test_bytes_round_trip(self):
+        from spi import Lexer
+        from arena import ArenaParser, ASTArena
+        fname, text = next(sample_sources())
+        tree = ArenaParser(Lexer(text)).parse()
+        arena = ASTArena.from_bytes(tree.arena.to_bytes())
+        self.assertEqual(dump_tree(arena.tree()), dump_tree(tree))
+        self.assertEqual(arena.intern(arena.pool[0]), 0)
+
+    def test_views_compare_by_node(self):
+        from spi import Lexer
+        from arena import ArenaParser
+        tree = ArenaParser(Lexer('program P; begin x := x end.')).parse()
+        assign = tree.block.compound_statement.children[0]
+        compound = tree.block.compound_statement
+        self.assertEqual(assign.left, compound.children[0].left)
+        self.assertNotEqual(assign.left, assign.right)
+        self.assertEqual(len({assign.left, assign.left, assign.right}), 2)
+
+
+class PrattParserTestCase(unittest.TestCase):
+    EXPRESSIONS = [
+        '1', 'x', '-x', '+ - 2', '-a * b', 'a - b - c', 'a / b / c',
+        'a + b * c - d DIV e / f', '(a + b) * (c - (d))', '- (a + b) * -c',
+        '2 * ((x + 3.5) DIV -y) - +1',
+    ]
+
+    def assertSameTree(self, text):
+        from spi import Lexer, Parser, PrattParser
+        self.assertEqual(
+            dump_tree(PrattParser(Lexer(text)).parse()),
+            dump_tree(Parser(Lexer(text)).parse()),
+        )
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTree(text)
+
+    def test_expressions(self):
+        for expression in self.EXPRESSIONS:
+            with self.subTest(expression=expression):
+                self.assertSameTree(
+                    'program P; begin x := %s end.' % expression
+                )
+
+    def test_generated_program(self):
+        from benchmark import generate_source
+        self.assertSameTree(generate_source(5000))
+
+    def test_syntax_errors(self):
+        from spi import Lexer, Parser, PrattParser
+        for expression in ['1 +', '(x', 'x * * y', ')']:
+            text = 'program P; begin x := %s end.' % expression
+            with self.subTest(expression=expression):
+                with self.assertRaises(Exception) as expected:
+                    Parser(Lexer(text)).parse()
+                with self.assertRaises(Exception) as raised:
+                    PrattParser(Lexer(text)).parse()
+                self.assertEqual(
+                    str(raised.exception), str(expected.exception)
+                )
+
+
+class StackParserTestCase(unittest.TestCase):
+    DEPTH = 100000
+
+    def assertSameTree(self, text):
+        from spi import Lexer, Parser, StackParser
+        self.assertEqual(
+            dump_tree(StackParser(Lexer(text)).parse()),
+            dump_tree(Parser(Lexer(text)).parse()),
+        )
+
+    def test_sample_programs(self):
+        for fname, text in sample_sources():
+            with self.subTest(fname=fname):
+                self.assertSameTree(text)
+
+    def test_expressions(self):
+        for expression in PrattParserTestCase.EXPRESSIONS + [
+            '((x))', '-(-(x)) * y', 'x * (y) + z DIV (1 - 2) * 3',
+        ]:
+            with self.subTest(expression=expression):
+                self.assertSameTree(
+                    'program P; begin x := %s end.' % expression
+                )
+
+    def test_nested_blocks(self):
+        self.assertSameTree(
+            'program P; var a : integer;'
+            '  procedure A; var b, c : real;'
+            '    procedure B(x : integer; y, z : real);'
+            '    begin begin end; ; x := 1 end;'
+            '  begin begin begin end end end;'
+            '  var d : integer;'
+            'begin end.'
+        )
+
+    def test_syntax_errors(self):
+        from spi import Lexer, Parser, StackParser
+        for expression in ['1 +', '(x', 'x * * y', ')', '(x))', '(1 + (2)']:
+            text = 'program P; begin x := %s end.' % expression
+            with self.subTest(expression=expression):
+                with self.assertRaises(Exception) as expected:
+                    Parser(Lexer(text)).parse()
+                with self.assertRaises(Exception) as raised:
+                    StackParser(Lexer(text)).parse()
+                self.assertEqual(
+                    str(raised.exception), str(expected.exception)
+                )
+
+    def test_deep_parentheses(self):
+        from spi import StackParser, tokenize_all
+        text = 'program P; begin x := %s1%s end.' % (
+            '(y + ' * self.DEPTH, ')' * self.DEPTH
+        )
+        node = StackParser(tokenize_all(text)).parse()
+        node = node.block.compound_statement.children[0].right
+        for _ in range(self.DEPTH):
+            node = node.right
+        self.assertEqual(node.value, 1)
+
+    def test_deep_compound_statements(self):
+        from spi import StackParser, tokenize_all
+        text = 'program P; %s x := 1 %s.' % (
+            'begin ' * self.DEPTH, ' end' * self.DEPTH
+        )
+        node = StackParser(tokenize_all(text)).parse()
+        node = node.block.compound_statement
+        for _ in range(self.DEPTH - 1):
+            node = node.children[0]
+        self.assertEqual(node.children[0].left.value, 'x')
+
+    def test_deep_procedures(self):
+        from spi import StackParser, tokenize_all
+        text = 'program P; %s begin end.' % (
+            'procedure A; ' * self.DEPTH + 'begin end; ' * self.DEPTH
+        )
+        node = StackParser(tokenize_all(text)).parse().block
+        for _ in range(self.DEPTH):
+            node = node.declarations[0].block_node
+        self.assertEqual(node.declarations, [])
+
+
+class ASTFormatTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        from spi import Lexer, Parser
+        from benchmark import generate_source
+        from astformat import dumps, loads
+        sources = list(sample_sources()) + [('generated', generate_source(5000))]
+        for fname, text in sources:
+            with self.subTest(fname=fname):
+                tree = Parser(Lexer(text)).parse()
+                self.assertEqual(dump_tree(loads(dumps(tree))), dump_tree(tree))
+
+    def test_deep_tree_round_trip(self):
+        from spi import StackParser, tokenize_all
+        from astformat import dumps, loads
+        depth = 10000
+        text = 'program P; begin x := %s1%s end.' % ('(y + ' * depth, ')' * depth)
+        node = loads(dumps(StackParser(tokenize_all(text)).parse()))
+        node = node.block.compound_statement.children[0].right
+        for _ in range(depth):
+            node = node.right
+        self.assertEqual(node.value, 1)
+
+    def test_constant_pool(self):
+        from spi import (
+            Token, ID, INTEGER_CONST, REAL_CONST, MINUS, Num, Var, BinOp,
+            UnaryOp,
+        )
+        from astformat import dumps, loads
+        tree = BinOp(
+            BinOp(Var(Token(ID, 'größe'), 0), Token(MINUS, '-'),
+                  Num(Token(INTEGER_CONST, 2 ** 70))),
+            Token(MINUS, '-'),
+            UnaryOp(Token(MINUS, '-'), Num(Token(REAL_CONST, 1.0)), 5),
+            123456789,
+        )
+        node = loads(dumps(tree))
+        self.assertEqual(dump_tree(node), dump_tree(tree))
+        self.assertIs(type(node.right.expr.value), float)
+        self.assertIsNone(node.left.right.pos)
+
+    def test_file_and_mmap(self):
+        import io
+        import os
+        import tempfile
+        from spi import Lexer, Parser
+        from astformat import dump, load, load_file
+        fname, text = next(sample_sources())
+        tree = Parser(Lexer(text)).parse()
+        f = io.BytesIO()
+        dump(tree, f)
+        f.seek(0)
+        self.assertEqual(dump_tree(load(f)), dump_tree(tree))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tree.ast')
+            with open(path, 'wb') as f:
+                dump(tree, f)
+            self.assertEqual(dump_tree(load_file(path)), dump_tree(tree))
+
+    def test_smaller_than_pickle(self):
+        import pickle
+        from spi import Lexer, Parser
+        from benchmark import generate_source
+        from astformat import dumps
+        tree = Parser(Lexer(generate_source(20000))).parse()
+        self.assertLess(len(dumps(tree)), len(pickle.dumps(tree)) / 2)
+
+    def test_bad_data_is_rejected(self):
+        from spi import Lexer, Parser
+        from astformat import dumps, loads
+        fname, text = next(sample_sources())
+        data = dumps(Parser(Lexer(text)).parse())
+        for bad, message in [
+            (b'SPIAST', 'Not a serialized AST'),
+            (b'X' + data[1:], 'Not a serialized AST'),
+            (data[:6] + b'\x09' + data[7:], 'Unsupported AST format version 9'),
+            (data[:-1], 'Truncated serialized AST'),
+        ]:
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(Exception, message):
+                    loads(bad)
+
+
+class ParseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_hit_skips_parsing(self):
+        from spi import Lexer, Parser
+        from parsecache import ParseCache, cached_parse
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        key = cache.key(text)
+        tree = cached_parse(cache, key, lambda: Parser(Lexer(text)).parse())
+
+        def fail():
+            raise AssertionError('parsed again')
+        self.assertEqual(
+            dump_tree(cached_parse(cache, key, fail)), dump_tree(tree)
+        )
+        self.assertNotEqual(cache.key(text + ' '), key)
+
+    def test_file_key_matches_key(self):
+        from parsecache import ParseCache
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        with open(fname, 'rb') as f:
+            self.assertEqual(
+                cache.file_key(fname, chunk_size=7), cache.key(f.read())
+            )
+
+    def test_key_depends_on_parser(self):
+        from parsecache import ParseCache
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        self.assertNotEqual(cache.key(text, 'pratt'), cache.key(text))
+        self.assertEqual(
+            cache.file_key(fname, 'pratt'), cache.key(text, 'pratt')
+        )
+
+    def test_key_depends_on_engine_modules(self):
+        import os
+        from parsecache import ParseCache
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        modules = []
+        for name in ('old', 'new'):
+            modules.append(os.path.join(self.tmpdir.name, name + '.py'))
+            with open(modules[-1], 'w') as f:
+                f.write('%s = 1\n' % name)
+        keys = {cache.key(text, 'll1', modules=[module]) for module in modules}
+        self.assertEqual(len(keys), 2)
+        self.assertNotIn(cache.key(text, 'll1'), keys)
+
+    def test_main_keys_include_the_parser_module(self):
+        import os
+        import ll1
+        import parallel
+        from parsecache import ParseCache
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        for parser, module in (('ll1', ll1), ('parallel', parallel)):
+            self.load_tree(fname, parser)
+            key = cache.file_key(fname, parser, modules=[module.__file__])
+            self.assertTrue(os.path.exists(cache.path(key)))
+
+    def load_tree(self, fname, parser):
+        import argparse
+        from spi import load_tree
+        return load_tree(argparse.Namespace(
+            fname=fname, lexer='regex', parser=parser,
+            cache_dir=self.tmpdir.name, cache_size=64, no_cache=False,
+        ))
+
+    def test_main_caches_plain_trees_per_parser(self):
+        import os
+        fname, text = next(sample_sources())
+        for parser in ('recursive', 'stack'):
+            first = self.load_tree(fname, parser)
+            self.assertEqual(
+                dump_tree(self.load_tree(fname, parser)), dump_tree(first)
+            )
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+
+    def test_main_does_not_cache_arena_trees(self):
+        import os
+        fname = next(sample_sources())[0]
+        for run in range(2):
+            tree = self.load_tree(fname, 'arena')
+            self.assertEqual(type(tree).__module__, 'arena')
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_main_does_not_cache_hashcons_trees(self):
+        import os
+        fname = os.path.join(self.tmpdir.name, 'shared.pas')
+        with open(fname, 'w') as f:
+            f.write('program P; begin x := (1 + 2) * (1 + 2) end.')
+        for run in range(2):
+            tree = self.load_tree(fname, 'hashcons')
+            product = tree.block.compound_statement.children[0].right
+            self.assertIs(product.left, product.right)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['shared.pas'])
+
+    def test_main_does_not_cache_lazy_trees(self):
+        import os
+        from spi import LazyBlock
+        fname = os.path.join(self.tmpdir.name, 'lazy.pas')
+        with open(fname, 'w') as f:
+            # the body of Q is never needed, so its error never shows
+            f.write('program P; procedure Q; begin x := end; '
+                    'begin x := 1 end.')
+        for run in range(2):
+            tree = self.load_tree(fname, 'lazy')
+            self.assertIs(
+                type(tree.block.declarations[0]._block_node), LazyBlock
+            )
+        self.assertEqual(os.listdir(self.tmpdir.name), ['lazy.pas'])
+
+    def test_corrupt_entry_is_a_miss(self):
+        import os
+        from spi import Lexer, Parser
+        from parsecache import ParseCache
+        fname, text = next(sample_sources())
+        cache = ParseCache(self.tmpdir.name)
+        cache.put('k', Parser(Lexer(text)).parse())
+        with open(cache.path('k'), 'r+b') as f:
+            f.truncate(20)
+        self.assertIsNone(cache.get('k'))
+        self.assertFalse(os.path.exists(cache.path('k')))
+
+    def test_eviction_keeps_recent_entries(self):
+        import os
+        from spi import Lexer, Parser
+        from parsecache import ParseCache
+        from astformat import dumps
+        fname, text = next(sample_sources())
+        tree = Parser(Lexer(text)).parse()
+        size = len(dumps(tree))
+        cache = ParseCache(self.tmpdir.name, max_size=3 * size)
+        for i in range(5):
+            cache.put('k%d' % i, tree)
+            # mtimes decide the order; do not depend on timer resolution
+            os.utime(cache.path('k%d' % i), (i, i))
+        cache.get('k2')
+        cache.put('k5', tree)
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            ['k2.ast', 'k4.ast', 'k5.ast'],
+        )
+
+
+class HashConsParserTestCase(unittest.TestCase):
+    def parse(self, text):
+        from spi import Lexer, HashConsParser
+        parser = HashConsParser(Lexer(text))
+        return parser, parser.parse()
+
+    def test_same_results(self):
+        from spi import Lexer, Parser, Interpreter
+        from benchmark import generate_source
+        sources = list(sample_sources()) + [('generated', generate_source(5000))]
+        for fname, text in sources:
+            with self.subTest(fname=fname):
+                parser, tree = self.parse(text)
+                shared = Interpreter(tree)
+                shared.interpret()
+                plain = Interpreter(Parser(Lexer(text)).parse())
+                plain.interpret()
+                self.assertEqual(shared.GLOBAL_MEMORY, plain.GLOBAL_MEMORY)
+
+    def test_repeated_subexpressions_are_shared(self):
+        parser, tree = self.parse(
+            'program P; var a, b, x, y : integer;'
+            'begin x := (a + b) * 2; y := a + b; a := 2.0 + 2 end.'
+        )
+        first, second, third = tree.block.compound_statement.children
+        self.assertIs(first.right.left, second.right)
+        self.assertIsNot(first.left, second.right.left)
+        self.assertIsNot(third.right.left, third.right.right)
+        self.assertEqual(
+            (parser.expression_nodes, parser.unique_nodes), (11, 7)
+        )
+
+    def test_vars_are_not_shared_across_blocks(self):
+        parser, tree = self.parse(
+            'program P; var a, x : integer;'
+            '  procedure Q; var a : integer; begin x := a end;'
+            'begin x := a end.'
+        )
+        inner = tree.block.declarations[2].block_node.compound_statement
+        outer = tree.block.compound_statement
+        self.assertIsNot(inner.children[0].right, outer.children[0].right)
+
+
+class LazyParserTestCase(unittest.TestCase):
+    TEXT = (
+        'program P; var x : integer;\n'
+        '  procedure Q(a : integer); { begin, not END }\n'
+        '    procedure R; begin begin end; x := 1 end;\n'
+        '  begin x := a end;\n'
+        '  procedure Endless; begin x := 2 end;\n'
+        'begin x := 3 end.'
+    )
+
+    def test_bodies_are_parsed_on_first_use(self):
+        from spi import LazyParser, LazyBlock
+        tree = LazyParser(self.TEXT).parse()
+        q, endless = tree.block.declarations[1:]
+        self.assertIs(type(q._block_node), LazyBlock)
+        self.assertEqual(q.proc_name, 'Q')
+        self.assertEqual(endless.proc_name, 'Endless')
+        block = q.block_node
+        self.assertIs(q.block_node, block)
+        self.assertIs(type(q._block_node), type(block))
+        # nested procedures are lazy in turn
+        self.assertIs(type(block.declarations[0]._block_node), LazyBlock)
+        self.assertIs(type(endless._block_node), LazyBlock)
+
+    def test_same_tree_as_parser(self):
+        from spi import Lexer, Parser, LazyParser, SemanticAnalyzer
+        from benchmark import generate_source
+        sources = list(sample_sources()) + [
+            ('text', self.TEXT), ('generated', generate_source(5000))
+        ]
+        for fname, text in sources:
+            with self.subTest(fname=fname):
+                tree = LazyParser(text).parse()
+                SemanticAnalyzer().visit(tree)
+                self.assertEqual(
+                    dump_tree(tree), dump_tree(Parser(Lexer(text)).parse())
+                )
+
+    def test_error_in_body_is_raised_on_use(self):
+        from spi import LazyParser
+        text = self.TEXT.replace('x := a', 'x := := a')
+        tree = LazyParser(text).parse()
+        q = tree.block.declarations[1]
+        with self.assertRaises(Exception) as cm:
+            q.block_node
+        self.assertIn('line 4', str(cm.exception))
+
+    def test_main_rejects_what_parser_rejects(self):
+        import contextlib
+        import io
+        import os
+        import sys
+        import tempfile
+        import spi
+        sources = [
+            self.TEXT,
+            self.TEXT.replace('x := a', 'x := := a'),
+            self.TEXT.replace('x := 1', 'x := 1 +'),
+            self.TEXT.replace('x := 2', 'x := ? 2'),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'program.pas')
+            for text in sources:
+                with open(fname, 'w') as f:
+                    f.write(text)
+                results = []
+                for parser in ('recursive', 'lazy'):
+                    argv = ['spi.py', '--no-cache', '--parser', parser, fname]
+                    output = io.StringIO()
+                    old_argv, sys.argv = sys.argv, argv
+                    try:
+                        with contextlib.redirect_stdout(output):
+                            spi.main()
+                        results.append(output.getvalue())
+                    except Exception as e:
+                        results.append(str(e))
+                    finally:
+                        sys.argv = old_argv
+                with self.subTest(text=text):
+                    self.assertEqual(results[1], results[0])
+
+    def test_unbalanced_body_is_parsed_eagerly(self):
+        from spi import LazyParser
+        with self.assertRaises(Exception):
+            LazyParser(
+                'program P; procedure Q; begin begin end; begin end.'
+            ).parse()
+
+
+class LL1ParserTestCase(unittest.TestCase):
+    def test_same_tree_as_parser(self):
+        from spi import Lexer, Parser
+        from ll1 import LL1Parser
+        from benchmark import generate_source
+        sources = list(sample_sources()) + [
+            ('generated', generate_source(5000)),
+            ('params', 'program P; procedure Q(); procedure R(a, b : real;'
+                       ' c : integer); begin end; begin end; begin end.'),
+        ]
+        for fname, text in sources:
+            with self.subTest(fname=fname):
+                self.assertEqual(
+                    dump_tree(LL1Parser(Lexer(text)).parse()),
+                    dump_tree(Parser(Lexer(text)).parse()),
+                )
+
+    def test_same_errors_as_parser(self):
+        from spi import Lexer, Parser
+        from ll1 import LL1Parser
+        for text in [
+            'program P; begin x := := 1 end.',
+            'program P; begin x := 1 end',
+            'program P; var ; x : integer; begin end.',
+            'program P; begin x := (1 + 2 end.',
+            'program P; begin end. x',
+        ]:
+            with self.subTest(text=text):
+                errors = []
+                for parser_class in (Parser, LL1Parser):
+                    with self.assertRaises(Exception) as cm:
+                        parser_class(Lexer(text)).parse()
+                    errors.append(str(cm.exception))
+                self.assertEqual(errors[0], errors[1])
+
+    def test_deep_nesting(self):
+        from spi import Lexer
+        from ll1 import LL1Parser
+        depth = 10000
+        text = 'program P; begin x := %s1%s end.' % ('(' * depth, ')' * depth)
+        tree = LL1Parser(Lexer(text)).parse()
+        assign = tree.block.compound_statement.children[0]
+        self.assertEqual(type(assign.right).__name__, 'Num')
+
+    def test_conflict_is_rejected(self):
+        from ll1 import build_tables
+        with self.assertRaises(Exception) as cm:
+            build_tables('program : ID SEMI\n        | ID DOT\n')
+        self.assertIn('conflict in program on ID', str(cm.exception))
+
+    def test_tables_module_is_generated_and_reused(self):
+        import os
+        import tempfile
+        import ll1
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'll1_tables.py')
+            tables = ll1.load_tables(path)
+            self.assertTrue(os.path.exists(path))
+            ll1._tables.clear()
+            with open(path, 'a') as f:
+                f.write('REUSED = True\n')
+            self.assertTrue(ll1.load_tables(path)['REUSED'])
+            # tables of another grammar version are regenerated
+            ll1._tables.clear()
+            with open(path, 'a') as f:
+                f.write('VERSION = "old"\n')
+            self.assertNotIn('REUSED', ll1.load_tables(path))
+            self.assertEqual(
+                ll1.load_tables(path)['TABLE'], tables['TABLE']
+            )
+            ll1._tables.clear()
+
+    def test_tables_follow_token_codes(self):
+        import os
+        import tempfile
+        from unittest import mock
+        import ll1
+        import spi
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'll1_tables.py')
+            ll1.load_tables(path)
+            ll1._tables.clear()
+            with open(path, 'a') as f:
+                f.write('REUSED = True\n')
+            # renumbering a token makes the table stale
+            with mock.patch.object(spi, 'EOF', 99):
+                version = ll1.grammar_version()
+                self.assertNotIn('REUSED', ll1.load_tables(path))
+            ll1._tables.clear()
+            self.assertNotEqual(ll1.grammar_version(), version)
+
+
+class PositionTestCase(unittest.TestCase):
+    TEXT = 'program P;\nvar x : integer;\nbegin\n   x := 2 * (1 + x)\nend.'
+
+    def test_line_column(self):
+        from spi import SourceIndex
+        index = SourceIndex(self.TEXT)
+        self.assertEqual(index.line_column(0), (1, 1))
+        self.assertEqual(index.line_column(11), (2, 1))
+        self.assertEqual(index.line_column(self.TEXT.index('x :=')), (4, 4))
+
+    def test_fed_in_chunks(self):
+        from spi import SourceIndex
+        index = SourceIndex()
+        for i in range(0, len(self.TEXT), 3):
+            index.feed(self.TEXT[i:i + 3])
+        self.assertEqual(
+            list(index.line_starts), list(SourceIndex(self.TEXT).line_starts)
+        )
+
+    def test_token_start_matches_across_lexers(self):
+        import io
+        from spi import Lexer, RegexLexer, StreamLexer, tokenize_all, EOF
+        fname, text = next(sample_sources())
+        expected = list(tokenize_all(text).starts)
+        for lexer in (
+            Lexer(text),
+            RegexLexer(text),
+            StreamLexer(io.StringIO(text), chunk_size=5),
+            tokenize_all(text).cursor(),
+        ):
+            with self.subTest(lexer=type(lexer).__name__):
+                starts = []
+                while True:
+                    token = lexer.get_next_token()
+                    starts.append(lexer.token_start)
+                    if token.type == EOF:
+                        break
+                self.assertEqual(starts, expected)
+
+    def test_node_positions(self):
+        from spi import Lexer, Parser, SourceIndex
+        tree = Parser(Lexer(self.TEXT)).parse()
+        index = SourceIndex(self.TEXT)
+        assign = tree.block.compound_statement.children[0]
+        self.assertEqual(index.line_column(tree.pos), (1, 1))
+        self.assertEqual(index.line_column(assign.pos), (4, 4))
+        self.assertEqual(index.line_column(assign.left.pos), (4, 4))
+        self.assertEqual(index.line_column(assign.right.pos), (4, 9))
+        self.assertEqual(index.line_column(assign.right.right.pos), (4, 14))
+        self.assertEqual(
+            index.line_column(assign.right.right.right.pos), (4, 18)
+        )
+
+    def test_plain_token_node_positions(self):
+        from spi import (
+            Lexer, Parser, PrattParser, StackParser, Token, tokenize_all
+        )
+        from arena import ArenaParser
+        from ll1 import LL1Parser
+
+        class PlainTokenLexer(object):
+            # tokens with no offsets of their own, like a lexer written
+            # before SpanToken
+            def __init__(self, text):
+                self.cursor = tokenize_all(text).cursor()
+                self.token_start = 0
+
+            def get_next_token(self):
+                token = self.cursor.get_next_token()
+                self.token_start = self.cursor.token_start
+                return Token(token.type, token.value)
+
+        expected = dump_tree(Parser(Lexer(self.TEXT)).parse())
+        for parser_class in (
+            Parser, PrattParser, StackParser, ArenaParser, LL1Parser
+        ):
+            with self.subTest(parser=parser_class.__name__):
+                tree = parser_class(PlainTokenLexer(self.TEXT)).parse()
+                self.assertEqual(dump_tree(tree), expected)
+
+    def test_stream_node_positions(self):
+        import io
+        from spi import Lexer, Parser, StreamLexer
+        expected = Parser(Lexer(self.TEXT)).parse()
+        tree = Parser(StreamLexer(io.StringIO(self.TEXT), chunk_size=4)).parse()
+        self.assertEqual(
+            tree.block.compound_statement.children[0].right.right.right.pos,
+            expected.block.compound_statement.children[0].right.right.right.pos,
+        )
+
+    def test_syntax_error_reports_position(self):
+        from spi import Lexer, Parser
+        parser = Parser(Lexer('program P;\nbegin\n   x := 1 +\nend.'))
+        with self.assertRaisesRegex(Exception, 'line 4, column 1'):
+            parser.parse()
+
+    def test_lexer_error_reports_position(self):
+        from spi import Lexer, RegexLexer
+        for lexer in (Lexer('x :=\n  ?'), RegexLexer('x :=\n  ?')):
+            with self.assertRaisesRegex(Exception, 'line 2, column 3'):
+                token_stream(lexer)
+
+
+if __name__ == '__main__':
+    unittest.main()